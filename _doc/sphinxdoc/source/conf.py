@@ -13,3 +13,16 @@ set_sphinx_variables(__file__, "pymmails", "Xavier Dupré", 2023,
 
 blog_root = "http://www.xavierdupre.fr/app/pymmails/helpsphinx/"
 html_logo = "_static/project_ico.png"
+
+epkg_dictionary.update({
+    'asyncio': 'https://docs.python.org/3/library/asyncio.html',
+    'CONDSTORE': 'https://tools.ietf.org/html/rfc7162',
+    'dateutil': 'https://dateutil.readthedocs.io/',
+    'gzip': 'https://docs.python.org/3/library/gzip.html',
+    'imaplib': 'https://docs.python.org/3/library/imaplib.html',
+    'Maildir': 'https://en.wikipedia.org/wiki/Maildir',
+    'mbox': 'https://en.wikipedia.org/wiki/Mbox',
+    'POP3': 'https://tools.ietf.org/html/rfc1939',
+    'QRESYNC': 'https://tools.ietf.org/html/rfc7162',
+    'sqlite3': 'https://docs.python.org/3/library/sqlite3.html',
+})
@@ -0,0 +1,37 @@
+"""
+@brief      helpers shared by the unit tests
+"""
+
+
+def make_mock_mail(i, sender="sender{0} <sender{0}@example.com>",
+                   to="receiver <receiver@example.com>", subject="mail {0}",
+                   date="Sat, 1 Aug 2015 10:{1:02d}:00 +0200", message_id=True,
+                   headers=None, body="body of mail {0}\r\n", eol="\r\n"):
+    """
+    Builds a small mail to fill *ImapServerMock* or *PopServerMock*.
+
+    @param      i           number of the mail, ``{0}`` is replaced by *i*
+                            in *sender*, *to*, *subject* and *body*,
+                            ``{1}`` by ``i % 60`` in *date*
+    @param      sender      field ``From``
+    @param      to          field ``To``, None to skip it
+    @param      subject     field ``Subject``
+    @param      date        field ``Date``, None to skip it
+    @param      message_id  adds field ``Message-ID`` (``<id{0}@example.com>``)
+    @param      headers     additional fields, list of tuple ``(name, value)``
+    @param      body        body
+    @param      eol         end of line used for the header
+    @return                 string
+    """
+    fields = [("From", sender.format(i))]
+    if to is not None:
+        fields.append(("To", to.format(i)))
+    fields.append(("Subject", subject.format(i)))
+    if date is not None:
+        fields.append(("Date", date.format(i, i % 60)))
+    if message_id:
+        fields.append(("Message-ID", "<id{0}@example.com>".format(i)))
+    if headers:
+        fields.extend(headers)
+    return "".join("{0}: {1}{2}".format(k, v, eol) for k, v in fields) + \
+        eol + body.format(i)
@@ -5,6 +5,7 @@
 import os
 import unittest
 from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import get_temp_folder
 from pymmails import EmailMessage, MailBoxMock, EmailMessageRenderer
 
 
@@ -49,6 +50,111 @@ class TestMessageBoxMock(unittest.TestCase):
             raise AssertionError(html)
         fLOG(html)
 
+    def test_box_mock_processes(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        data = os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+
+        box = MailBoxMock(data, b"unittestunittest", fLOG)
+        expected = [m["Subject"] for m in box.enumerate_mails_in_folder("trav")]
+        self.assertEqual(len(expected), 4)
+        mails = list(box.enumerate_mails_in_folder(
+            "trav", processes=2, max_in_flight=3))
+        self.assertIsInstance(mails[0], EmailMessage)
+        self.assertEqual([m["Subject"] for m in mails], expected)
+        mails = list(box.enumerate_mails_in_folder(
+            "trav", processes=2, ordered=False, max_in_flight=2,
+            skip_function=lambda m: m["Subject"] == expected[0]))
+        self.assertEqual(sorted(m["Subject"] for m in mails),
+                         sorted(expected[1:]))
+
+    def test_box_mock_skip_header(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_box_mock_skip_header")
+        os.makedirs(os.path.join(temp, "inbox"))
+        for i in range(4):
+            with open(os.path.join(temp, "inbox", "mail%d.eml" % i), "wb") as f:
+                f.write(("From: a@b.c\r\nSubject: mail {0}\r\n\r\n"
+                         "body {0}\r\n").format(i).encode("ascii"))
+
+        seen = []
+
+        def skip(mail):
+            seen.append(mail.get_payload())
+            return mail["Subject"] != "mail 2"
+
+        box = MailBoxMock(temp, None, fLOG)
+        mails = list(box.enumerate_mails_in_folder("inbox", skip_function=skip))
+        self.assertEqual(len(mails), 1)
+        self.assertEqual(mails[0].get_payload(), "body 2\r\n")
+        self.assertEqual(seen, [""] * 4)
+
+        del seen[:]
+        mails = list(box.enumerate_mails_in_folder(
+            "inbox", skip_function=skip, skip_header=False))
+        self.assertEqual(len(mails), 1)
+        self.assertEqual(sorted(seen), ["body {0}\r\n".format(i) for i in range(4)])
+
+        data = os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+        box = MailBoxMock(data, b"unittestunittest", fLOG)
+        expected = list(box.enumerate_mails_in_folder("trav"))
+        subject = expected[1]["Subject"]
+        mails = list(box.enumerate_mails_in_folder(
+            "trav", skip_function=lambda m: m["Subject"] != subject))
+        self.assertEqual(len(mails), 1)
+        self.assertEqual(mails[0].as_bytes(), expected[1].as_bytes())
+
+    def test_box_mock_skip_header_all_paths(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_box_mock_skip_header_all_paths")
+        os.makedirs(os.path.join(temp, "mails", "inbox"))
+        for i in range(4):
+            with open(os.path.join(temp, "mails", "inbox", "mail%d.eml" % i), "wb") as f:
+                f.write(("From: a@b.c\r\nSubject: mail {0}\r\n"
+                         "Date: Sat, 1 Aug 2015 10:00:00 +0200\r\n\r\n"
+                         "body {0}\r\n").format(i).encode("ascii"))
+        seen = []
+
+        def skip(mail):
+            # the function reads the body
+            seen.append(mail.get_payload())
+            return mail.get_payload() == "body 1\r\n"
+
+        root = os.path.join(temp, "mails")
+        boxes = [MailBoxMock(root, None, fLOG),
+                 MailBoxMock(root, None, fLOG, index=os.path.join(temp, "index.db3"))]
+        paths = [
+            lambda box, sh: box.enumerate_mails_in_folder(
+                "inbox", skip_function=skip, skip_header=sh),
+            lambda box, sh: box.enumerate_mails_in_folder(
+                "inbox", skip_function=skip, skip_header=sh, processes=2),
+            lambda box, sh: box.enumerate_search_subject(
+                "mail", "inbox", skip_function=skip, skip_header=sh),
+            lambda box, sh: box.enumerate_search_person(
+                "a@b.c", "inbox", skip_function=skip, skip_header=sh)]
+        for box in boxes:
+            for path in paths:
+                del seen[:]
+                mails = list(path(box, True))
+                self.assertEqual(len(mails), 4)
+                self.assertEqual(seen, [""] * 4)
+                self.assertEqual(sorted(m.get_payload() for m in mails),
+                                 ["body {0}\r\n".format(i) for i in range(4)])
+                del seen[:]
+                mails = list(path(box, False))
+                self.assertEqual(len(mails), 3)
+                self.assertEqual(sorted(seen),
+                                 ["body {0}\r\n".format(i) for i in range(4)])
+        boxes[1].index.close()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import os
+import mailbox
+import unittest
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase, get_temp_folder
+from pymmails import (
+    MailBoxMock, MailBoxMaildir, MailBoxMbox, MboxIndex, MailException,
+    EmailMessageRenderer, EmailMessageListRenderer)
+from _helpers import make_mock_mail
+
+
+def make_mail(i, sender="sender{0}@example.com"):
+    return make_mock_mail(i, sender=sender, to="receiver@example.com",
+                          date="Sat, %d Aug 2015 10:00:00 +0200" % (i + 1),
+                          message_id=False, eol="\n",
+                          body="first line\nFrom the second line\nlast line {0}\n")
+
+
+def make_mbox(mails):
+    res = []
+    for m in mails:
+        body = m.replace("\nFrom ", "\n>From ")
+        res.append("From MAILER-DAEMON Sat Aug  1 10:00:00 2015\n" +
+                   body + "\n")
+    return "".join(res).encode("utf-8")
+
+
+class TestMailBoxMockFiles(ExtTestCase):
+
+    def test_maildir(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_maildir")
+        root = mailbox.Maildir(os.path.join(temp, "Maildir"))
+        for i in range(3):
+            root.add(make_mail(i))
+        sent = root.add_folder("Sent")
+        sent.add(make_mail(10))
+
+        box = MailBoxMaildir(os.path.join(temp, "Maildir"), fLOG=fLOG)
+        box.login()
+        self.assertEqual(box.folders(), ["INBOX", "Sent"])
+        mails = list(box.enumerate_mails_in_folder("INBOX"))
+        self.assertEqual(len(mails), 3)
+        self.assertEqual(set(m["Subject"] for m in mails),
+                         {"mail 0", "mail 1", "mail 2"})
+        mails = list(box.enumerate_search_person("sender10@example.com", "Sent"))
+        self.assertEqual([m["Subject"] for m in mails], ["mail 10"])
+        mails = list(box.enumerate_mails_in_folder(
+            "INBOX", skip_function=lambda m: m["Subject"] != "mail 1"))
+        self.assertEqual([m["Subject"] for m in mails], ["mail 1"])
+        # skip_function only sees the header unless skip_header is False
+        mails = list(box.enumerate_mails_in_folder(
+            "INBOX", skip_function=lambda m: "last line 1" in m.get_payload()))
+        self.assertEqual(len(mails), 3)
+        mails = list(box.enumerate_mails_in_folder(
+            "INBOX", skip_function=lambda m: "last line 1" in m.get_payload(),
+            skip_header=False))
+        self.assertEqual([m["Subject"] for m in mails], ["mail 0", "mail 2"])
+        self.assertRaise(lambda: list(box.enumerate_mails_in_folder("Trash")),
+                         MailException)
+        box.logout()
+
+    def test_mbox(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_mbox")
+        os.makedirs(os.path.join(temp, "mails", "Archives.sbd"))
+        inbox = os.path.join(temp, "mails", "Inbox")
+        with open(inbox, "wb") as f:
+            f.write(make_mbox([make_mail(i) for i in range(4)]))
+        with open(os.path.join(temp, "mails", "Inbox.msf"), "wb") as f:
+            f.write(b"// summary file")
+        with open(os.path.join(temp, "mails", "Archives.sbd", "2015.mbox"), "wb") as f:
+            f.write(make_mbox([make_mail(20), make_mail(21)]))
+
+        box = MailBoxMbox(os.path.join(temp, "mails"), fLOG=fLOG)
+        self.assertEqual(box.folders(), ["Archives/2015", "Inbox"])
+        mails = list(box.enumerate_mails_in_folder("Inbox"))
+        self.assertEqual([m["Subject"] for m in mails],
+                         ["mail {0}".format(i) for i in range(4)])
+        self.assertEqual(mails[2].get_payload(),
+                         "first line\nFrom the second line\nlast line 2\n")
+        mails = list(box.enumerate_mails_in_folder(
+            "Inbox", skip_function=lambda m: "last line 2" in m.get_payload()))
+        self.assertEqual(len(mails), 4)
+        mails = list(box.enumerate_mails_in_folder(
+            "Inbox", skip_function=lambda m: "last line 2" in m.get_payload(),
+            skip_header=False))
+        self.assertEqual([m["Subject"] for m in mails], ["mail 0", "mail 1", "mail 3"])
+        self.assertExists(inbox + ".idx")
+        self.assertEqual(box.count("Archives/2015"), 2)
+        self.assertEqual(box.read_mail("Archives/2015", 1)["Subject"], "mail 21")
+        self.assertRaise(lambda: box.read_mail("Inbox", 4), IndexError)
+        self.assertRaise(lambda: box.count("Trash"), MailException)
+
+        # the index is loaded, new mails are appended to it
+        index = MboxIndex(inbox, inbox + ".idx")
+        self.assertEqual(len(index), 4)
+        ends = list(index.ends)
+        with open(inbox, "ab") as f:
+            f.write(make_mbox([make_mail(4)]))
+        self.assertEqual(len(index.update()), 5)
+        self.assertEqual(list(index.ends)[:4], ends)
+        box = MailBoxMbox(os.path.join(temp, "mails"), fLOG=fLOG)
+        self.assertEqual(box.read_mail("Inbox", 4)["Subject"], "mail 4")
+
+        # the file is modified, the index is built again
+        with open(inbox, "wb") as f:
+            f.write(make_mbox([make_mail(7, "other@example.com")]))
+        mails = list(box.enumerate_mails_in_folder("Inbox"))
+        self.assertEqual([m["Subject"] for m in mails], ["mail 7"])
+
+    def test_mbox_render(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_mbox_render")
+        data = os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+        mock = MailBoxMock(data, b"unittestunittest", fLOG)
+        mails = [m.as_bytes() for m in mock.enumerate_mails_in_folder("trav")]
+        name = os.path.join(temp, "export.mbox")
+        with open(name, "wb") as f:
+            for m in mails:
+                f.write(b"From - Sat Aug  1 10:00:00 2015\n" + m + b"\n")
+
+        index = os.path.join(temp, "index")
+        box = MailBoxMbox(name, index_folder=index, fLOG=fLOG)
+        self.assertEqual(box.folders(), ["INBOX"])
+        self.assertEqual(box.count("INBOX"), len(mails))
+        self.assertEqual(len(os.listdir(index)), 1)
+        render = EmailMessageListRenderer(title="list of mails",
+                                          email_renderer=EmailMessageRenderer(),
+                                          fLOG=fLOG)
+        res = render.write(iter=box.enumerate_mails_in_folder("INBOX"),
+                           location=temp, filename="index.html",
+                           overwrite=True)
+        render.flush()
+        with open(res[0], "r", encoding="utf8") as f:
+            content = f.read()
+        self.assertIn("Voyages-sncf.com</a>", content)
+        self.assertGreater(len(render.BufferWrite.listfiles()), len(mails) + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import os
+import time
+import unittest
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase, get_temp_folder
+from pymmails import MailBoxMock, MailBoxMockIndex, MailException
+from _helpers import make_mock_mail
+
+
+def make_mail(i, sender, to, subject, day):
+    return make_mock_mail(i, sender=sender, to=to, subject=subject,
+                          date="Sat, %d Aug 2015 10:00:00 +0200" % day,
+                          body="body {0}\r\n").encode("ascii")
+
+
+mails = [("alice@example.com", "bob@example.com", "lunch", 1),
+         ("bob@example.com", "alice@example.com", "Re: lunch", 2),
+         ("carol@example.com", "bob@example.com, dave@example.com, eve@example.com",
+          "party", 3),
+         ("dave@example.com", "eve@example.com", "report", 4),
+         ("Eve <eve@example.com>", "Alice <alice@example.com>", "Report", 5)]
+
+
+class TestMailBoxMockIndex(ExtTestCase):
+
+    def write_mails(self, temp):
+        for folder in ["inbox", "sent"]:
+            os.makedirs(os.path.join(temp, "mails", folder))
+        for i, m in enumerate(mails):
+            with open(os.path.join(temp, "mails", "inbox", "mail%d.eml" % i), "wb") as f:
+                f.write(make_mail(i, *m))
+        return os.path.join(temp, "mails")
+
+    def test_box_mock_search(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_box_mock_search")
+        root = self.write_mails(temp)
+        for index in [None, os.path.join(temp, "index.db3")]:
+            box = MailBoxMock(root, None, fLOG, index=index)
+            self.assertEqual(sorted(box.folders()), ["inbox", "sent"])
+
+            res = box.enumerate_search_person("bob@example.com", "inbox")
+            self.assertEqual(sorted(m["Subject"] for m in res),
+                             ["Re: lunch", "lunch", "party"])
+            res = box.enumerate_search_person("bob@example.com", "inbox", max_dest=2)
+            self.assertEqual(sorted(m["Subject"] for m in res),
+                             ["Re: lunch", "lunch"])
+            res = box.enumerate_search_person(["alice", "dave"], "inbox",
+                                              date="3-Aug-2015")
+            self.assertEqual(sorted(m["Subject"] for m in res),
+                             ["Report", "party", "report"])
+            res = box.enumerate_search_subject("REPORT", ["inbox", "sent"])
+            self.assertEqual(sorted(m["Subject"] for m in res),
+                             ["Report", "report"])
+            res = box.enumerate_search_subject(
+                "lunch", "inbox", skip_function=lambda m: m["From"] != "bob@example.com")
+            self.assertEqual([m["Subject"] for m in res], ["Re: lunch"])
+            if index is not None:
+                self.assertEqual(len(box.index), len(mails))
+                box.index.close()
+            else:
+                self.assertRaise(box.update_index, MailException)
+
+    def test_box_mock_index_update(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_box_mock_index_update")
+        root = self.write_mails(temp)
+        index = MailBoxMockIndex(os.path.join(temp, "index.db3"))
+        box = MailBoxMock(root, None, fLOG, index=index)
+        self.assertEqual(box.update_index(), len(mails))
+        self.assertEqual(box.update_index(), 0)
+        self.assertEqual(box.update_index(full=True), len(mails))
+
+        # a new file, a modified file and a removed file
+        time.sleep(0.02)
+        with open(os.path.join(root, "sent", "new.eml"), "wb") as f:
+            f.write(make_mail(10, "bob@example.com", "zoe@example.com", "new", 6))
+        os.remove(os.path.join(root, "inbox", "mail0.eml"))
+        with open(os.path.join(root, "inbox", "mail1.eml"), "wb") as f:
+            f.write(make_mail(1, "bob@example.com", "zoe@example.com", "changed", 2))
+        self.assertEqual(box.update_index(), 2)
+        self.assertEqual(len(index), len(mails))
+        res = box.enumerate_search_person("zoe@example.com", ["inbox", "sent"])
+        self.assertEqual([m["Subject"] for m in res], ["changed", "new"])
+
+        # the index is persisted
+        index.close()
+        box = MailBoxMock(root, None, fLOG, index=os.path.join(temp, "index.db3"))
+        self.assertEqual(box.folders(), ["inbox", "sent"])
+        self.assertEqual(box.update_index(), 0)
+        self.assertEqual(box.index.search("inbox", subject="party"), ["mail2.eml"])
+        box.index.close()
+
+    def test_box_mock_index_in_place(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_box_mock_index_in_place")
+        root = self.write_mails(temp)
+        box = MailBoxMock(root, None, fLOG,
+                          index=os.path.join(temp, "index.db3"))
+        self.assertEqual(box.folders(), ["inbox", "sent"])
+        mtime = os.stat(os.path.join(root, "inbox")).st_mtime
+
+        # a file rewritten in place does not change the folder
+        name = os.path.join(root, "inbox", "mail0.eml")
+        with open(name, "r+b") as f:
+            f.write(make_mail(0, "alice@example.com", "bob@example.com", "gamma", 1))
+        st = os.stat(name)
+        os.utime(name, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertEqual(os.stat(os.path.join(root, "inbox")).st_mtime, mtime)
+        # searches are answered by the index until it is updated
+        res = box.enumerate_search_subject("gamma", "inbox")
+        self.assertEqual(list(res), [])
+        self.assertEqual(box.update_index(), 1)
+        res = box.enumerate_search_subject("gamma", "inbox")
+        self.assertEqual([m["Subject"] for m in res], ["gamma"])
+        res = box.enumerate_search_subject("lunch", "inbox")
+        self.assertEqual([m["Subject"] for m in res], ["Re: lunch"])
+
+        # a folder created after the index was built
+        os.makedirs(os.path.join(root, "archive"))
+        self.assertEqual(box.folders(), ["inbox", "sent"])
+        self.assertEqual(box.update_index(), 0)
+        self.assertEqual(box.folders(), ["archive", "inbox", "sent"])
+        box.index.close()
+
+    def test_box_mock_folders(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_box_mock_folders")
+        root = self.write_mails(temp)
+        os.makedirs(os.path.join(root, "inbox", "sub"))
+        with open(os.path.join(root, "inbox", "sub", "mail.eml"), "wb") as f:
+            f.write(make_mail(10, "bob@example.com", "zoe@example.com", "sub", 6))
+        plain = MailBoxMock(root, None, fLOG)
+        indexed = MailBoxMock(root, None, fLOG,
+                              index=os.path.join(temp, "index.db3"))
+        self.assertEqual(plain.folders(), ["inbox", "inbox/sub", "sent"])
+        self.assertEqual(indexed.folders(), plain.folders())
+        for box in [plain, indexed]:
+            res = box.enumerate_search_person("zoe@example.com", box.folders())
+            self.assertEqual([m["Subject"] for m in res], ["sub"])
+            res = box.enumerate_mails_in_folder("inbox/sub")
+            self.assertEqual([m["Subject"] for m in res], ["sub"])
+        indexed.index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
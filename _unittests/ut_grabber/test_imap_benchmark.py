@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=2s)
+"""
+import time
+import unittest
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase, get_temp_folder
+from pymmails import MailBoxImap
+from pymmails.grabber.imap_benchmark import (
+    benchmark_imap, create_eml_directory)
+from pymmails.grabber.imap_server_mock import ImapServerMock
+
+
+class TestImapBenchmark(ExtTestCase):
+
+    def test_from_directory(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_from_directory")
+        files = create_eml_directory(
+            temp, {"INBOX": 5, "sent": 3, "sent/old": 2}, size=200)
+        self.assertEqual(len(files), 10)
+        with ImapServerMock.from_directory(temp) as server:
+            box = MailBoxImap("user", "pwd", server.host,
+                              port=server.port, fLOG=fLOG)
+            box.login()
+            self.assertEqual(set(box.folders()), {"INBOX", "sent", "sent/old"})
+            mails = list(box.enumerate_mails_in_folder("sent/old"))
+            box.logout()
+        self.assertEqual(len(mails), 2)
+        self.assertEqual(mails[0]["Subject"], "mail 0 in sent/old")
+        self.assertRaise(lambda: ImapServerMock.from_directory(
+            temp + "_missing"), FileNotFoundError)
+
+    def test_latency_bandwidth(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        big = b"From: a@b.c\r\nSubject: big\r\n\r\n" + b"x" * 20000
+        with ImapServerMock({"INBOX": [big]}, latency=0.05) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            begin = time.perf_counter()
+            for _ in range(4):
+                box.M.noop()
+            self.assertGreater(time.perf_counter() - begin, 0.2)
+            box.logout()
+        with ImapServerMock({"INBOX": [big]}, bandwidth=100000) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            sent = server.bytes_sent
+            begin = time.perf_counter()
+            mails = list(box.enumerate_mails_in_folder("INBOX"))
+            self.assertGreater(time.perf_counter() - begin, 0.2)
+            self.assertGreater(server.bytes_sent - sent, 20000)
+            box.logout()
+        self.assertEqual(len(mails), 1)
+
+    def test_benchmark_imap(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_benchmark_imap")
+        create_eml_directory(temp, {"INBOX": 30, "sent": 5},
+                             size=500, nb_persons=4)
+        with ImapServerMock.from_directory(temp) as server:
+            res = benchmark_imap(server, batch_sizes=(1, 10), repeat=2,
+                                 fLOG=fLOG)
+        self.assertEqual([(r["test"], r["batch_size"]) for r in res],
+                         [("folders", None),
+                          ("enumerate_mails_in_folder", 1),
+                          ("enumerate_mails_in_folder", 10),
+                          ("enumerate_search_person", 1),
+                          ("enumerate_search_person", 10)])
+        self.assertEqual(res[0]["messages"], 2)
+        self.assertEqual(res[1]["messages"], 30)
+        self.assertEqual(res[2]["messages"], 30)
+        self.assertGreater(res[3]["messages"], 0)
+        self.assertEqual(res[3]["messages"], res[4]["messages"])
+        for r in res:
+            self.assertGreater(r["bytes"], 0)
+            self.assertGreater(r["messages_per_sec"], 0)
+            self.assertGreater(r["bytes_per_sec"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import os
+import tracemalloc
+import unittest
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase, get_temp_folder
+from pyquickhelper.filehelper.encryption import decrypt_stream
+from pymmails import (
+    EmailMessage, MailBoxMock, read_encrypted_mail, write_encrypted_mail)
+from pymmails.grabber.mail_encryption import enumerate_decrypted_chunks
+
+
+class TestMailEncryption(ExtTestCase):
+
+    key = b"unittestunittest"
+
+    def test_read_encrypted_mail(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        data = os.path.join(os.path.dirname(__file__), "data", "trav")
+        for name in os.listdir(data):
+            full = os.path.join(data, name)
+            exp = decrypt_stream(self.key, full)
+            for chunk_size in [16, 48, 2 ** 16]:
+                got = b"".join(enumerate_decrypted_chunks(
+                    self.key, full, chunk_size=chunk_size))
+                self.assertEqual(got, exp)
+            mail = read_encrypted_mail(self.key, full, chunk_size=64)
+            self.assertIsInstance(mail, EmailMessage)
+            self.assertEqual(mail.as_bytes(),
+                             EmailMessage.create_from_bytes(exp).as_bytes())
+        self.assertRaise(lambda: read_encrypted_mail(self.key, full, chunk_size=10),
+                         ValueError)
+
+    def test_write_encrypted_mail(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_write_encrypted_mail")
+        os.makedirs(os.path.join(temp, "archive", "inbox"))
+        mail = MIMEMultipart()
+        mail["From"] = "a@b.c"
+        mail["Subject"] = "big attachment"
+        mail.attach(MIMEText("body"))
+        att = MIMEApplication(os.urandom(2 ** 21), Name="data.bin")
+        att.add_header("Content-Disposition", "attachment", filename="data.bin")
+        mail.attach(att)
+        name = os.path.join(temp, "archive", "inbox", "mail.enc")
+        for chunk_size in [32, 2 ** 16]:
+            size = write_encrypted_mail(self.key, mail, name, chunk_size=chunk_size)
+            exp = EmailMessage.as_bytes(mail)
+            self.assertEqual(size, len(exp))
+            self.assertEqual(decrypt_stream(self.key, name), exp)
+
+        # decrypted chunks are not kept in memory
+        tracemalloc.start()
+        nb = sum(len(c) for c in enumerate_decrypted_chunks(self.key, name))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertEqual(nb, len(exp))
+        self.assertLess(peak, 2 ** 20)
+
+        box = MailBoxMock(os.path.join(temp, "archive"), self.key, fLOG)
+        mails = list(box.enumerate_mails_in_folder(
+            "inbox", skip_function=lambda m: m["Subject"] != "big attachment"))
+        self.assertEqual(len(mails), 1)
+        atts = list(mails[0].enumerate_attachments())
+        self.assertEqual(len(atts), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import asyncio
+import unittest
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import AsyncMailBoxImap, MailBoxImap
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from _helpers import make_mock_mail as make_mail
+
+
+class TestMailBoxAsync(ExtTestCase):
+
+    def test_mailbox_async(self):
+        folders = {"INBOX": [make_mail(i, subject="INBOX {0}") for i in range(11)],
+                   "Other": [make_mail(i, subject="Other {0}") for i in range(4)]}
+
+        async def fetch(server, **kwargs):
+            box = AsyncMailBoxImap("user", "pwd", server.host,
+                                   port=server.port)
+            await box.login()
+            names = await box.folders()
+            mails = [m async for m in box.enumerate_mails_in_folder(
+                names, **kwargs)]
+            await box.logout()
+            return names, mails
+
+        async def main(server):
+            return await asyncio.gather(
+                fetch(server, batch_size=3, pipeline=3),
+                fetch(server, batch_size=2, body=False),
+                fetch(server, batch_size=4, fields=["Subject"],
+                      skip_function=lambda m: m["Subject"].endswith("1")))
+
+        with ImapServerMock(folders, user="user", password="pwd") as server:
+            res = asyncio.run(main(server))
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            expected = list(box.enumerate_mails_in_folder(["INBOX", "Other"]))
+            box.logout()
+
+        names, mails = res[0]
+        self.assertEqual(names, ["INBOX", "Other"])
+        self.assertEqual([m["Subject"] for m in mails],
+                         [m["Subject"] for m in expected])
+        self.assertEqual([m.as_bytes() for m in mails],
+                         [m.as_bytes() for m in expected])
+        self.assertEqual(len(res[1][1]), 15)
+        self.assertEqual(res[1][1][0].get_payload(), "")
+        skipped = [m["Subject"] for m in res[2][1]]
+        self.assertEqual(len(skipped), 13)
+        self.assertNotIn("INBOX 1", skipped)
+        self.assertIn("INBOX 2", skipped)
+
+    def test_mailbox_async_large_search(self):
+        # the answer to UID SEARCH is longer than 64 Kb
+        folders = {"INBOX": ["Subject: {0}\r\n\r\nbody\r\n".format(i)
+                             for i in range(15000)]}
+
+        async def fetch(server):
+            box = AsyncMailBoxImap("user", "pwd", server.host,
+                                   port=server.port)
+            await box.login()
+            whole = [m async for m in box.enumerate_mails_in_folder(
+                "INBOX", body=False, fields=["Subject"], batch_size=5000,
+                search_window=20000)]
+            windows = [m async for m in box.enumerate_mails_in_folder(
+                "INBOX", body=False, fields=["Subject"], batch_size=5000)]
+            # the consumer stops before the end
+            gen = box.enumerate_mails_in_folder("INBOX", batch_size=2, pipeline=3)
+            first = [await gen.__anext__() for i in range(3)]
+            await gen.aclose()
+            names = await box.folders()
+            await box.logout()
+            return whole, windows, first, names
+
+        with ImapServerMock(folders, user="user", password="pwd") as server:
+            whole, windows, first, names = asyncio.run(fetch(server))
+            commands = list(server.commands)
+
+        self.assertEqual(len(whole), 15000)
+        self.assertEqual([m["Subject"] for m in windows],
+                         [m["Subject"] for m in whole])
+        self.assertEqual([m["Subject"] for m in first], ["0", "1", "2"])
+        self.assertEqual(names, ["INBOX"])
+        self.assertEqual(commands.count("UID SEARCH"), 4)
+        self.assertEqual(commands.count("CLOSE"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import os
+import unittest
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import MailBoxImap, MailBoxMock, EmailMessage
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from pymmails.grabber.imap_helper import (
+    format_uid_set, parse_fetch_response, parse_imap_list)
+from _helpers import make_mock_mail as make_mail
+
+
+class TestMailBoxBatch(ExtTestCase):
+
+    def test_imap_helper(self):
+        self.assertEqual(format_uid_set([5, 1, 2, 3, 8, 9]), "1:3,5,8:9")
+        self.assertEqual(parse_imap_list(b'INBOX (UIDNEXT 5 UIDVALIDITY 3)'),
+                         ['INBOX', ['UIDNEXT', '5', 'UIDVALIDITY', '3']])
+        data = [(b'1 (UID 5 BODY[HEADER.FIELDS (FROM)] {4}', b'abcd'),
+                (b' FLAGS (\\Seen) RFC822 {3}', b'xyz'), b')',
+                b'2 (UID 7 RFC822.SIZE 10)']
+        res = parse_fetch_response(data)
+        self.assertEqual(res, [(1, {'UID': '5', 'BODY[HEADER.FIELDS (FROM)]': b'abcd',
+                                    'FLAGS': ['\\Seen'], 'RFC822': b'xyz'}),
+                               (2, {'UID': '7', 'RFC822.SIZE': '10'})])
+
+    def test_mailbox_batch(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        mails = [make_mail(i) for i in range(23)]
+        with ImapServerMock({"INBOX": mails}, user="user", password="pwd") as server:
+            box = MailBoxImap("user", "pwd", server.host,
+                              port=server.port, fLOG=fLOG)
+            box.login()
+            self.assertEqual(box.folders(), ["INBOX"])
+            one = list(box.enumerate_mails_in_folder("INBOX"))
+            nb1 = server.commands.count("UID FETCH")
+            batch = list(box.enumerate_mails_in_folder("INBOX", batch_size=10))
+            nb2 = server.commands.count("UID FETCH") - nb1
+            box.logout()
+
+        self.assertEqual(len(one), 23)
+        self.assertEqual(nb1, 23)
+        self.assertEqual(nb2, 3)
+        self.assertEqual([m["Subject"] for m in one],
+                         [m["Subject"] for m in batch])
+        self.assertEqual(batch[5]["Subject"], "mail 5")
+        self.assertIn("body of mail 5", batch[5].get_payload())
+
+    def test_mailbox_batch_skip(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        mails = [make_mail(i) for i in range(10)]
+        with ImapServerMock({"INBOX": mails}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            res = list(box.enumerate_mails_in_folder(
+                "INBOX", batch_size=4,
+                skip_function=lambda m: m["Subject"] in ("mail 1", "mail 6")))
+            heads = list(box.enumerate_mails_in_folder(
+                "INBOX", batch_size=4, body=False, pattern='SUBJECT "mail 3"'))
+            box.logout()
+
+        self.assertEqual(len(res), 8)
+        self.assertNotIn("mail 6", [m["Subject"] for m in res])
+        self.assertEqual(len(heads), 1)
+        self.assertEqual(heads[0]["Subject"], "mail 3")
+        self.assertEqual(heads[0].get_payload(), "")
+
+    def test_mailbox_batch_real_mails(self):
+        data = os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+        mock = MailBoxMock(data, b"unittestunittest")
+        raws = [m.as_bytes() for m in mock.enumerate_mails_in_folder("trav")]
+        with ImapServerMock({"trav": raws}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            mails = list(box.enumerate_mails_in_folder("trav", batch_size=3))
+            box.logout()
+        self.assertEqual(len(mails), len(raws))
+        for mail, raw in zip(mails, raws):
+            # the server stores mails with \r\n as line separator
+            expected = EmailMessage.create_from_bytes(
+                raw.replace(b"\n", b"\r\n"))
+            self.assertEqual(mail.UniqueID, expected.UniqueID)
+            self.assertEqual(mail.get_nb_attachements(),
+                             expected.get_nb_attachements())
+
+
+if __name__ == "__main__":
+    unittest.main()
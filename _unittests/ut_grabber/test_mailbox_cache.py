@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import os
+import unittest
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase, get_temp_folder
+from pymmails import MailBoxImap, MailCache
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from _helpers import make_mock_mail
+
+
+def make_mail(i):
+    return make_mock_mail(
+        i, date=None, body="body of mail {0}\r\n" + "x" * 1000 * i + "\r\n")
+
+
+class TestMailBoxCache(ExtTestCase):
+
+    def test_mail_cache_eviction(self):
+        temp = get_temp_folder(__file__, "temp_mail_cache_eviction")
+        cache = MailCache(temp, max_size=400, compresslevel=1)
+        raws = [make_mail(i).encode("ascii") for i in range(5)]
+        for i, raw in enumerate(raws):
+            cache.add("server", "INBOX", 1, i + 1, raw)
+            self.assertEqual(cache.get("server", "INBOX", 1, 1), raws[0])
+        # the same content is stored once
+        cache.add("server", "other", 1, 10, raws[0])
+        self.assertLesser(cache.size, 400)
+        self.assertEqual(cache.get("server", "INBOX", 1, 1), raws[0])
+        self.assertEqual(cache.get("server", "INBOX", 2, 1), None)
+        self.assertEqual(cache.get_by_message_id("<id0@example.com>"), raws[0])
+        self.assertEqual(cache.get("server", "INBOX", 1, 2), None)
+        self.assertEqual(cache.get("server", "INBOX", 1, 5), raws[4])
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+        cache.close()
+
+    def test_mail_cache_commit(self):
+        temp = get_temp_folder(__file__, "temp_mail_cache_commit")
+        cache = MailCache(temp, max_size=10 ** 6, commit_every=1000)
+        raws = [make_mail(i).encode("ascii") for i in range(20)]
+        for i, raw in enumerate(raws):
+            cache.add("server", "INBOX", 1, i + 1, raw)
+        for i in range(20):
+            self.assertEqual(cache.get("server", "INBOX", 1, i + 1), raws[i])
+        self.assertEqual(cache.get("server", "INBOX", 1, 1), raws[0])
+        size = cache.size
+        on_disk = sum(os.path.getsize(os.path.join(root, name))
+                      for root, _, files in os.walk(temp)
+                      for name in files if name.endswith(".gz"))
+        self.assertEqual(size, on_disk)
+        cache.close()
+
+        # nothing was lost, the last access times were saved
+        cache = MailCache(temp, max_size=size - 1)
+        self.assertEqual(len(cache), 20)
+        self.assertEqual(cache.size, size)
+        cache.add("server", "INBOX", 1, 21, make_mail(21).encode("ascii"))
+        self.assertLesser(cache.size, size - 1)
+        self.assertEqual(cache.get("server", "INBOX", 1, 1), raws[0])
+        self.assertEqual(cache.get("server", "INBOX", 1, 2), None)
+        cache.close()
+
+    def test_mailbox_cache(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_mailbox_cache")
+        cache = MailCache(temp)
+        mails = [make_mail(i) for i in range(6)]
+        with ImapServerMock({"INBOX": mails, "copy": mails[:3]}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port,
+                              fLOG=fLOG, cache=cache)
+            box.login()
+            first = list(box.enumerate_mails_in_folder("INBOX", batch_size=4))
+            nb = server.commands.count("UID FETCH")
+            second = list(box.enumerate_mails_in_folder("INBOX", batch_size=4))
+            nb_second = server.commands.count("UID FETCH") - nb
+            nb = server.commands.count("UID FETCH")
+            # only the headers are retrieved, bodies come from the Message-ID
+            third = list(box.enumerate_mails_in_folder(
+                "copy", batch_size=4, skip_function=lambda m: False))
+            nb_third = server.commands.count("UID FETCH") - nb
+            box.logout()
+        self.assertEqual(len(cache), 9)
+        cache.close()
+
+        self.assertEqual(nb_second, 0)
+        self.assertEqual(nb_third, 1)
+        self.assertEqual([m.as_bytes() for m in first],
+                         [m.as_bytes() for m in second])
+        self.assertEqual([m.as_bytes() for m in first[:3]],
+                         [m.as_bytes() for m in third])
+
+
+if __name__ == "__main__":
+    unittest.main()
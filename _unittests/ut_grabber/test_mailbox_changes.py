@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import unittest
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import MailBoxImap, ImapSyncState, MailException
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from _helpers import make_mock_mail as make_mail
+
+
+class TestMailBoxChanges(ExtTestCase):
+
+    def _check_changes(self, capabilities):
+        mails = [make_mail(i) for i in range(6)]
+        with ImapServerMock({"INBOX": mails}, capabilities=capabilities) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            state = ImapSyncState()
+
+            first = list(box.enumerate_changes("INBOX", state))
+            self.assertEqual([c.uid for c in first], [1, 2, 3, 4, 5, 6])
+            self.assertFalse(any(c.vanished for c in first))
+
+            self.assertEqual(list(box.enumerate_changes("INBOX", state)), [])
+
+            server.store("INBOX", 2, ["\\Seen", "\\Flagged"])
+            server.expunge("INBOX", [4, 5])
+            server.append("INBOX", make_mail(7), flags=["\\Draft"])
+            changes = list(box.enumerate_changes("INBOX", state))
+            self.assertEqual([(c.uid, c.vanished) for c in changes],
+                             [(4, True), (5, True), (2, False), (7, False)])
+            self.assertEqual(set(changes[2].flags), {"\\Seen", "\\Flagged"})
+            self.assertEqual(changes[3].flags, ("\\Draft",))
+
+            self.assertEqual(list(box.enumerate_changes("INBOX", state)), [])
+            box.logout()
+        return server
+
+    def test_changes_qresync(self):
+        server = self._check_changes(
+            ["IMAP4rev1", "ENABLE", "CONDSTORE", "QRESYNC"])
+        self.assertIn("ENABLE", server.commands)
+
+    def test_changes_condstore(self):
+        self._check_changes(["IMAP4rev1", "CONDSTORE"])
+
+    def test_changes_not_supported(self):
+        with ImapServerMock({"INBOX": [make_mail(0)]}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            self.assertRaise(
+                lambda: list(box.enumerate_changes("INBOX", ImapSyncState())),
+                MailException)
+            box.logout()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import time
+import threading
+import unittest
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import MailBoxImap
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from _helpers import make_mock_mail as make_mail
+
+
+class TestMailBoxCompress(ExtTestCase):
+
+    def test_mailbox_compress(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        mails = [make_mail(i, body="body of mail {0}\r\n" * 200)
+                 for i in range(10)]
+        caps = ImapServerMock.default_capabilities + ("COMPRESS=DEFLATE",)
+        with ImapServerMock({"INBOX": mails}, capabilities=caps) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            self.assertEqual(box.compression_stats(), None)
+            raw = list(box.enumerate_mails_in_folder("INBOX", batch_size=4))
+            box.logout()
+
+            box = MailBoxImap("user", "pwd", server.host, port=server.port,
+                              fLOG=fLOG, compress=True)
+            box.login()
+            comp = list(box.enumerate_mails_in_folder("INBOX", batch_size=4))
+            stats = box.compression_stats()
+            box.logout()
+            self.assertIn("COMPRESS", server.commands)
+
+        self.assertEqual([m.as_bytes() for m in raw],
+                         [m.as_bytes() for m in comp])
+        self.assertGreater(stats["payload_received"], 10 * 3000)
+        self.assertLesser(stats["wire_received"] * 5, stats["payload_received"])
+        self.assertGreater(stats["payload_sent"], stats["wire_sent"] // 2)
+
+    def test_mailbox_compress_unsupported(self):
+        with ImapServerMock({"INBOX": [make_mail(0)]}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port,
+                              compress=True)
+            box.login()
+            mails = list(box.enumerate_mails_in_folder("INBOX"))
+            stats = box.compression_stats()
+            box.logout()
+            self.assertNotIn("COMPRESS", server.commands)
+        self.assertEqual(len(mails), 1)
+        self.assertEqual(stats, None)
+
+    def test_mailbox_compress_idle(self):
+        caps = ImapServerMock.default_capabilities + ("COMPRESS=DEFLATE", "IDLE")
+        with ImapServerMock({"INBOX": [make_mail(0)]}, capabilities=caps) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port,
+                              compress=True)
+            box.login()
+
+            def deliver():
+                time.sleep(0.2)
+                server.append("INBOX", make_mail(1))
+
+            th = threading.Thread(target=deliver)
+            th.start()
+            received = []
+            box.watch("INBOX", lambda m: received.append(m["Subject"]) or False,
+                      timeout=5)
+            th.join()
+            box.logout()
+        self.assertEqual(received, ["mail 1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
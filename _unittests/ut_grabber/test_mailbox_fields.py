@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import unittest
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import MailBoxImap
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from _helpers import make_mock_mail
+
+
+headers = [("Received", "from somewhere by something"),
+           ("X-Mailer", "long header " + "x" * 500)]
+
+
+class TestMailBoxFields(ExtTestCase):
+
+    def test_mailbox_fields(self):
+        mails = [make_mock_mail(i, headers=headers) for i in range(12)]
+        with ImapServerMock({"INBOX": mails}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            heads = list(box.enumerate_mails_in_folder(
+                "INBOX", body=False, batch_size=5,
+                fields=MailBoxImap.summary_fields))
+            nb = server.commands.count("UID FETCH")
+            kept = list(box.enumerate_mails_in_folder(
+                "INBOX", batch_size=5, fields=["Subject"],
+                skip_function=lambda m: m["Subject"] != "mail 4"))
+            box.logout()
+
+        self.assertEqual(nb, 3)
+        self.assertEqual(len(heads), 12)
+        self.assertEqual(heads[3]["Subject"], "mail 3")
+        self.assertEqual(heads[3].get_from(),
+                         ("sender3", "sender3@example.com"))
+        self.assertEqual(heads[3].get_date().minute, 3)
+        self.assertEqual(heads[3]["X-Mailer"], None)
+        self.assertEqual(set(heads[3].keys()),
+                         set(MailBoxImap.summary_fields))
+        self.assertEqual(len(kept), 1)
+        self.assertEqual(kept[0]["Subject"], "mail 4")
+        self.assertIn("long header", kept[0]["X-Mailer"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import os
+import email
+import unittest
+from email.mime.application import MIMEApplication
+from email.mime.message import MIMEMessage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import MailBoxImap, MailBoxMock, LazyEmailMessage
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from _helpers import make_mock_mail
+
+
+def make_mail(i):
+    mail = MIMEMultipart()
+    mail["From"] = "sender{0}@example.com".format(i)
+    mail["To"] = "receiver@example.com"
+    mail["Subject"] = "mail {0}".format(i)
+    alt = MIMEMultipart("alternative")
+    alt.attach(MIMEText("text of mail {0}".format(i), "plain"))
+    alt.attach(MIMEText("<b>html of mail {0}</b>".format(i), "html"))
+    mail.attach(alt)
+    pdf = MIMEApplication(b"%PDF-1.4 " + bytes(range(256)) * 40, "pdf")
+    pdf.add_header("Content-Disposition", "attachment",
+                   filename="doc{0}.pdf".format(i))
+    mail.attach(pdf)
+    data = MIMEApplication(b"0123456789" * 1000, "octet-stream")
+    data.add_header("Content-Disposition", "attachment",
+                    filename=("utf-8", "", "données{0}.bin".format(i)))
+    mail.attach(data)
+    return mail.as_bytes()
+
+
+def make_forward(i):
+    mail = MIMEMultipart()
+    mail["From"] = "receiver@example.com"
+    mail["Subject"] = "Fwd: mail {0}".format(i)
+    mail.attach(MIMEText("see below", "plain"))
+    # a plain mail and a mail with an attachment
+    mail.attach(MIMEMessage(email.message_from_bytes(
+        make_mock_mail(i).encode("ascii") if i % 2 == 0 else make_mail(i))))
+    return mail.as_bytes()
+
+
+class TestMailBoxLazy(ExtTestCase):
+
+    def test_mailbox_lazy(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        mails = [make_mail(i) for i in range(3)]
+        with ImapServerMock({"INBOX": mails}) as server:
+            box = MailBoxImap("user", "pwd", server.host,
+                              port=server.port, fLOG=fLOG)
+            box.login()
+            full = list(box.enumerate_mails_in_folder("INBOX", batch_size=3))
+            nb = server.commands.count("UID FETCH")
+            lazy = list(box.enumerate_mails_in_folder(
+                "INBOX", batch_size=3, lazy=True))
+            nb_lazy = server.commands.count("UID FETCH") - nb
+            self.assertIsInstance(lazy[0], LazyEmailMessage)
+            self.assertEqual(lazy[0]["Subject"], "mail 0")
+            self.assertEqual(lazy[0].get_nb_attachements(), 2)
+            parts = [p for p in lazy[0].walk() if not p.is_multipart()]
+            self.assertEqual([p.section for p in parts], ["1.1", "1.2", "2", "3"])
+            self.assertEqual([p.get_content_type() for p in parts],
+                             ["text/plain", "text/html", "application/pdf",
+                              "application/octet-stream"])
+            self.assertFalse(any(p.is_loaded for p in parts))
+            self.assertGreater(parts[2].size, 10000)
+            nb = server.commands.count("UID FETCH")
+            # only the pdf is retrieved
+            pdfs = list(lazy[1].enumerate_attachments(
+                skip_function=lambda p: p.get_content_type() != "application/pdf"))
+            nb_pdf = server.commands.count("UID FETCH") - nb
+            self.assertEqual(pdfs[0][0], "doc1.pdf")
+            # the folder is selected again
+            for mail, expected in zip(lazy, full):
+                self.assertEqual(list(mail.enumerate_attachments()),
+                                 list(expected.enumerate_attachments()))
+                self.assertEqual(mail.body_html, expected.body_html)
+            box.logout()
+
+        self.assertEqual(nb_lazy, 1)
+        self.assertEqual(nb_pdf, 1)
+        self.assertEqual(pdfs, [a for a in full[1].enumerate_attachments()
+                                if a[0].endswith(".pdf")])
+        self.assertEqual(full[0].get_filename(), None)
+        self.assertEqual(list(full[2].enumerate_attachments())[1][0],
+                         "données2.bin")
+
+    def test_mailbox_lazy_single_part(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        # no Content-Type
+        mails = [make_mock_mail(i) for i in range(2)]
+        with ImapServerMock({"INBOX": mails}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            lazy = list(box.enumerate_mails_in_folder("INBOX", lazy=True))
+            self.assertEqual([m.get_content_type() for m in lazy],
+                             ["text/plain", "text/plain"])
+            self.assertFalse(lazy[1].is_loaded)
+            self.assertEqual(lazy[1].get_payload(), "body of mail 1\r\n")
+            self.assertEqual(lazy[1].section, "TEXT")
+            box.logout()
+
+    def test_mailbox_lazy_forward(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        mails = [make_forward(i) for i in range(2)]
+        with ImapServerMock({"INBOX": mails}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            full = list(box.enumerate_mails_in_folder("INBOX"))
+            lazy = list(box.enumerate_mails_in_folder("INBOX", lazy=True))
+            self.assertEqual(len(lazy), 2)
+            for i, (mail, expected) in enumerate(zip(lazy, full)):
+                self.assertEqual(mail.get_payload(1).get_content_type(),
+                                 "message/rfc822")
+                self.assertEqual([p.get_content_type() for p in mail.walk()],
+                                 [p.get_content_type() for p in expected.walk()])
+                inner = mail.get_payload(1).get_payload()
+                self.assertEqual(len(inner), 1)
+                self.assertEqual(inner[0]["Subject"], "mail {0}".format(i))
+                self.assertEqual(inner[0].get_from(), expected.get_payload(1).get_payload(0).get_from())
+                parts = [p for p in inner[0].walk() if not p.is_multipart()]
+                self.assertFalse(any(p.is_loaded for p in parts))
+                self.assertEqual(
+                    [p.get_payload() for p in parts],
+                    [p.get_payload() for p in expected.get_payload(1).get_payload(0).walk()
+                     if not p.is_multipart()])
+                self.assertEqual(list(mail.enumerate_attachments()),
+                                 list(expected.enumerate_attachments()))
+            self.assertEqual(parts[0].section, "2.1.1")
+            box.logout()
+
+    def test_mailbox_lazy_real_mails(self):
+        data = os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+        mock = MailBoxMock(data, b"unittestunittest")
+        raws = [m.as_bytes() for m in mock.enumerate_mails_in_folder("trav")]
+        with ImapServerMock({"trav": raws}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            full = list(box.enumerate_mails_in_folder("trav", batch_size=3))
+            lazy = list(box.enumerate_mails_in_folder(
+                "trav", batch_size=3, lazy=True))
+            for mail, expected in zip(lazy, full):
+                self.assertEqual(mail.get_nb_attachements(),
+                                 expected.get_nb_attachements())
+                self.assertEqual(list(mail.enumerate_attachments()),
+                                 list(expected.enumerate_attachments()))
+            box.logout()
+        self.assertEqual(len(lazy), len(raws))
+
+
+if __name__ == "__main__":
+    unittest.main()
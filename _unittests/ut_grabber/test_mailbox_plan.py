@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import unittest
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import MailBoxImap, FetchPlan, MailException
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from pymmails.grabber.imap_helper import parse_internaldate
+from _helpers import make_mock_mail
+
+
+def make_mail(i, size, day):
+    return make_mock_mail(i, to=None, date="%d Aug 2015 10:00:00 +0200" % day,
+                          message_id=False, body="x" * size + "\r\n")
+
+
+class TestMailBoxPlan(ExtTestCase):
+
+    def test_parse_internaldate(self):
+        d = parse_internaldate(" 7-Jul-1996 02:44:25 -0700")
+        self.assertEqual((d.year, d.month, d.day, d.hour), (1996, 7, 7, 2))
+        self.assertEqual(d.utcoffset().total_seconds(), -7 * 3600)
+
+    def test_mailbox_plan(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        mails = [make_mail(0, 100, 5), make_mail(1, 5000, 1),
+                 make_mail(2, 300, 9), make_mail(3, 20000, 3),
+                 make_mail(4, 200, 2)]
+        with ImapServerMock({"INBOX": mails}) as server:
+            box = MailBoxImap("user", "pwd", server.host,
+                              port=server.port, fLOG=fLOG)
+            box.login()
+            nb = server.commands.count("UID FETCH")
+            plan = box.plan_fetch("INBOX", order="newest")
+            self.assertEqual(server.commands.count("UID FETCH") - nb, 1)
+            self.assertEqual([m.uid for m in plan], [3, 1, 4, 5, 2])
+            self.assertEqual([m.uid for m in plan.sort("smallest")],
+                             [1, 5, 3, 2, 4])
+            sizes = [m.size for m in plan]
+            self.assertEqual(plan.total_size, sum(sizes))
+            self.assertEqual(plan.transfer_size(max_size=1000), sum(sizes[:3]))
+            self.assertEqual(plan.transfer_size(max_size=1000, policy="stream"),
+                             sum(sizes))
+
+            skip = list(box.enumerate_planned_mails(plan, max_size=1000,
+                                                    batch_size=5))
+            self.assertEqual([m["Subject"] for m in skip],
+                             ["mail 0", "mail 4", "mail 2"])
+            head = list(box.enumerate_planned_mails(plan, max_size=1000,
+                                                    policy="header"))
+            self.assertEqual([m["Subject"] for m in head],
+                             ["mail 0", "mail 4", "mail 2", "mail 1", "mail 3"])
+            self.assertEqual(head[-1].get_payload(), "")
+            self.assertIn("xxxx", head[0].get_payload())
+            nb = server.commands.count("UID FETCH")
+            stream = list(box.enumerate_planned_mails(plan, max_size=1000,
+                                                      policy="stream"))
+            # 3 small mails, 6 chunks for mail 1, 21 chunks for mail 3
+            self.assertEqual(server.commands.count("UID FETCH") - nb, 3 + 6 + 21)
+            self.assertEqual(stream[-1].get_payload(), "x" * 20000 + "\r\n")
+            wrong = FetchPlan("INBOX", -1, list(plan))
+            self.assertRaise(lambda: list(box.enumerate_planned_mails(wrong)),
+                             MailException)
+            box.logout()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import unittest
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import MailBoxImapPool, MailException
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from _helpers import make_mock_mail as make_mail
+
+
+class TestMailBoxPool(ExtTestCase):
+
+    def test_mailbox_pool(self):
+        folders = {"F%d" % i: [make_mail(j, subject="F%d {0}" % i) for j in range(i + 3)]
+                   for i in range(7)}
+        with ImapServerMock(folders) as server:
+            pool = MailBoxImapPool("user", "pwd", server.host,
+                                   port=server.port, size=3)
+            pool.login()
+            self.assertEqual(server.commands.count("LOGIN"), 3)
+            names = pool.folders()
+            self.assertEqual(len(names), 7)
+            mails = list(pool.enumerate_mails_in_folder(
+                names, batch_size=2, queue_size=4))
+
+            # the caller stops early
+            for _ in pool.enumerate_mails_in_folder(names, queue_size=1):
+                break
+            # the pool can still be used
+            again = list(pool.enumerate_mails_in_folder("F2"))
+
+            self.assertRaise(
+                lambda: list(pool.enumerate_mails_in_folder(["F1", "nofolder"])),
+                MailException)
+            pool.logout()
+
+        subjects = set(m["Subject"] for m in mails)
+        expected = set("F%d %d" % (i, j) for i in range(7) for j in range(i + 3))
+        self.assertEqual(subjects, expected)
+        self.assertEqual(len(mails), len(expected))
+        self.assertEqual(len(again), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
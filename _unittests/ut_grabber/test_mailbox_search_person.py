@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import unittest
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import MailBoxImap
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from _helpers import make_mock_mail
+
+
+def make_mail(sender, receivers, i):
+    return make_mock_mail(i, sender=sender, to=", ".join(receivers))
+
+
+class TestMailBoxSearchPerson(ExtTestCase):
+
+    def test_or_tree(self):
+        self.assertEqual(MailBoxImap._or_tree(["A"]), "A")  # pylint: disable=W0212
+        self.assertEqual(MailBoxImap._or_tree(  # pylint: disable=W0212
+            ["A", "B", "C"]), "OR A OR B C")
+        self.assertRaise(lambda: MailBoxImap._or_tree([]),  # pylint: disable=W0212
+                         ValueError)
+
+    def test_search_person(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        many = ["r{0}@example.com".format(i) for i in range(8)]
+        mails = [
+            make_mail("alice@example.com", ["bob@example.com"], 0),
+            make_mail("bob@example.com", ["alice@example.com"], 1),
+            make_mail("bob@example.com", ["alice@example.com"] + many, 2),
+            make_mail("alice@example.com", ["carol@example.com"] + many, 3),
+            make_mail("carol@example.com", ["alice@example.com"], 4),
+            make_mail("dave@example.com", ["eve@example.com"], 5),
+        ]
+        with ImapServerMock({"INBOX": mails}) as server:
+            box = MailBoxImap("user", "pwd", server.host,
+                              port=server.port, fLOG=fLOG)
+            box.login()
+            before = server.commands.count("UID SEARCH")
+            one = list(box.enumerate_search_person(
+                "alice", "INBOX", batch_size=4))
+            nb = server.commands.count("UID SEARCH") - before
+            both = list(box.enumerate_search_person(
+                ["alice", "carol"], "INBOX", max_dest=0))
+            skip = list(box.enumerate_search_person(
+                "alice", "INBOX", skip_function=lambda m: m["Subject"] == "mail 0"))
+            box.logout()
+
+        self.assertEqual(nb, 1)
+        # mail 2 has too many receivers, mail 3 is sent by alice
+        self.assertEqual([m["Subject"] for m in one],
+                         ["mail 0", "mail 1", "mail 3", "mail 4"])
+        self.assertIn("body of mail 1", one[1].get_payload())
+        # mail 3 and 4 match both persons but are returned once
+        self.assertEqual([m["Subject"] for m in both],
+                         ["mail 0", "mail 1", "mail 2", "mail 3", "mail 4"])
+        self.assertEqual([m["Subject"] for m in skip],
+                         ["mail 1", "mail 3", "mail 4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
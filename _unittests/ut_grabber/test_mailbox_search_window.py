@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import imaplib
+import unittest
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import MailBoxImap
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from _helpers import make_mock_mail as make_mail
+
+
+class TestMailBoxSearchWindow(ExtTestCase):
+
+    def setUp(self):
+        self._maxline = imaplib._MAXLINE  # pylint: disable=W0212
+
+    def tearDown(self):
+        imaplib._MAXLINE = self._maxline  # pylint: disable=W0212
+
+    def test_search_window(self):
+        mails = [make_mail(i) for i in range(100)]
+        with ImapServerMock({"INBOX": mails}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            # the search response for all mails is longer than that
+            imaplib._MAXLINE = 120  # pylint: disable=W0212
+            res = list(box.enumerate_mails_in_folder(
+                "INBOX", batch_size=10, search_window=20))
+            self.assertEqual(len(res), 100)
+            self.assertEqual([m["Subject"] for m in res],
+                             ["mail %d" % i for i in range(100)])
+
+            # windows still too big are split again
+            res = list(box.enumerate_mails_in_folder(
+                "INBOX", batch_size=50, search_window=60, body=False,
+                pattern='FROM "sender"'))
+            self.assertEqual(len(res), 100)
+
+            # the connection is still usable
+            imaplib._MAXLINE = self._maxline  # pylint: disable=W0212
+            self.assertEqual(box.folders(), ["INBOX"])
+            box.logout()
+        self.assertGreater(server.commands.count("STATUS"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
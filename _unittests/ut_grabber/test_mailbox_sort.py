@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import itertools
+import unittest
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase, get_temp_folder
+from pymmails import (
+    MailBoxImap, MailException,
+    EmailMessageRenderer, EmailMessageListRenderer)
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from pymmails.grabber.imap_helper import parse_thread
+from _helpers import make_mock_mail
+
+
+def make_mail(i, day, subject, reply=None, size=10):
+    ref = "<id{0}@example.com>".format(reply)
+    headers = None if reply is None else [("In-Reply-To", ref), ("References", ref)]
+    return make_mock_mail(i, to=None, subject=subject, headers=headers,
+                          date="%d Aug 2015 10:00:00 +0200" % day,
+                          body="x" * size + "\r\n")
+
+
+mails = [make_mail(0, 3, "first", size=500),
+         make_mail(1, 7, "second", size=100),
+         make_mail(2, 4, "Re: first", reply=0, size=300),
+         make_mail(3, 9, "Re: second", reply=1, size=50),
+         make_mail(4, 5, "Re: first", reply=2, size=400),
+         make_mail(5, 6, "Re: first", reply=0, size=200),
+         make_mail(6, 1, "alone", size=10)]
+
+
+class TestMailBoxSort(ExtTestCase):
+
+    def test_parse_thread(self):
+        self.assertEqual(parse_thread(b"(3 6 (4 23)(44 7 96))(2)"),
+                         [[(3, [(6, [(4, [(23, [])]), (44, [(7, [(96, [])])])])])],
+                          [(2, [])]])
+
+    def test_mailbox_sort(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        caps = ImapServerMock.default_capabilities + ("SORT",)
+        for cap in [caps, ImapServerMock.default_capabilities]:
+            with ImapServerMock({"INBOX": mails}, capabilities=cap) as server:
+                box = MailBoxImap("user", "pwd", server.host,
+                                  port=server.port, fLOG=fLOG)
+                box.login()
+                nb = server.commands.count("UID FETCH")
+                last = list(itertools.islice(box.enumerate_mails_in_folder(
+                    "INBOX", sort="REVERSE DATE", batch_size=3), 3))
+                nb = server.commands.count("UID FETCH") - nb
+                size = list(box.enumerate_mails_in_folder(
+                    "INBOX", sort="SIZE", body=False, pattern='SUBJECT "first"'))
+                # non ascii characters are handled as they are by a search
+                accent = list(box.enumerate_mails_in_folder(
+                    "INBOX", sort="SIZE", body=False, pattern='SUBJECT "first\u00e9"'))
+                search = list(box.enumerate_mails_in_folder(
+                    "INBOX", body=False, pattern='SUBJECT "first\u00e9"'))
+                if "SORT" in cap:
+                    subject = list(box.enumerate_mails_in_folder(
+                        "INBOX", sort="SUBJECT REVERSE DATE", body=False))
+                else:
+                    self.assertRaise(
+                        lambda: list(box.enumerate_mails_in_folder(  # pylint: disable=W0640
+                            "INBOX", sort="SUBJECT")), MailException)
+                box.logout()
+                commands = list(server.commands)
+
+            self.assertEqual([m["Message-ID"] for m in last],
+                             ["<id3@example.com>", "<id1@example.com>",
+                              "<id5@example.com>"])
+            self.assertEqual([m["Message-ID"] for m in size],
+                             ["<id5@example.com>", "<id2@example.com>",
+                              "<id4@example.com>", "<id0@example.com>"])
+            self.assertEqual([m["Message-ID"] for m in accent],
+                             [m["Message-ID"] for m in size])
+            self.assertEqual(sorted(m["Message-ID"] for m in search),
+                             sorted(m["Message-ID"] for m in size))
+            if "SORT" in cap:
+                self.assertEqual(nb, 1)
+                self.assertIn("UID SORT", commands)
+                self.assertEqual([m["Message-ID"] for m in subject],
+                                 ["<id6@example.com>", "<id5@example.com>",
+                                  "<id4@example.com>", "<id2@example.com>",
+                                  "<id0@example.com>", "<id3@example.com>",
+                                  "<id1@example.com>"])
+            else:
+                self.assertNotIn("UID SORT", commands)
+
+    def test_mailbox_threads(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        caps = ImapServerMock.default_capabilities + (
+            "THREAD=REFERENCES", "THREAD=ORDEREDSUBJECT")
+        with ImapServerMock({"INBOX": mails}, capabilities=caps) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            threads = list(box.enumerate_threads("INBOX", body=False,
+                                                 batch_size=4))
+            ordered = list(box.enumerate_threads(
+                "INBOX", algorithm="ORDEREDSUBJECT", body=False))
+            box.logout()
+        with ImapServerMock({"INBOX": mails}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            self.assertRaise(lambda: list(box.enumerate_threads("INBOX")),
+                             MailException)
+            box.logout()
+
+        self.assertEqual([[(d, m["Message-ID"]) for d, m in t] for t in threads],
+                         [[(0, "<id6@example.com>")],
+                          [(0, "<id0@example.com>"), (1, "<id2@example.com>"),
+                           (2, "<id4@example.com>"), (1, "<id5@example.com>")],
+                          [(0, "<id1@example.com>"), (1, "<id3@example.com>")]])
+        self.assertEqual([[(d, m["Message-ID"]) for d, m in t] for t in ordered],
+                         [[(0, "<id6@example.com>")],
+                          [(0, "<id0@example.com>"), (1, "<id2@example.com>"),
+                           (1, "<id4@example.com>"), (1, "<id5@example.com>")],
+                          [(0, "<id1@example.com>"), (1, "<id3@example.com>")]])
+
+    def test_render_server_order(self):
+        temp = get_temp_folder(__file__, "temp_render_server_order")
+        caps = ImapServerMock.default_capabilities + ("SORT",)
+        with ImapServerMock({"INBOX": mails}, capabilities=caps) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            render = EmailMessageListRenderer(
+                title="list of mails", email_renderer=EmailMessageRenderer())
+            res = render.write(iter=box.enumerate_mails_in_folder(
+                "INBOX", sort="REVERSE DATE"), location=temp,
+                filename="list.html", sort=False)
+            render.flush()
+            box.logout()
+        with open(res[0], "r", encoding="utf8") as f:
+            content = f.read()
+        pos = [content.find("sender{0}-at-example-com".format(i))
+               for i in [3, 1, 5, 4, 2, 0, 6]]
+        self.assertNotIn(-1, pos)
+        self.assertEqual(pos, list(sorted(pos)))
+
+
+if __name__ == "__main__":
+    unittest.main()
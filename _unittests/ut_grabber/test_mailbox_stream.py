@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import unittest
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import MailBoxImap
+from pymmails.grabber.imap_server_mock import ImapServerMock
+
+
+def make_mail(i, size):
+    mail = MIMEMultipart()
+    mail["From"] = "sender{0}@example.com".format(i)
+    mail["Subject"] = "mail {0}".format(i)
+    mail.attach(MIMEText("text of mail {0}".format(i), "plain"))
+    att = MIMEApplication(bytes(range(256)) * (size // 256), "octet-stream")
+    att.add_header("Content-Disposition", "attachment",
+                   filename="data{0}.bin".format(i))
+    mail.attach(att)
+    return mail.as_bytes()
+
+
+class TestMailBoxStream(ExtTestCase):
+
+    def test_mailbox_stream(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        mails = [make_mail(0, 1000), make_mail(1, 100000),
+                 make_mail(2, 2000), make_mail(3, 50000)]
+        with ImapServerMock({"INBOX": mails}) as server:
+            box = MailBoxImap("user", "pwd", server.host,
+                              port=server.port, fLOG=fLOG)
+            box.login()
+            full = list(box.enumerate_mails_in_folder("INBOX", batch_size=4))
+            nb = server.commands.count("UID FETCH")
+            stream = list(box.enumerate_mails_in_folder(
+                "INBOX", batch_size=4, stream_size=20000))
+            nb_stream = server.commands.count("UID FETCH") - nb
+            box.logout()
+
+        self.assertEqual(len(stream), 4)
+        # sizes, small mails, 7 chunks for mail 1, 4 chunks for mail 3
+        self.assertEqual(nb_stream, 1 + 1 + 7 + 4)
+        for mail, expected in zip(stream, full):
+            self.assertEqual(mail["Subject"], expected["Subject"])
+            self.assertEqual(list(mail.enumerate_attachments()),
+                             list(expected.enumerate_attachments()))
+        self.assertEqual(len(list(stream[1].enumerate_attachments())[0][1]),
+                         99840)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import os
+import unittest
+from pyquickhelper.pycode import ExtTestCase, get_temp_folder
+from pymmails import MailBoxImap, ImapSyncState
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from _helpers import make_mock_mail as make_mail
+
+
+class TestMailBoxSync(ExtTestCase):
+
+    def test_mailbox_sync(self):
+        temp = get_temp_folder(__file__, "temp_mailbox_sync")
+        name = os.path.join(temp, "state.json")
+        with ImapServerMock({"INBOX": [make_mail(i) for i in range(5)]}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+
+            first = list(box.enumerate_new_mails("INBOX", name, batch_size=2))
+            self.assertEqual(len(first), 5)
+            self.assertExists(name)
+
+            nb = server.commands.count("UID SEARCH")
+            second = list(box.enumerate_new_mails("INBOX", name))
+            self.assertEqual(len(second), 0)
+            # UIDNEXT did not change, no search
+            self.assertEqual(server.commands.count("UID SEARCH"), nb)
+
+            server.append("INBOX", make_mail(5))
+            server.append("INBOX", make_mail(6))
+            third = list(box.enumerate_new_mails("INBOX", name))
+            self.assertEqual([m["Subject"] for m in third],
+                             ["mail 5", "mail 6"])
+
+            # the caller stops after the first mail
+            server.append("INBOX", make_mail(7))
+            server.append("INBOX", make_mail(8))
+            state = ImapSyncState(name)
+            for mail in box.enumerate_new_mails("INBOX", state):
+                self.assertEqual(mail["Subject"], "mail 7")
+                break
+            fourth = list(box.enumerate_new_mails("INBOX", state))
+            self.assertEqual([m["Subject"] for m in fourth],
+                             ["mail 7", "mail 8"])
+
+            # uidvalidity changes
+            server.folders["INBOX"].uidvalidity += 1
+            fifth = list(box.enumerate_new_mails("INBOX", name))
+            self.assertEqual(len(fifth), 9)
+            box.logout()
+
+        state = ImapSyncState(name)
+        key = ImapSyncState.make_key("user", "127.0.0.1", "INBOX")
+        self.assertEqual(state.get(key)["last_uid"], 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=3s)
+"""
+import time
+import threading
+import unittest
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase
+from pymmails import MailBoxImap
+from pymmails.grabber.imap_server_mock import ImapServerMock
+from _helpers import make_mock_mail as make_mail
+
+
+def deliver(server, mails, delay=0.2, disconnect=False):
+    def run():
+        for i, mail in enumerate(mails):
+            time.sleep(delay)
+            if disconnect and i == 1:
+                server.disconnect()
+                time.sleep(delay)
+            server.append("INBOX", mail)
+    th = threading.Thread(target=run)
+    th.start()
+    return th
+
+
+class TestMailBoxWatch(ExtTestCase):
+
+    def test_mailbox_watch_idle(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        caps = ImapServerMock.default_capabilities + ("IDLE",)
+        with ImapServerMock({"INBOX": [make_mail(0)]}, capabilities=caps) as server:
+            box = MailBoxImap("user", "pwd", server.host,
+                              port=server.port, fLOG=fLOG)
+            box.login()
+            th = deliver(server, [make_mail(i) for i in range(1, 4)])
+            received = []
+            begin = time.perf_counter()
+            for mail in box.enumerate_watch("INBOX", timeout=10):
+                received.append((mail["Subject"], time.perf_counter() - begin))
+                if len(received) == 3:
+                    break
+            th.join()
+            box.logout()
+            commands = list(server.commands)
+
+        self.assertEqual([r[0] for r in received], ["mail 1", "mail 2", "mail 3"])
+        self.assertLesser(received[-1][1], 2)
+        self.assertIn("IDLE", commands)
+        self.assertNotIn("NOOP", commands)
+        self.assertEqual(commands.count("UID SEARCH"), 3)
+
+    def test_mailbox_watch_noop(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        with ImapServerMock({"INBOX": [make_mail(0)]}) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port)
+            box.login()
+            th = deliver(server, [make_mail(i) for i in range(1, 3)])
+            received = []
+            nb = box.watch("INBOX", lambda m: received.append(m["Subject"]),
+                           timeout=1, poll_interval=0.1)
+            th.join()
+            box.logout()
+            commands = list(server.commands)
+
+        self.assertEqual(nb, 2)
+        self.assertEqual(received, ["mail 1", "mail 2"])
+        self.assertIn("NOOP", commands)
+        self.assertNotIn("IDLE", commands)
+        # the folder is only searched when the server announces new mails
+        self.assertIn(commands.count("UID SEARCH"), (1, 2))
+        self.assertGreater(commands.count("NOOP"), 5)
+
+    def test_mailbox_watch_reconnect(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        caps = ImapServerMock.default_capabilities + ("IDLE",)
+        with ImapServerMock({"INBOX": [make_mail(0)]}, capabilities=caps) as server:
+            box = MailBoxImap("user", "pwd", server.host, port=server.port,
+                              fLOG=fLOG)
+            box.login()
+            th = deliver(server, [make_mail(i) for i in range(1, 4)],
+                         disconnect=True)
+            received = []
+            box.watch("INBOX", lambda m: received.append(m["Subject"]) or len(received) < 3,
+                      timeout=10)
+            th.join()
+            box.logout()
+            commands = list(server.commands)
+
+        self.assertEqual(received, ["mail 1", "mail 2", "mail 3"])
+        self.assertEqual(commands.count("LOGIN"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+@brief      test log(time=1s)
+"""
+import os
+import itertools
+import unittest
+from pyquickhelper.loghelper import fLOG
+from pyquickhelper.pycode import ExtTestCase, get_temp_folder
+from pymmails import EmailMessage, MailException, enumerate_mails_pop
+from pymmails.grabber.pop_server_mock import PopServerMock
+from _helpers import make_mock_mail
+
+
+def make_mail(i):
+    return make_mock_mail(
+        i, to=None, date=None,
+        body="first line\r\n.line starting with a dot\r\nlast line {0}\r\n")
+
+
+class TestPop(ExtTestCase):
+
+    def test_enumerate_mails_pop(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        with PopServerMock([make_mail(i) for i in range(5)],
+                           user="user", password="pwd") as server:
+            mails = list(enumerate_mails_pop("user", "pwd", server.host,
+                                             port=server.port, fLOG=fLOG))
+            self.assertEqual(len(mails), 5)
+            self.assertIsInstance(mails[0], EmailMessage)
+            self.assertEqual(mails[3]["Subject"], "mail 3")
+            self.assertIn(".line starting with a dot",
+                          mails[3].get_payload())
+            self.assertEqual(server.commands.count("RETR"), 5)
+            self.assertEqual(server.commands[-1], "QUIT")
+
+            mails = list(enumerate_mails_pop("user", "pwd", server.host,
+                                             port=server.port, begin=1, end=3))
+            self.assertEqual([m["Subject"] for m in mails],
+                             ["mail 1", "mail 2"])
+
+            self.assertRaise(lambda: list(enumerate_mails_pop(
+                "user", "wrong", server.host, port=server.port)), MailException)
+
+    def test_enumerate_mails_pop_state(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        temp = get_temp_folder(__file__, "temp_enumerate_mails_pop_state")
+        state = os.path.join(temp, "state.json")
+        with PopServerMock([make_mail(i) for i in range(5)]) as server:
+            # the caller stops after the second mail,
+            # only the first one is considered as processed
+            mails = list(itertools.islice(enumerate_mails_pop(
+                "user", "pwd", server.host, port=server.port, state=state), 2))
+            self.assertEqual(len(mails), 2)
+            self.assertExists(state)
+
+            mails = list(enumerate_mails_pop(
+                "user", "pwd", server.host, port=server.port, state=state))
+            self.assertEqual([m["Subject"] for m in mails],
+                             ["mail 1", "mail 2", "mail 3", "mail 4"])
+
+            server.remove("uidl000001")
+            server.append(make_mail(5))
+            nb = server.commands.count("RETR")
+            mails = list(enumerate_mails_pop(
+                "user", "pwd", server.host, port=server.port, state=state))
+            self.assertEqual([m["Subject"] for m in mails], ["mail 5"])
+            self.assertEqual(server.commands.count("RETR") - nb, 1)
+
+        with open(state, "r", encoding="utf-8") as f:
+            content = f.read()
+        self.assertNotIn("uidl000001", content)
+        self.assertIn("uidl000006", content)
+
+        with PopServerMock([make_mail(0)], capabilities=["USER"]) as server:
+            self.assertRaise(lambda: list(enumerate_mails_pop(
+                "user", "pwd", server.host, port=server.port, state=state)),
+                MailException)
+
+    def test_enumerate_mails_pop_top_pipelining(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        caps = PopServerMock.default_capabilities + ("PIPELINING",)
+        for cap in [caps, PopServerMock.default_capabilities, ("USER", "UIDL")]:
+            with PopServerMock([make_mail(i) for i in range(7)],
+                               capabilities=cap) as server:
+                headers = list(enumerate_mails_pop(
+                    "user", "pwd", server.host, port=server.port,
+                    body=False, batch_size=3, fLOG=fLOG))
+                self.assertEqual([m["Subject"] for m in headers],
+                                 ["mail {0}".format(i) for i in range(7)])
+                if "TOP" in cap:
+                    self.assertEqual(server.commands.count("TOP"), 7)
+                    self.assertEqual(server.commands.count("RETR"), 0)
+                    self.assertNotIn("first line", headers[0].get_payload())
+                else:
+                    self.assertEqual(server.commands.count("RETR"), 7)
+                self.assertEqual(server.pipelined,
+                                 4 if "PIPELINING" in cap else 0)
+
+                nb = server.commands.count("RETR")
+                pipelined = server.pipelined
+                mails = list(enumerate_mails_pop(
+                    "user", "pwd", server.host, port=server.port, batch_size=3,
+                    skip_function=lambda m: m["Subject"] not in ("mail 1", "mail 5")))
+                self.assertEqual([m["Subject"] for m in mails],
+                                 ["mail 1", "mail 5"])
+                self.assertIn("last line 5", mails[1].get_payload())
+                self.assertEqual(server.commands.count("RETR") - nb,
+                                 2 if "TOP" in cap else 7)
+                if "PIPELINING" in cap:
+                    self.assertGreater(server.pipelined, pipelined)
+
+
+if __name__ == "__main__":
+    unittest.main()
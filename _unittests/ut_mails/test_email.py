@@ -7,6 +7,8 @@ import sys
 import os
 import unittest
 import pickle
+import time
+import dateutil.parser
 from pyquickhelper.loghelper import fLOG
 from pyquickhelper.pycode import get_temp_folder
 from pymmails import EmailMessage, EmailMessageRenderer
@@ -131,6 +133,89 @@ class TestEmail (unittest.TestCase):
         self.assertEqual(enc, "iso-8859-1")
         assert res.startswith('"dupre [MailContact]" <xavier.dupre@gmail.com>')
 
+    def test_cached_fields(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+
+        def make(i, day):
+            return EmailMessage.create_from_bytes((
+                "From: sender{0} <sender{0}@example.com>\r\n"
+                "To: dest <dest@example.com>\r\n"
+                "Subject: mail {0}\r\n"
+                "Date: Sat, {1} Aug 2015 10:00:00 +0200\r\n"
+                "\r\nbody\r\n").format(i, day).encode("ascii"))
+
+        mails = [make(i, 10 - i) for i in range(5)]
+        key = mails[0].__sortkey__()
+        self.assertIs(mails[0].__sortkey__(), key)
+        self.assertEqual(mails[0].get_date().day, 10)
+        uid = mails[0].UniqueID
+        self.assertEqual([m["Subject"] for m in sorted(mails)],
+                         ["mail 4", "mail 3", "mail 2", "mail 1", "mail 0"])
+
+        # the values are computed again once a header changes
+        mails[0].replace_header("Date", "Sat, 1 Aug 2015 10:00:00 +0200")
+        self.assertEqual(mails[0].get_date().day, 1)
+        self.assertNotEqual(mails[0].UniqueID, uid)
+        self.assertEqual(sorted(mails)[0]["Subject"], "mail 0")
+        del mails[0]["To"]
+        self.assertEqual(mails[0].get_to(), None)
+        mails[0]["To"] = "other <other@example.com>"
+        to = mails[0].get_to()
+        self.assertEqual(to[0][1], "other@example.com")
+        to.append(None)
+        self.assertEqual(mails[0].get_to(), to[:-1])
+        mails[0].add_header("From", "first <first@example.com>")
+        self.assertNotEqual(mails[0].__sortkey__(), key)
+
+    def test_get_date(self):
+        fLOG(
+            __file__,
+            self._testMethodName,
+            OutputPrint=__name__ == "__main__")
+        dates = ["Sat, 1 Aug 2015 10:00:00 +0200",
+                 "Mon, 15 Dec 2014 09:03:11 -0500",
+                 "1 Aug 2015 10:00:00 +0200",
+                 "Sat, 01 Aug 2015 10:00 +0200",
+                 "Wed, 7 Oct 2009 11:43:56 +0200 (CEST)",
+                 "Thu, 13 Feb 2014 08:00:00 GMT",
+                 "Thu, 13 Feb 2014 08:00:00 -0000",
+                 "Thu, 13 Feb 2014 08:00:00",
+                 "Fri, 6 Mar 15 10:00:00 +0100"]
+        malformed = ["2015-08-01 10:00:00",
+                     "2015-08-01T10:00:00Z"]
+
+        def get_date(date):
+            mail = EmailMessage()
+            mail["Date"] = date
+            return mail.get_date()
+
+        nb = EmailMessage.date_fallback
+        for date in dates:
+            self.assertEqual(get_date(date), dateutil.parser.parse(date))
+        self.assertEqual(EmailMessage.date_fallback, nb)
+        self.assertEqual(str(get_date(
+            "Wed, 7 Oct 2009 11:43:56 +0200 (Paris, Madrid (heure d'\u00e9t\u00e9))")),
+            "2009-10-07 11:43:56+02:00")
+        self.assertEqual(EmailMessage.date_fallback, nb)
+        for date in malformed:
+            self.assertEqual(get_date(date).day, 1)
+        self.assertEqual(EmailMessage.date_fallback, nb + len(malformed))
+
+        # micro-benchmark, times are only logged
+        corpus = dates * 200
+        begin = time.perf_counter()
+        for date in corpus:
+            get_date(date)
+        fast = time.perf_counter() - begin
+        begin = time.perf_counter()
+        for date in corpus:
+            dateutil.parser.parse(date)
+        slow = time.perf_counter() - begin
+        fLOG("get_date: {0:.4f}s, dateutil: {1:.4f}s".format(fast, slow))
+
 
 if __name__ == "__main__":
     unittest.main()
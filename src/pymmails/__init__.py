@@ -6,8 +6,19 @@ Functions to automatically grab and send mails.
 """
 from .grabber.mail_exception import MailException
 from .grabber.email_message import EmailMessage
+from .grabber.lazy_email_message import LazyEmailMessage
 from .grabber.mailboximap import MailBoxImap
 from .grabber.mailbox_mock import MailBoxMock
+from .grabber.mailbox_mock_index import MailBoxMockIndex
+from .grabber.mailbox_maildir import MailBoxMaildir
+from .grabber.mailbox_mbox import MailBoxMbox, MboxIndex
+from .grabber.mail_cache import MailCache
+from .grabber.mail_encryption import read_encrypted_mail, write_encrypted_mail
+from .grabber.mailbox_pool import MailBoxImapPool
+from .grabber.async_mailboximap import AsyncMailBoxImap
+from .grabber.pop_helper import enumerate_mails_pop
+from .grabber.imap_sync_state import ImapSyncState, ImapChange
+from .grabber.fetch_plan import FetchPlan, PlannedMail
 from .render.email_message_renderer import EmailMessageRenderer
 from .render.email_message_list_renderer import EmailMessageListRenderer
 from .sender.email_sender import create_smtp_server, send_email, compose_email
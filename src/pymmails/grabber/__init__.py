@@ -5,5 +5,16 @@
 
 from .mail_exception import MailException
 from .email_message import EmailMessage
+from .lazy_email_message import LazyEmailMessage
 from .mailboximap import MailBoxImap
 from .mailbox_mock import MailBoxMock
+from .mailbox_mock_index import MailBoxMockIndex
+from .mailbox_maildir import MailBoxMaildir
+from .mailbox_mbox import MailBoxMbox, MboxIndex
+from .mail_cache import MailCache
+from .mail_encryption import read_encrypted_mail, write_encrypted_mail
+from .mailbox_pool import MailBoxImapPool
+from .async_mailboximap import AsyncMailBoxImap
+from .pop_helper import enumerate_mails_pop
+from .imap_sync_state import ImapSyncState, ImapChange
+from .fetch_plan import FetchPlan, PlannedMail
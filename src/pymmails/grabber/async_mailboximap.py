@@ -0,0 +1,427 @@
+"""
+@file
+@brief Defines a mailbox using IMAP with :epkg:`asyncio`.
+"""
+
+import re
+import ssl as ssl_module
+import asyncio
+import email
+from collections import OrderedDict
+from pyquickhelper.loghelper import noLOG
+from .mail_exception import MailException
+from .email_message import EmailMessage
+from .mailboximap import MailBoxImap
+from .imap_helper import (
+    format_uid_set, split_batches, parse_fetch_response, uid_windows)
+
+
+_literal_end = re.compile(b"\\{([0-9]+)\\}\r\n$")
+_tagged = re.compile(b"^([A-Za-z0-9]+) (OK|NO|BAD)( (.*))?\r\n$")
+_untagged = re.compile(b"^\\* (([0-9]+) )?([A-Za-z-]+)( (.*))?$", re.S)
+_uidnext = re.compile(b"\\[UIDNEXT ([0-9]+)\\]")
+
+
+def _quote(value):
+    "quotes a string for a command"
+    return '"{0}"'.format(value.replace("\\", "\\\\").replace('"', '\\"'))
+
+
+class AsyncMailBoxImap:
+
+    """
+    Defines a mail box with :epkg:`IMAP` interface based on
+    :epkg:`asyncio`, it implements the protocol on top of
+    asyncio streams and returns the same objects as
+    @see cl MailBoxImap. Every command is tagged,
+    several commands can be sent before the server answers
+    the first one (pipelining).
+
+    .. exref::
+        :title: Fetch mails from many mail boxes with asyncio
+
+        ::
+
+            async def fetch(user, pwd, server):
+                box = AsyncMailBoxImap(user, pwd, server, ssl=True)
+                await box.login()
+                mails = [mail async for mail in box.enumerate_mails_in_folder(
+                    "INBOX", batch_size=100)]
+                await box.logout()
+                return mails
+
+            results = asyncio.run(asyncio.gather(
+                *[fetch(u, p, s) for u, p, s in accounts]))
+    """
+
+    def __init__(self, user, pwd, server, ssl=False, fLOG=noLOG, port=None):
+        """
+        @param  user        user
+        @param  pwd         password
+        @param  server      server something like ``imap.domain.ext``
+        @param  ssl         use SSL or not
+        @param  fLOG        logging function
+        @param  port        port, None for the default one
+        """
+        self._user = user
+        self._password = pwd
+        self._server = server
+        self._ssl = ssl
+        self._port = port if port is not None else (993 if ssl else 143)
+        self.fLOG = fLOG
+        self._reader = None
+        self._writer = None
+        self._tag = 0
+        self._prefix = "A"
+        # tag -> untagged responses received for this command
+        self._pending = OrderedDict()
+        self._completed = {}
+        self._lock = None
+        self.capabilities = []
+
+    # protocol
+
+    async def connect(self):
+        """
+        Opens the connection and reads the greeting.
+        """
+        context = ssl_module.create_default_context() if self._ssl else None
+        self._reader, self._writer = await asyncio.open_connection(
+            self._server, self._port, ssl=context)
+        self._lock = asyncio.Lock()
+        greeting = await self._readline()
+        if not greeting.startswith(b"* OK"):
+            raise MailException("unexpected greeting {0!r}".format(greeting))
+
+    async def _readline(self):
+        """
+        Reads a line, a line longer than the limit of the stream
+        (64 Kb by default, a search may return a longer one)
+        is read by pieces.
+        """
+        pieces = []
+        while True:
+            try:
+                pieces.append(await self._reader.readuntil(b"\n"))
+                return b"".join(pieces)
+            except asyncio.LimitOverrunError as e:
+                pieces.append(await self._reader.readexactly(e.consumed))
+            except asyncio.IncompleteReadError as e:
+                pieces.append(e.partial)
+                return b"".join(pieces)
+
+    async def _read_response(self):
+        """
+        Reads a response, it returns the same structure as :epkg:`imaplib`,
+        a list of tuple ``(text, literal)`` followed by bytes.
+        """
+        pieces = []
+        while True:
+            line = await self._readline()
+            if not line:
+                raise MailException("connection closed by the server")
+            m = _literal_end.search(line)
+            if m is None:
+                pieces.append(line.rstrip(b"\r\n"))
+                return pieces
+            literal = await self._reader.readexactly(int(m.group(1)))
+            pieces.append((line.rstrip(b"\r\n"), literal))
+
+    def send(self, command, *args):
+        """
+        Sends a command without waiting for the answer.
+
+        @param      command     command name
+        @param      args        arguments (strings)
+        @return                 tag to give to @see me wait
+        """
+        self._tag += 1
+        tag = "{0}{1}".format(self._prefix, self._tag)
+        line = " ".join([tag, command] + [a for a in args if a is not None])
+        self._writer.write(line.encode("utf-8") + b"\r\n")
+        self._pending[tag] = []
+        return tag
+
+    async def wait(self, tag):
+        """
+        Waits for the answer of a command sent by @see me send.
+
+        @param      tag     tag
+        @return             ``(typ, untagged responses, text)``,
+                            every untagged response is a tuple ``(type, data)``
+        """
+        async with self._lock:
+            await self._writer.drain()
+            while tag not in self._completed:
+                pieces = await self._read_response()
+                first = pieces[0]
+                text = first[0] if isinstance(first, tuple) else first
+                if text.startswith(b"+"):
+                    raise MailException(
+                        "continuation requests are not supported: {0!r}".format(text))
+                if text.startswith(b"* "):
+                    m = _untagged.match(text)
+                    if m is None:
+                        raise MailException(
+                            "unable to parse {0!r}".format(text))
+                    typ = m.group(3).decode("ascii").upper()
+                    # same format as imaplib, * 1 FETCH (...) becomes 1 (...)
+                    head = m.group(5) or b""
+                    if m.group(2) is not None:
+                        head = m.group(2) + (b" " + head if head else b"")
+                    data = [(head, first[1]) if isinstance(first, tuple) else head]
+                    data.extend(pieces[1:])
+                    # responses belong to the oldest command
+                    # still running (the server answers in order)
+                    owner = next(iter(self._pending)) if self._pending else None
+                    if owner is not None:
+                        self._pending[owner].append((typ, data))
+                    continue
+                m = _tagged.match(text + b"\r\n")
+                if m is None:
+                    raise MailException("unable to parse {0!r}".format(text))
+                done = m.group(1).decode("ascii")
+                untagged = self._pending.pop(done, [])
+                self._completed[done] = (m.group(2).decode("ascii"), untagged,
+                                         (m.group(4) or b"").decode("utf-8", errors="replace"))
+            return self._completed.pop(tag)
+
+    async def command(self, command, *args):
+        """
+        Sends a command and waits for the answer.
+
+        @param      command     command name
+        @param      args        arguments (strings)
+        @return                 ``(typ, untagged responses, text)``
+        """
+        typ, untagged, text = await self.wait(self.send(command, *args))
+        if typ != "OK":
+            raise MailException("command {0} failed: {1} {2}".format(
+                command, typ, text))
+        return typ, untagged, text
+
+    @staticmethod
+    def _data(untagged, typ):
+        "returns the data of all untagged responses of a type"
+        res = []
+        for t, data in untagged:
+            if t == typ:
+                res.extend(data)
+        return res
+
+    # mail box
+
+    async def login(self):
+        """
+        login
+        """
+        if self._reader is None:
+            await self.connect()
+        _, untagged, _ = await self.command(
+            "LOGIN", _quote(self._user), _quote(self._password))
+        caps = self._data(untagged, "CAPABILITY")
+        if not caps:
+            _, untagged, _ = await self.command("CAPABILITY")
+            caps = self._data(untagged, "CAPABILITY")
+        self.capabilities = [c.upper() for c in b" ".join(
+            c for c in caps if isinstance(c, bytes)).decode("ascii").split()]
+
+    async def logout(self):
+        """
+        logout
+        """
+        await self.command("LOGOUT")
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (ConnectionError, ssl_module.SSLError):
+            pass
+        self._reader = None
+        self._writer = None
+
+    async def folders(self):
+        """
+        Returns the list of folder of the mail box.
+        """
+        _, untagged, _ = await self.command("LIST", '""', '"*"')
+        res = []
+        for f in self._data(untagged, "LIST"):
+            s = f.decode("utf8") if isinstance(f, bytes) else f[0].decode("utf8")
+            if r"\Noselect" in s:
+                continue
+            exp = MailBoxImap.expFolderName.findall(s)
+            res.append(exp[-1])
+        return res
+
+    async def _examine(self, folder):
+        """
+        Selects a folder (read only) and returns what the server sent
+        (``EXISTS``, ``UIDNEXT`` if the server gave it).
+        """
+        _, untagged, _ = await self.command("EXAMINE", _quote(folder))
+        info = {}
+        for typ, data in untagged:
+            if typ == "EXISTS":
+                info["EXISTS"] = int(data[0])
+            elif typ == "OK" and isinstance(data[0], bytes):
+                m = _uidnext.search(data[0])
+                if m is not None:
+                    info["UIDNEXT"] = int(m.group(1))
+        return info
+
+    async def _iter_search_uids(self, folder, pattern, info, window=10000):
+        """
+        Searches the selected folder and returns the UIDs by chunks,
+        the search is split into windows of *window* UIDs
+        (``UID 1:10000 <pattern>``, ...) if the folder contains more
+        mails than *window*, as @see me _iter_search_uids does.
+
+        @param      folder          folder name
+        @param      pattern         search pattern
+        @param      info            information returned by @see me _examine
+        @param      window          number of UIDs in a window
+        @return                     asynchronous iterator on lists of integers
+        """
+        if "UIDNEXT" not in info or info.get("EXISTS", 0) <= window:
+            yield await self._search_uids(folder, pattern)
+            return
+        self.fLOG("[AsyncMailBoxImap._iter_search_uids] split the search for folder "
+                  "'{0}' into windows of {1} UIDs (UIDNEXT={2})".format(
+                      folder, window, info["UIDNEXT"]))
+        for lo, hi in uid_windows(info["UIDNEXT"], window):
+            uids = await self._search_uids(
+                folder, "UID {0}:{1} {2}".format(lo, hi, pattern))
+            if uids:
+                yield uids
+
+    async def _search_uids(self, folder, pattern):
+        """
+        Searches the selected folder and returns the list of UIDs.
+        """
+        try:
+            pattern.encode("ascii")
+            args = [pattern]
+        except UnicodeEncodeError:
+            args = ["CHARSET", "UTF-8", pattern]
+        typ, untagged, text = await self.wait(self.send("UID SEARCH", *args))
+        if typ != "OK":
+            raise MailException(
+                "Unable to search for pattern: '{0}'\nin subfolder {1}\n"
+                "check the folder you search for is right ({2})."
+                .format(pattern, folder, text))
+        uids = []
+        for data in self._data(untagged, "SEARCH"):
+            uids.extend(int(_) for _ in data.split())
+        return uids
+
+    def _send_fetch(self, uids, items):
+        "sends a command UID FETCH"
+        return self.send("UID FETCH", format_uid_set(uids),
+                         "(UID {0})".format(items))
+
+    async def _wait_fetch(self, tag, items):
+        "waits for the answer of a command UID FETCH"
+        typ, untagged, text = await self.wait(tag)
+        if typ != "OK":
+            raise MailException("unable to fetch {0}: {1}".format(items, text))
+        res = {}
+        for _, values in parse_fetch_response(self._data(untagged, "FETCH")):
+            if "UID" in values:
+                res[int(values["UID"])] = values
+        return res
+
+    async def enumerate_mails_in_folder(
+            self, folder, skip_function=None, date=None, pattern="ALL", body=True,
+            batch_size=1, fields=None, pipeline=2, search_window=10000):
+        """
+        Enumerates all mails in folder folder (asynchronous generator),
+        see @see me enumerate_mails_in_folder for the other parameters.
+
+        @param      folder          folder name or list of folders
+        @param      skip_function   if not None, use this function on the header/body to avoid loading the entire message (and skip it)
+        @param      pattern         search pattern (see below)
+        @param      date            add a date to the pattern
+        @param      body            add body
+        @param      batch_size      number of mails retrieved with a single command
+        @param      fields          restricts the header given to *skip_function*
+                                    or returned when *body* is False to these fields
+        @param      pipeline        number of batches requested before the
+                                    first one is received (at least 1)
+        @param      search_window   number of UIDs searched at once if the folder
+                                    contains more mails
+        @return                     asynchronous iterator on (message)
+
+        The function sends the commands to retrieve the next batches
+        while the server is still sending the current one,
+        at most *pipeline* batches are waiting in memory.
+        If the iteration stops before the end, the answers to the commands
+        already sent are read and discarded and the folder is closed.
+        """
+        if isinstance(folder, list):
+            for fold in folder:
+                async for mail in self.enumerate_mails_in_folder(
+                        fold, skip_function=skip_function, date=date,
+                        pattern=pattern, body=body, batch_size=batch_size,
+                        fields=fields, pipeline=pipeline,
+                        search_window=search_window):
+                    yield mail
+            return
+
+        info = await self._examine(folder)
+        if date is not None:
+            pdat = 'SINCE {0}'.format(date)
+            pattern = pdat if pattern == "ALL" else pattern + " " + pdat
+
+        need_header = skip_function is not None or not body
+        item = MailBoxImap._header_item(fields) if need_header else "RFC822"
+        sent = []
+        try:
+            async for uids in self._iter_search_uids(folder, pattern, info,
+                                                     window=search_window):
+                self.fLOG("AsyncMailBoxImap.enumerate_mails_in_folder [folder={0} nbm={1} body={2} pattern={3}]".format(
+                    folder, len(uids), body, pattern))
+                batches = list(split_batches(uids, batch_size))
+                pos = 0
+                while pos < len(batches) or sent:
+                    while pos < len(batches) and len(sent) < max(pipeline, 1):
+                        sent.append((batches[pos], self._send_fetch(batches[pos], item)))
+                        pos += 1
+                    batch, tag = sent.pop(0)
+                    contents = await self._wait_fetch(tag, item)
+                    if not need_header:
+                        for uid in batch:
+                            if uid in contents:
+                                yield email.message_from_bytes(
+                                    contents.pop(uid)["RFC822"], _class=EmailMessage)
+                        continue
+
+                    keep = []
+                    headers = {}
+                    for uid in batch:
+                        if uid not in contents:
+                            continue
+                        mail = email.message_from_bytes(
+                            MailBoxImap._fetched_content(contents.pop(uid), "BODY["),
+                            _class=EmailMessage)
+                        if skip_function is not None and skip_function(mail):
+                            continue
+                        headers[uid] = mail
+                        keep.append(uid)
+                    if not body:
+                        for uid in keep:
+                            yield headers.pop(uid)
+                    elif keep:
+                        bodies = await self._wait_fetch(
+                            self._send_fetch(keep, "RFC822"), "RFC822")
+                        for uid in keep:
+                            if uid in bodies:
+                                yield email.message_from_bytes(
+                                    bodies.pop(uid)["RFC822"], _class=EmailMessage)
+        finally:
+            # the consumer may stop before the end, the answers to the
+            # commands already sent are read and discarded
+            # so that the connection can still be used
+            if self._reader is not None:
+                while sent:
+                    await self.wait(sent.pop(0)[1])
+                await self.command("CLOSE")
@@ -12,6 +12,7 @@ import email
 from email.generator import BytesGenerator, Generator
 import email.header
 import email.message
+import email.utils
 from io import BytesIO, StringIO
 import mimetypes
 import hashlib
@@ -47,6 +48,15 @@ class EmailMessage(email.message.Message):
     additionnalMimeType = additional_mime_type_ext_type
     _date_format = "%Y-%m-%dT%H:%M:%S.%fZ"
 
+    #: number of dates @see me get_date could not parse
+    #: with the RFC 5322 grammar and gave to :epkg:`dateutil`
+    date_fallback = 0
+
+    def __init__(self, *args, **kwargs):
+        email.message.Message.__init__(self, *args, **kwargs)
+        # values computed from the headers, see _cached
+        self._derived = {}
+
     def as_bytes(self):  # pylint: disable=W0221
         """
         converts the mail into a binary string
@@ -184,18 +194,26 @@ class EmailMessage(email.message.Message):
         text = "<hr />".join(messages)
         return text
 
-    def enumerate_attachments(self):
+    def enumerate_attachments(self, skip_function=None):
         """
         enumerate the attachments as
         4-uple (filename, content, message_id, content_id)
 
-        @return         iterator on tuple (filename, content, message_id, content_id)
+        @param      skip_function   if not None, function called on every part
+                                    before its content is read, the part is skipped
+                                    if it returns True
+        @return                     iterator on tuple (filename, content, message_id, content_id)
+
+        The content of a part is only retrieved when it is read
+        if the mail is a @see cl LazyEmailMessage.
         """
         for part in self.walk():
             if part.get_content_maintype() == 'multipart':
                 continue
             if part.get('Content-Disposition') is None:
                 continue
+            if skip_function is not None and skip_function(part):
+                continue
 
             fileName = part.get_filename()
             fileName = self.decode_header("file", fileName)
@@ -245,10 +263,72 @@ class EmailMessage(email.message.Message):
 
             yield fileName, cont, cont_id, cont_id2
 
+    def _cached(self, key, fct):
+        """
+        Returns a value computed from the headers, it is computed
+        the first time and kept until a header is modified
+        (see @see me _clear_cache).
+
+        @param      key     key of the value in the cache
+        @param      fct     function computing the value
+        @return             value
+        """
+        cache = self.__dict__.get("_derived", None)
+        if cache is None:
+            # messages unpickled from a previous version have no cache
+            cache = self.__dict__.setdefault("_derived", {})
+        if key not in cache:
+            cache[key] = fct()
+        return cache[key]
+
+    def _clear_cache(self):
+        """
+        Removes the values computed from the headers,
+        called every time a header is added, replaced or removed.
+        """
+        self._derived = {}
+
+    def __setitem__(self, name, val):
+        self._clear_cache()
+        email.message.Message.__setitem__(self, name, val)
+
+    def __delitem__(self, name):
+        self._clear_cache()
+        email.message.Message.__delitem__(self, name)
+
+    def add_header(self, _name, _value, **_params):
+        """
+        Calls `Message.add_header <https://docs.python.org/3/library/email.compat32-message.html#email.message.Message.add_header>`_
+        and clears the cached values.
+        """
+        self._clear_cache()
+        email.message.Message.add_header(self, _name, _value, **_params)
+
+    def replace_header(self, _name, _value):
+        """
+        Calls `Message.replace_header <https://docs.python.org/3/library/email.compat32-message.html#email.message.Message.replace_header>`_
+        and clears the cached values.
+        """
+        self._clear_cache()
+        email.message.Message.replace_header(self, _name, _value)
+
+    def set_raw(self, name, value):
+        """
+        Calls `Message.set_raw <https://docs.python.org/3/library/email.compat32-message.html#email.message.Message.set_raw>`_
+        (used by the parsers) and clears the cached values.
+        """
+        self._clear_cache()
+        email.message.Message.set_raw(self, name, value)
+
     def __sortkey__(self):
         """
-        usual
+        usual, the key is computed once
+        and kept until a header is modified
         """
+        return self._cached("__sortkey__", self._compute_sortkey)
+
+    def _compute_sortkey(self):
+        "computes the key returned by @see me __sortkey__"
         key = [self.get_date(), self.get_from(), self.get_to(),
                self.UniqueID, self["subject"]]
         for i, k in enumerate(key):
@@ -382,7 +462,13 @@ class EmailMessage(email.message.Message):
         from the regular expression
 
         @return     tuple       ( label, email address)
+
+        The result is cached until a header is modified.
         """
+        return self._cached("from", self._parse_from)
+
+    def _parse_from(self):
+        "parses the sender, see @see me get_from"
         st = self["from"]
         if isinstance(st, email.header.Header):
             text, _ = EmailMessage.call_decode_header(st, is_email=True)
@@ -472,7 +558,15 @@ class EmailMessage(email.message.Message):
         @param      field   field to use, ``to`` or ``Delivered-To``
                             (the second one is used as a backup anyway)
         @return             list of tuple [ ( label, email address) ]
+
+        The result is cached until a header is modified.
         """
+        res = self._cached(("to", cc, field),
+                           lambda: self._parse_to(cc, field))
+        return None if res is None else list(res)
+
+    def _parse_to(self, cc, field):
+        "parses the receivers, see @see me get_to"
         st = self[field if not cc else "cc"]
         if st is None and not cc:
             st = self["Delivered-To"]
@@ -515,13 +609,38 @@ class EmailMessage(email.message.Message):
 
     def get_date(self):
         """
-        return a datetime object for the field Date
+        return a datetime object for the field Date,
+        it is cached until a header is modified
+
+        The date is parsed with the grammar of
+        `RFC 5322 <https://tools.ietf.org/html/rfc5322#section-3.3>`_
+        (``email.utils.parsedate_to_datetime``), :epkg:`dateutil` is only
+        used for malformed dates, attribute *date_fallback* counts them.
         """
+        return self._cached("date", self._parse_date)
+
+    def _parse_date(self):
+        "parses the field Date, see @see me get_date"
         st = self["Date"]
-        res, _ = EmailMessage.call_decode_header(st)
-        if res is None:
-            raise MailException("unable to parse: " + str(st))
+        if isinstance(st, str) and "=?" not in st:
+            res = st
+        else:
+            res, _ = EmailMessage.call_decode_header(st)
+            if res is None:
+                raise MailException("unable to parse: " + str(st))
 
+        # most dates follow RFC 5322, email.utils is much faster than dateutil
+        try:
+            p = email.utils.parsedate_to_datetime(res)
+        except (TypeError, ValueError, IndexError, OverflowError):
+            p = None
+        if p is not None:
+            if p.tzinfo is None and "-0000" in res:
+                # dateutil returns an aware datetime for -0000 (UTC)
+                p = p.replace(tzinfo=datetime.timezone.utc)
+            return p
+
+        EmailMessage.date_fallback += 1
         try:
             p = dateutil.parser.parse(res)
         except Exception as e:
@@ -605,8 +724,12 @@ class EmailMessage(email.message.Message):
     @property
     def UniqueID(self):
         """
-        builds a unique ID
+        builds a unique ID, it is cached until a header is modified
         """
+        return self._cached("UniqueID", self._compute_unique_id)
+
+    def _compute_unique_id(self):
+        "computes @see me UniqueID"
         md5 = hashlib.md5()
         t = self["Message-ID"]
         if t is not None:
@@ -674,7 +797,8 @@ class EmailMessage(email.message.Message):
         res["attached"] = self.get_nb_attachements()
         return res
 
-    def dump_attachments(self, attach_folder=".", buffer_write=None, metadata=True, fLOG=noLOG):
+    def dump_attachments(self, attach_folder=".", buffer_write=None, metadata=True, fLOG=noLOG,
+                         skip_function=None):
         """
         Dumps the mail into a folder using HTML format.
         If the destination files already exists, it skips it.
@@ -685,6 +809,8 @@ class EmailMessage(email.message.Message):
         @param      buffer_write    None or instance of @see cl BufferFilesWriting
         @param      metadata        if True, also dump metadata about attachments
         @param      fLOG            logging function
+        @param      skip_function   if not None, function called on every part
+                                    to skip it (see @see me enumerate_attachments)
         @return                     list of attachments
 
         The results is a list of 3-uple:
@@ -714,7 +840,7 @@ class EmailMessage(email.message.Message):
             return c2 != content
 
         atts = []
-        for ai, att in enumerate(self.enumerate_attachments()):
+        for ai, att in enumerate(self.enumerate_attachments(skip_function=skip_function)):
             if att[1] is None:
                 continue
             att_id = att[2]
@@ -0,0 +1,112 @@
+"""
+@file
+@brief Describes the mails to retrieve before retrieving them.
+"""
+
+from collections import namedtuple
+
+
+class PlannedMail(namedtuple("PlannedMail", ["uid", "size", "internaldate"])):
+    """
+    Mail in a @see cl FetchPlan, *size* is the size of the mail (``RFC822.SIZE``),
+    *internaldate* the reception date (``INTERNALDATE``, a datetime).
+    """
+    __slots__ = ()
+
+
+class FetchPlan:
+    """
+    List of mails to retrieve from a folder, it is returned by
+    @see me plan_fetch and given to @see me enumerate_planned_mails.
+    The plan knows the size of every mail and can tell how many bytes
+    a download would transfer before starting it.
+    """
+
+    #: available orders
+    orders = {
+        "smallest": (lambda m: (m.size, m.uid), False),
+        "largest": (lambda m: (m.size, m.uid), True),
+        "oldest": (lambda m: (m.internaldate, m.uid), False),
+        "newest": (lambda m: (m.internaldate, m.uid), True),
+    }
+
+    #: what happens to mails bigger than the maximum size
+    policies = ("skip", "header", "stream")
+
+    def __init__(self, folder, uidvalidity, mails):
+        """
+        @param      folder          folder
+        @param      uidvalidity     ``UIDVALIDITY`` of the folder
+        @param      mails           list of @see cl PlannedMail
+        """
+        self.folder = folder
+        self.uidvalidity = uidvalidity
+        self.mails = list(mails)
+
+    def __len__(self):
+        return len(self.mails)
+
+    def __iter__(self):
+        return iter(self.mails)
+
+    def __repr__(self):
+        return "{0}({1!r}, {2!r}, {3} mails, {4} bytes)".format(
+            self.__class__.__name__, self.folder, self.uidvalidity,
+            len(self), self.total_size)
+
+    @property
+    def total_size(self):
+        """
+        Returns the size of all mails.
+        """
+        return sum(m.size for m in self.mails)
+
+    def sort(self, order):
+        """
+        Sorts the mails.
+
+        @param      order       ``'smallest'``, ``'largest'``, ``'oldest'``,
+                                ``'newest'`` or None for the UID order
+        @return                 self
+        """
+        if order is None:
+            self.mails.sort(key=lambda m: m.uid)
+            return self
+        if order not in FetchPlan.orders:
+            raise ValueError("unknown order '{0}', it should be in {1}".format(
+                order, list(sorted(FetchPlan.orders))))
+        key, reverse = FetchPlan.orders[order]
+        self.mails.sort(key=key, reverse=reverse)
+        return self
+
+    def split(self, max_size=None):
+        """
+        Splits the plan into the mails smaller than *max_size*
+        and the others.
+
+        @param      max_size        maximum size, None for no limit
+        @return                     two lists of @see cl PlannedMail
+        """
+        if max_size is None:
+            return list(self.mails), []
+        small = [m for m in self.mails if m.size <= max_size]
+        large = [m for m in self.mails if m.size > max_size]
+        return small, large
+
+    def transfer_size(self, max_size=None, policy="skip"):
+        """
+        Estimates the number of bytes the download would transfer.
+        Headers retrieved for mails bigger than *max_size* are not counted.
+
+        @param      max_size        maximum size, None for no limit
+        @param      policy          see @see me enumerate_planned_mails
+        @return                     number of bytes
+        """
+        if policy not in FetchPlan.policies:
+            raise ValueError("unknown policy '{0}', it should be in {1}".format(
+                policy, FetchPlan.policies))
+        small, large = self.split(max_size)
+        size = sum(m.size for m in small)
+        if policy == "stream":
+            size += sum(m.size for m in large)
+        return size
@@ -0,0 +1,150 @@
+"""
+@file
+@brief Measures the throughput of @see cl MailBoxImap against @see cl ImapServerMock.
+"""
+
+import os
+import time
+import random
+import email.utils
+from pyquickhelper.loghelper import noLOG
+from .mailboximap import MailBoxImap
+from .mail_exception import MailException
+
+
+def create_eml_directory(directory, folders=None, size=2000, nb_persons=10, seed=0):
+    """
+    Creates a directory of mails (``*.eml``) which
+    @see me from_directory can serve.
+
+    @param      directory       destination, it is created if it does not exist
+    @param      folders         dictionary ``{ folder: number of mails }``,
+                                ``{'INBOX': 100}`` if None, mails of folder
+                                ``INBOX`` are stored at the root
+    @param      size            average size of a body (bytes)
+    @param      nb_persons      number of distinct senders and receivers
+    @param      seed            random seed
+    @return                     list of created files
+    """
+    if folders is None:
+        folders = {"INBOX": 100}
+    rnd = random.Random(seed)
+    persons = ["person{0}@example.com".format(i) for i in range(nb_persons)]
+    start = time.mktime((2015, 1, 1, 10, 0, 0, 0, 0, -1))
+    created = []
+    for name, nb in sorted(folders.items()):
+        sub = directory if name == "INBOX" else os.path.join(
+            directory, *name.split("/"))
+        if not os.path.exists(sub):
+            os.makedirs(sub)
+        for i in range(nb):
+            sender, receiver = rnd.sample(persons, 2)
+            length = rnd.randint(size // 2, size * 3 // 2)
+            words = []
+            while sum(map(len, words)) + len(words) < length:
+                words.append("".join(rnd.choice("abcdefghijklmnopqrstuvwxyz")
+                                     for _ in range(rnd.randint(2, 10))))
+            lines = [" ".join(words[k:k + 10])
+                     for k in range(0, len(words), 10)]
+            content = ("From: {0}\r\nTo: {1}\r\nSubject: mail {2} in {3}\r\n"
+                       "Date: {4}\r\nMessage-ID: <{2}.{5}@example.com>\r\n"
+                       "Content-Type: text/plain; charset=utf-8\r\n\r\n"
+                       "{6}\r\n").format(
+                sender, receiver, i, name,
+                email.utils.formatdate(start + i * 3600),
+                name.replace("/", "."), "\r\n".join(lines))
+            filename = os.path.join(sub, "mail{0:06d}.eml".format(i))
+            with open(filename, "wb") as f:
+                f.write(content.encode("utf-8"))
+            created.append(filename)
+    return created
+
+
+def _first_sender(server, folder):
+    "returns the sender of the first mail of a folder"
+    with server.lock:
+        mails = server.folders[folder].mails
+        if not mails:
+            return None
+        return email.utils.parseaddr(mails[0].message["From"])[1]
+
+
+def benchmark_imap(server, user="user", pwd="pwd", folder="INBOX", person=None,
+                   batch_sizes=(1, 10, 100), repeat=3, compress=False,
+                   fLOG=noLOG):
+    """
+    Measures the number of messages and bytes per second
+    @see cl MailBoxImap retrieves from a server.
+
+    @param      server          @see cl ImapServerMock, it must be started
+    @param      user            user
+    @param      pwd             password
+    @param      folder          folder to retrieve
+    @param      person          person given to @see me enumerate_search_person,
+                                the sender of the first mail if None
+    @param      batch_sizes     values tried for parameter *batch_size*
+    @param      repeat          number of times every test runs, the fastest one is kept
+    @param      compress        compresses the connection (``COMPRESS=DEFLATE``)
+    @param      fLOG            logging function
+    @return                     list of dictionaries, one per test
+
+    Every dictionary contains the test name (``folders``,
+    ``enumerate_mails_in_folder``, ``enumerate_search_person``),
+    *batch_size*, the number of retrieved messages, the number of bytes
+    the server sent, the time and the throughputs *messages_per_sec*
+    and *bytes_per_sec*. The list can be converted into a
+    :epkg:`pandas` DataFrame to compare two versions.
+
+    .. exref::
+        :title: Measure the throughput on a simulated network
+
+        ::
+
+            create_eml_directory("mails", {"INBOX": 500, "sent": 100})
+            with ImapServerMock.from_directory("mails", latency=0.005,
+                                               bandwidth=2 ** 20) as server:
+                for row in benchmark_imap(server, batch_sizes=(1, 10, 100)):
+                    print(row)
+    """
+    if folder not in server.folders:
+        raise MailException("unable to find folder '{0}'".format(folder))
+    if person is None:
+        person = _first_sender(server, folder)
+
+    box = MailBoxImap(user, pwd, server.host, port=server.port,
+                      compress=compress)
+    box.login()
+
+    def measure(test, batch_size, fct):
+        runs = []
+        for _ in range(repeat):
+            sent = server.bytes_sent
+            begin = time.perf_counter()
+            nb = fct()
+            duration = time.perf_counter() - begin
+            runs.append((duration, nb, server.bytes_sent - sent))
+        duration, nb, size = min(runs)
+        fLOG("[benchmark_imap] {0} batch_size={1}: {2} messages in {3:.3f}s".format(
+            test, batch_size, nb, duration))
+        return {"test": test, "batch_size": batch_size,
+                "messages": nb, "bytes": size, "time": duration,
+                "messages_per_sec": nb / duration if duration > 0 else None,
+                "bytes_per_sec": size / duration if duration > 0 else None}
+
+    res = []
+    try:
+        res.append(measure("folders", None, lambda: len(box.folders())))
+        for batch_size in batch_sizes:
+            res.append(measure(
+                "enumerate_mails_in_folder", batch_size,
+                lambda b=batch_size: sum(1 for _ in box.enumerate_mails_in_folder(
+                    folder, batch_size=b))))
+        if person is not None:
+            for batch_size in batch_sizes:
+                res.append(measure(
+                    "enumerate_search_person", batch_size,
+                    lambda b=batch_size: sum(1 for _ in box.enumerate_search_person(
+                        person, folder, batch_size=b))))
+    finally:
+        box.logout()
+    return res
@@ -0,0 +1,133 @@
+"""
+@file
+@brief Implements the :epkg:`IMAP` extension ``COMPRESS=DEFLATE``
+(`RFC 4978 <https://tools.ietf.org/html/rfc4978>`_) on top of :epkg:`imaplib`.
+"""
+
+import io
+import zlib
+import imaplib
+
+
+class ImapDeflate:
+    """
+    Compresses what is sent and decompresses what is received
+    once both sides agreed on ``COMPRESS DEFLATE`` (raw deflate, no header).
+    It counts the bytes sent and received on the wire and
+    the bytes before compression (payload).
+    """
+
+    def __init__(self, level=6):
+        """
+        @param      level       compression level
+        """
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        self._decompressor = zlib.decompressobj(-15)
+        self.wire_sent = 0
+        self.payload_sent = 0
+        self.wire_received = 0
+        self.payload_received = 0
+
+    def compress(self, data):
+        """
+        Compresses data and flushes the stream so that
+        the other side can decompress it immediately.
+        """
+        res = (self._compressor.compress(data) +
+               self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        self.payload_sent += len(data)
+        self.wire_sent += len(res)
+        return res
+
+    def decompress(self, data):
+        """
+        Decompresses data.
+        """
+        res = self._decompressor.decompress(data)
+        self.wire_received += len(data)
+        self.payload_received += len(res)
+        return res
+
+    def to_dict(self):
+        """
+        Returns the counters as a dictionary.
+        """
+        return {"wire_sent": self.wire_sent,
+                "payload_sent": self.payload_sent,
+                "wire_received": self.wire_received,
+                "payload_received": self.payload_received}
+
+
+class InflateReader(io.RawIOBase):
+    """
+    Raw stream decompressing what another stream receives,
+    it is meant to be wrapped into a :class:`io.BufferedReader`.
+    """
+
+    def __init__(self, stream, deflate):
+        """
+        @param      stream      buffered stream receiving compressed data
+        @param      deflate     @see cl ImapDeflate
+        """
+        io.RawIOBase.__init__(self)
+        self._stream = stream
+        self._deflate = deflate
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._pending:
+            chunk = self._stream.read1(8192)
+            if chunk is None:
+                return None
+            if not chunk:
+                return 0
+            self._pending = self._deflate.decompress(chunk)
+        size = min(len(b), len(self._pending))
+        b[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stream.close()
+        io.RawIOBase.close(self)
+
+
+class _DeflateMixin:
+    "compresses what :epkg:`imaplib` sends once the compression starts"
+
+    deflate = None
+
+    def send(self, data):
+        if self.deflate is not None:
+            data = self.deflate.compress(data)
+        super().send(data)
+
+    def start_compression(self, level=6):
+        """
+        Compresses the connection, the server must have
+        accepted command ``COMPRESS DEFLATE``.
+
+        @param      level       compression level
+        @return                 @see cl ImapDeflate
+        """
+        self.deflate = ImapDeflate(level)
+        self.file = io.BufferedReader(InflateReader(self.file, self.deflate))
+        return self.deflate
+
+
+class IMAP4Deflate(_DeflateMixin, imaplib.IMAP4):
+    """
+    :epkg:`imaplib` connection which can be compressed.
+    """
+    pass
+
+
+class IMAP4SSLDeflate(_DeflateMixin, imaplib.IMAP4_SSL):
+    """
+    :epkg:`imaplib` SSL connection which can be compressed.
+    """
+    pass
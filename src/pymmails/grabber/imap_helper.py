@@ -0,0 +1,280 @@
+"""
+@file
+@brief Helpers to build and parse :epkg:`IMAP` commands and responses.
+"""
+
+import re
+import datetime
+
+
+_fetch_start = re.compile(b"^ *([0-9]+) \\(")
+_literal_end = re.compile(b"\\{([0-9]+)\\}$")
+_atom_stop = b' ()"'
+_months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+           "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def format_uid_set(uids):
+    """
+    Builds a compact set of identifiers as expected by
+    :epkg:`IMAP` commands such as ``UID FETCH``,
+    ``[1, 2, 3, 5]`` becomes ``'1:3,5'``.
+
+    @param      uids        list of integers
+    @return                 string
+    """
+    values = sorted(set(int(u) for u in uids))
+    if len(values) == 0:
+        raise ValueError("uids cannot be empty")
+    pieces = []
+    first = last = values[0]
+    for v in values[1:]:
+        if v == last + 1:
+            last = v
+            continue
+        pieces.append(str(first) if first == last else
+                      "{0}:{1}".format(first, last))
+        first = last = v
+    pieces.append(str(first) if first == last else
+                  "{0}:{1}".format(first, last))
+    return ",".join(pieces)
+
+
+def parse_uid_set(text):
+    """
+    Expands a set of identifiers such as ``'1:3,5'``
+    into a list ``[1, 2, 3, 5]``, it is the reverse
+    of @see fn format_uid_set.
+
+    @param      text        string or bytes
+    @return                 list of integers
+    """
+    if isinstance(text, bytes):
+        text = text.decode("ascii")
+    res = []
+    for piece in text.strip().split(","):
+        if not piece:
+            continue
+        if ":" in piece:
+            a, b = piece.split(":")
+            a, b = int(a), int(b)
+            res.extend(range(min(a, b), max(a, b) + 1))
+        else:
+            res.append(int(piece))
+    return res
+
+
+def split_batches(values, batch_size):
+    """
+    Splits a list into consecutive batches.
+
+    @param      values      list
+    @param      batch_size  size of every batch (the last one may be smaller)
+    @return                 iterator on lists
+    """
+    if batch_size is None or batch_size <= 0:
+        raise ValueError("batch_size must be strictly positive")
+    for i in range(0, len(values), batch_size):
+        yield values[i:i + batch_size]
+
+
+def uid_windows(uidnext, window):
+    """
+    Splits the range of UIDs of a folder into windows,
+    a search is then run on every window
+    (``UID 1:10000 <pattern>``, ``UID 10001:20000 <pattern>``, ...).
+
+    @param      uidnext     next UID of the folder (``UIDNEXT``)
+    @param      window      number of UIDs in a window
+    @return                 list of tuple ``(first UID, last UID)``
+    """
+    if window is None or window <= 0:
+        raise ValueError("window must be strictly positive")
+    return [(lo, min(lo + window - 1, uidnext - 1))
+            for lo in range(1, uidnext, window)]
+
+
+def _decode(b):
+    "decodes bytes coming from the server"
+    return b.decode("utf-8", errors="surrogateescape")
+
+
+def _tokenize(text, pos, stack, literal, stop=1):
+    """
+    Tokenizes a piece of an :epkg:`IMAP` response and appends
+    every token to the last list of *stack*. Parenthesis
+    push and pop lists. A trailing ``{n}`` is replaced by *literal*.
+
+    @param      text        bytes
+    @param      pos         starting position
+    @param      stack       stack of lists
+    @param      literal     literal following the text or None
+    @param      stop        the function stops when the stack
+                            reaches that size
+    @return                 True if the function stopped on a closing parenthesis
+    """
+    n = len(text)
+    while pos < n:
+        c = text[pos:pos + 1]
+        if c in (b' ', b'\r', b'\n'):
+            pos += 1
+        elif c == b'(':
+            new = []
+            stack[-1].append(new)
+            stack.append(new)
+            pos += 1
+        elif c == b')':
+            stack.pop()
+            pos += 1
+            if len(stack) == stop:
+                return True
+        elif c == b'"':
+            pos += 1
+            buf = []
+            while pos < n and text[pos:pos + 1] != b'"':
+                if text[pos:pos + 1] == b'\\':
+                    pos += 1
+                buf.append(text[pos:pos + 1])
+                pos += 1
+            pos += 1
+            stack[-1].append(_decode(b"".join(buf)))
+        elif c == b'{' and _literal_end.match(text[pos:]):
+            stack[-1].append(literal)
+            pos = n
+        else:
+            begin = pos
+            depth = 0
+            while pos < n:
+                c = text[pos:pos + 1]
+                if c == b'[':
+                    depth += 1
+                elif c == b']':
+                    depth -= 1
+                elif depth == 0 and c in _atom_stop:
+                    break
+                pos += 1
+            atom = _decode(text[begin:pos])
+            stack[-1].append(None if atom.upper() == "NIL" else atom)
+    return False
+
+
+def parse_imap_list(text):
+    """
+    Parses a single line of an :epkg:`IMAP` response
+    into nested lists. Quoted strings and atoms become strings,
+    ``NIL`` becomes None.
+
+    @param      text        bytes or str
+    @return                 list
+
+    ::
+
+        parse_imap_list(b'INBOX (UIDNEXT 5 UIDVALIDITY 3)')
+        # ['INBOX', ['UIDNEXT', '5', 'UIDVALIDITY', '3']]
+    """
+    if isinstance(text, str):
+        text = text.encode("utf-8", errors="surrogateescape")
+    root = []
+    stack = [root]
+    _tokenize(text, 0, stack, None, stop=0)
+    return root
+
+
+def list_to_dict(values):
+    """
+    Converts a list ``[key1, value1, key2, value2, ...]``
+    into a dictionary, keys are converted into upper case.
+
+    @param      values      list
+    @return                 dictionary
+    """
+    res = {}
+    for i in range(0, len(values) - 1, 2):
+        key = values[i]
+        if isinstance(key, str):
+            key = key.upper()
+        res[key] = values[i + 1]
+    return res
+
+
+def parse_fetch_response(data):
+    """
+    Parses the data returned by :epkg:`imaplib` for a command
+    ``FETCH`` or ``UID FETCH``. :epkg:`imaplib` splits every answer
+    into tuples ``(text, literal)`` and bytes, the function
+    gathers them back.
+
+    @param      data        data returned by ``imaplib.IMAP4.fetch``
+    @return                 list of ``(sequence number, dictionary)``,
+                            the dictionary maps every fetched item
+                            (``'UID'``, ``'RFC822'``, ``'BODY[HEADER]'``, ...)
+                            to its value (bytes for literals)
+    """
+    res = []
+    stack = None
+    seq = None
+    for item in data:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            text, literal = item
+        else:
+            text, literal = item, None
+        pos = 0
+        if stack is None:
+            m = _fetch_start.match(text)
+            if m is None:
+                # closing parenthesis or unexpected data
+                continue
+            seq = int(m.group(1))
+            root = []
+            stack = [[], root]
+            pos = m.end()
+        if _tokenize(text, pos, stack, literal):
+            res.append((seq, list_to_dict(root)))
+            stack = None
+    return res
+
+
+def parse_internaldate(text):
+    """
+    Converts an ``INTERNALDATE`` such as ``17-Jul-1996 02:44:25 -0700``
+    into a datetime with a timezone.
+
+    @param      text        string
+    @return                 datetime
+    """
+    day, rest = text.strip().split("-", 1)
+    month, rest = rest.split("-", 1)
+    year, hour, zone = rest.split(" ")
+    hour, minute, second = [int(_) for _ in hour.split(":")]
+    offset = int(zone[1:3]) * 60 + int(zone[3:5])
+    if zone[0] == "-":
+        offset = -offset
+    return datetime.datetime(
+        int(year), _months.index(month.capitalize()) + 1, int(day),
+        hour, minute, second,
+        tzinfo=datetime.timezone(datetime.timedelta(minutes=offset)))
+
+
+def parse_thread(text):
+    """
+    Parses the response to a command ``THREAD``
+    (`RFC 5256 <https://tools.ietf.org/html/rfc5256>`_),
+    ``(3 6 (4 23)(44 7 96))(2)`` becomes a list of threads,
+    every thread is a list of nodes ``(uid, [children])``.
+
+    @param      text        response (bytes or str)
+    @return                 list of threads
+    """
+    def tree(values):
+        if not values:
+            return []
+        if isinstance(values[0], list):
+            # siblings
+            return [node for v in values for node in tree(v)]
+        return [(int(values[0]), tree(values[1:]))]
+
+    if isinstance(text, bytes):
+        text = text.decode("ascii")
+    return [tree(thread) for thread in parse_imap_list(text)]
@@ -0,0 +1,1106 @@
+"""
+@file
+@brief Defines a local :epkg:`IMAP` server holding mails in memory,
+it is used to test @see cl MailBoxImap without any remote server.
+"""
+# pylint: disable=C0302
+
+import io
+import os
+import re
+import time
+import select
+import socket
+import socketserver
+import threading
+import email
+import email.errors
+import email.header
+import email.utils
+from email.policy import compat32
+from pyquickhelper.loghelper import noLOG
+from .imap_helper import parse_imap_list
+from .imap_compress import ImapDeflate, InflateReader
+
+
+_command_line = re.compile(b"^([A-Za-z0-9.]+) ([A-Za-z]+)( (.*))?$")
+_literal_end = re.compile(b"\\{([0-9]+)\\+?\\}$")
+_months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+           "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def _imap_date(text):
+    """
+    Converts a date such as ``1-Feb-2013`` into a tuple ``(2013, 2, 1)``.
+    """
+    d, m, y = text.split("-")
+    return int(y), _months.index(m.capitalize()) + 1, int(d)
+
+
+def _quote(value):
+    "quotes a string for a response"
+    if value is None:
+        return "NIL"
+    return '"{0}"'.format(value.replace("\\", "\\\\").replace('"', '\\"'))
+
+
+class ImapServerMockMail:
+    """
+    A mail stored by @see cl ImapServerMock.
+    """
+
+    def __init__(self, uid, raw, flags=None, internaldate=None):
+        """
+        @param      uid             unique identifier
+        @param      raw             content (bytes)
+        @param      flags           flags
+        @param      internaldate    reception date (a timestamp),
+                                    the date of the mail if None
+        """
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        raw = raw.replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+        self.uid = uid
+        self.raw = raw
+        self.flags = set(flags or [])
+        self.modseq = 1
+        self.message = email.message_from_bytes(raw, policy=compat32)
+        if internaldate is None:
+            date = self.message["Date"]
+            parsed = email.utils.parsedate_tz(date) if date else None
+            internaldate = (email.utils.mktime_tz(parsed)
+                            if parsed else time.time())
+        self.internaldate = internaldate
+
+    @property
+    def size(self):
+        "returns the size of the mail"
+        return len(self.raw)
+
+    def header(self):
+        "returns the header"
+        pos = self.raw.find(b"\r\n\r\n")
+        return self.raw if pos == -1 else self.raw[:pos + 4]
+
+    def text(self):
+        "returns the body"
+        pos = self.raw.find(b"\r\n\r\n")
+        return b"" if pos == -1 else self.raw[pos + 4:]
+
+    def header_fields(self, fields, exclude=False):
+        "returns a subset of the header"
+        fields = set(f.lower() for f in fields)
+        lines = []
+        keep = False
+        for line in self.header().split(b"\r\n"):
+            if line == b"":
+                continue
+            if line[:1] not in (b" ", b"\t"):
+                name = line.split(b":")[0].decode("ascii", errors="ignore")
+                keep = (name.strip().lower() in fields) != exclude
+            if keep:
+                lines.append(line + b"\r\n")
+        return b"".join(lines) + b"\r\n"
+
+    def part(self, section):
+        """
+        Returns the part of a mail for a section such as ``2.1``.
+        """
+        part = self.message
+        for number in section.split("."):
+            if part.get_content_type() == "message/rfc822" and part.is_multipart():
+                # the parts of an encapsulated mail are the parts of its body
+                part = part.get_payload(0)
+            if part.is_multipart():
+                part = part.get_payload(int(number) - 1)
+            elif number != "1":
+                raise ValueError("unable to find section {0}".format(section))
+        return part
+
+    @staticmethod
+    def part_content(part):
+        "returns the content of a part as it is in the mail"
+        if part.get_content_type() == "message/rfc822" and part.is_multipart():
+            return part.get_payload(0).as_bytes()
+        if part.is_multipart():
+            raise ValueError("a multipart section cannot be fetched")
+        return part.get_payload().encode("ascii", "surrogateescape")
+
+    @staticmethod
+    def envelope(message):
+        "returns the ``ENVELOPE`` of a mail"
+        def text(name):
+            value = message[name]
+            return _quote(None if value is None else
+                          str(value).replace("\r", "").replace("\n", ""))
+
+        def addresses(name):
+            values = message.get_all(name)
+            if not values:
+                return "NIL"
+            res = []
+            for display, address in email.utils.getaddresses(values):
+                mailbox, _, host = address.partition("@")
+                res.append("({0} NIL {1} {2})".format(
+                    _quote(display or None), _quote(mailbox), _quote(host or None)))
+            return "({0})".format("".join(res))
+
+        sender = addresses("From")
+        fields = [text("Date"), text("Subject"), sender,
+                  addresses("Sender") if message["Sender"] else sender,
+                  addresses("Reply-To") if message["Reply-To"] else sender,
+                  addresses("To"), addresses("Cc"), addresses("Bcc"),
+                  text("In-Reply-To"), text("Message-ID")]
+        return "({0})".format(" ".join(fields))
+
+    def body_structure(self, part=None):
+        "returns the ``BODYSTRUCTURE`` of a mail or a part"
+        if part is None:
+            part = self.message
+
+        def params(header):
+            values = part.get_params(header=header, unquote=False)
+            if values is None:
+                # no Content-Type, RFC 2045 default is text/plain; charset=us-ascii
+                if header == "content-type" and part.get_content_type() == "text/plain":
+                    return '("CHARSET" "US-ASCII")'
+                return "NIL"
+            res = []
+            for k, v in values[1:]:
+                if isinstance(v, tuple):
+                    k = k + "*"
+                    v = email.utils.encode_rfc2231(email.utils.unquote(
+                        email.utils.collapse_rfc2231_value(v)), "utf-8")
+                else:
+                    v = email.utils.unquote(v)
+                res.append("{0} {1}".format(_quote(k.upper()), _quote(v)))
+            return "({0})".format(" ".join(res)) if res else "NIL"
+
+        disp = part.get_content_disposition()
+        disposition = ("({0} {1})".format(
+            _quote(disp), params("content-disposition"))
+            if disp else "NIL")
+        if part.get_content_maintype() == "multipart":
+            children = "".join(self.body_structure(p)
+                               for p in part.get_payload())
+            return "({0} {1} {2} {3} NIL NIL)".format(
+                children, _quote(part.get_content_subtype().upper()),
+                params("content-type"), disposition)
+        content = self.part_content(part)
+        fields = [_quote(part.get_content_maintype().upper()),
+                  _quote(part.get_content_subtype().upper()),
+                  params("content-type"), _quote(part["Content-ID"]),
+                  _quote(part["Content-Description"]),
+                  _quote(part.get("Content-Transfer-Encoding", "7BIT").upper()),
+                  str(len(content))]
+        lines = str(content.count(b"\n"))
+        if part.get_content_type() == "message/rfc822" and part.is_multipart():
+            inner = part.get_payload(0)
+            fields.extend([self.envelope(inner), self.body_structure(inner), lines])
+        elif part.get_content_maintype() == "text":
+            fields.append(lines)
+        fields.extend(["NIL", disposition, "NIL", "NIL"])
+        return "({0})".format(" ".join(fields))
+
+    def get_text(self, field):
+        "returns a decoded header, empty if it does not exist"
+        value = self.message[field]
+        if value is None:
+            return ""
+        try:
+            return str(email.header.make_header(
+                email.header.decode_header(value)))
+        except (UnicodeDecodeError, LookupError, email.errors.HeaderParseError):
+            return str(value)
+
+
+class ImapServerMockFolder:
+    """
+    A folder stored by @see cl ImapServerMock.
+    """
+
+    def __init__(self, name, uidvalidity):
+        """
+        @param      name            folder name
+        @param      uidvalidity     uid validity
+        """
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.highestmodseq = 1
+        self.mails = []
+        # list of (uid, modseq) for expunged mails
+        self.vanished = []
+
+    def _next_modseq(self):
+        self.highestmodseq += 1
+        return self.highestmodseq
+
+    def append(self, raw, flags=None, internaldate=None):
+        "appends a mail"
+        mail = ImapServerMockMail(self.uidnext, raw, flags=flags,
+                                  internaldate=internaldate)
+        mail.modseq = self._next_modseq()
+        self.uidnext += 1
+        self.mails.append(mail)
+        return mail
+
+    def store(self, uid, flags):
+        "replaces the flags of a mail"
+        for mail in self.mails:
+            if mail.uid == uid:
+                mail.flags = set(flags)
+                mail.modseq = self._next_modseq()
+                return mail
+        raise KeyError("unable to find uid {0}".format(uid))
+
+    def expunge(self, uids):
+        "removes mails"
+        uids = set(uids)
+        modseq = self._next_modseq()
+        self.vanished.extend((m.uid, modseq) for m in self.mails
+                             if m.uid in uids)
+        self.mails = [m for m in self.mails if m.uid not in uids]
+
+
+class ImapServerMock:
+    """
+    Implements a small :epkg:`IMAP` server holding mails in memory.
+    It only implements what @see cl MailBoxImap needs and
+    is meant to be used in unit tests.
+
+    .. exref::
+        :title: Test MailBoxImap with a local server
+
+        ::
+
+            folders = {"INBOX": [b"From: a@b.c\\r\\nSubject: test\\r\\n\\r\\nbody"]}
+            with ImapServerMock(folders, user="user", password="pwd") as server:
+                box = MailBoxImap("user", "pwd", server.host, port=server.port)
+                box.login()
+                mails = list(box.enumerate_mails_in_folder("INBOX"))
+                box.logout()
+    """
+
+    #: capabilities announced by the server
+    default_capabilities = ("IMAP4rev1",)
+
+    def __init__(self, folders=None, user=None, password=None,
+                 host="127.0.0.1", port=0, capabilities=None, latency=0.,
+                 bandwidth=None, fLOG=noLOG):
+        """
+        @param      folders         dictionary ``{ folder: [ mails ] }``,
+                                    a mail is bytes or a string
+        @param      user            expected user (None to accept any)
+        @param      password        expected password (None to accept any)
+        @param      host            host to listen to
+        @param      port            port (0 to let the system choose one)
+        @param      capabilities    capabilities, @see me default_capabilities if None
+        @param      latency         delay (seconds) before the server processes a command
+        @param      bandwidth       maximum number of bytes sent per second,
+                                    None for no limit
+        @param      fLOG            logging function
+
+        *latency* and *bandwidth* simulate a remote server,
+        attribute *bytes_sent* counts the bytes sent on the wire.
+        """
+        self.user = user
+        self.password = password
+        self.capabilities = list(capabilities or self.default_capabilities)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.bytes_sent = 0
+        self.fLOG = fLOG
+        self.lock = threading.RLock()
+        self.folders = {}
+        self.commands = []
+        self._uidvalidity = 1000
+        for name, mails in (folders or {}).items():
+            fold = self.create_folder(name)
+            for mail in mails:
+                fold.append(mail)
+        self._server = None
+        self._thread = None
+        self._address = (host, port)
+        self._handlers = set()
+
+    @staticmethod
+    def from_directory(directory, inbox="INBOX", **kwargs):
+        """
+        Creates a server holding the mails stored in a directory.
+        Every file ``*.eml`` becomes a mail, every subdirectory a folder
+        (``sub/folder`` for nested directories), files at the root
+        go to folder *inbox*. Mails are added in the alphabetical
+        order of their filenames.
+
+        @param      directory       directory
+        @param      inbox           folder receiving the mails at the root
+        @param      kwargs          additional parameters given to the constructor
+        @return                     @see cl ImapServerMock (not started)
+
+        .. exref::
+            :title: Serve a directory of mails
+
+            ::
+
+                with ImapServerMock.from_directory("mails", latency=0.02) as server:
+                    box = MailBoxImap("user", "pwd", server.host, port=server.port)
+                    box.login()
+                    print(box.folders())
+                    box.logout()
+        """
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(
+                "unable to find directory '{0}'".format(directory))
+        server = ImapServerMock(**kwargs)
+        server.create_folder(inbox)
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            rel = os.path.relpath(root, directory)
+            name = inbox if rel == "." else rel.replace(os.sep, "/")
+            server.create_folder(name)
+            for filename in sorted(files):
+                if not filename.lower().endswith(".eml"):
+                    continue
+                with open(os.path.join(root, filename), "rb") as f:
+                    server.append(name, f.read())
+        return server
+
+    def create_folder(self, name):
+        """
+        Creates a folder.
+
+        @param      name        folder name
+        @return                 @see cl ImapServerMockFolder
+        """
+        with self.lock:
+            if name not in self.folders:
+                self._uidvalidity += 1
+                self.folders[name] = ImapServerMockFolder(
+                    name, self._uidvalidity)
+            return self.folders[name]
+
+    def append(self, folder, raw, flags=None, internaldate=None):
+        """
+        Adds a mail to a folder.
+
+        @param      folder          folder name
+        @param      raw             mail (bytes)
+        @param      flags           flags
+        @param      internaldate    reception date (timestamp)
+        @return                     uid
+        """
+        with self.lock:
+            fold = self.create_folder(folder)
+            return fold.append(raw, flags=flags, internaldate=internaldate).uid
+
+    def store(self, folder, uid, flags):
+        """
+        Replaces the flags of a mail.
+
+        @param      folder          folder name
+        @param      uid             uid
+        @param      flags           new flags
+        """
+        with self.lock:
+            self.folders[folder].store(uid, flags)
+
+    def expunge(self, folder, uids):
+        """
+        Removes mails from a folder.
+
+        @param      folder          folder name
+        @param      uids            list of uids
+        """
+        with self.lock:
+            self.folders[folder].expunge(uids)
+
+    def disconnect(self):
+        """
+        Closes every connection to the server,
+        the server still accepts new ones.
+        """
+        with self.lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            try:
+                handler.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    @property
+    def host(self):
+        "returns the host"
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        "returns the port"
+        return self._server.server_address[1]
+
+    def start(self):
+        """
+        Starts the server in a thread.
+        """
+        if self._server is not None:
+            raise RuntimeError("server is already running")
+        mock = self
+
+        class Handler(ImapServerMockHandler):
+            "handler bound to this server"
+            server_mock = mock
+
+        self._server = socketserver.ThreadingTCPServer(
+            self._address, Handler, bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.allow_reuse_address = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        args=(0.05,),
+                                        daemon=True)
+        self._thread.start()
+        self.fLOG("[ImapServerMock.start] listening on {0}:{1}".format(
+            self.host, self.port))
+        return self
+
+    def stop(self):
+        """
+        Stops the server.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class ImapServerMockHandler(socketserver.StreamRequestHandler):
+    """
+    Handles a connection to @see cl ImapServerMock.
+    """
+
+    #: server the handler is bound to
+    server_mock = None
+    disable_nagle_algorithm = True
+    # state of the session
+    authenticated = False
+    folder = None
+    # number of mails of the selected folder the client knows about
+    exists = 0
+    readonly = True
+    closed = False
+    deflate = None
+
+    # communication
+
+    def send_line(self, line):
+        "sends a line"
+        if isinstance(line, str):
+            line = line.encode("utf-8")
+        self.send_bytes(line + b"\r\n")
+
+    def send_bytes(self, data):
+        "sends bytes, waits if the server simulates a limited bandwidth"
+        if self.deflate is not None:
+            data = self.deflate.compress(data)
+        mock = self.server_mock
+        if mock.bandwidth:
+            time.sleep(len(data) / mock.bandwidth)
+        self.wfile.write(data)
+        self.wfile.flush()
+        with mock.lock:
+            mock.bytes_sent += len(data)
+
+    def read_command(self):
+        """
+        Reads a command, gathers literals.
+        """
+        line = self.rfile.readline()
+        if not line:
+            return None
+        line = line.rstrip(b"\r\n")
+        parts = []
+        while True:
+            m = _literal_end.search(line)
+            if m is None:
+                parts.append(line)
+                break
+            size = int(m.group(1))
+            if not line.endswith(b"+}"):
+                self.send_line("+ Ready for literal data")
+            data = self.rfile.read(size)
+            parts.append(line[:m.start()] + b'"' +
+                         data.replace(b"\\", b"\\\\").replace(b'"', b'\\"') +
+                         b'"')
+            line = self.rfile.readline().rstrip(b"\r\n")
+        return b"".join(parts)
+
+    def handle(self):
+        with self.server_mock.lock:
+            self.server_mock._handlers.add(self)  # pylint: disable=W0212
+        try:
+            self._handle()
+        except OSError:
+            # the connection was closed
+            pass
+        finally:
+            with self.server_mock.lock:
+                self.server_mock._handlers.discard(self)  # pylint: disable=W0212
+
+    def _handle(self):
+        self.send_line("* OK IMAP4rev1 ImapServerMock ready")
+        while not self.closed:
+            line = self.read_command()
+            if line is None:
+                break
+            m = _command_line.match(line)
+            if m is None:
+                self.send_line("* BAD unable to parse command")
+                continue
+            tag = m.group(1).decode("ascii")
+            command = m.group(2).decode("ascii").upper()
+            args = m.group(4) or b""
+            mock = self.server_mock
+            with mock.lock:
+                mock.commands.append(command if command != "UID" else
+                                     "UID " + args.split(b" ")[0].decode("ascii").upper())
+            meth = getattr(self, "cmd_" + command.lower(), None)
+            if meth is None:
+                self.send_line("{0} BAD unknown command {1}".format(
+                    tag, command))
+                continue
+            if command not in ("CAPABILITY", "LOGIN", "LOGOUT", "NOOP") and \
+                    not self.authenticated:
+                self.send_line("{0} NO not authenticated".format(tag))
+                continue
+            if mock.latency:
+                time.sleep(mock.latency)
+            try:
+                meth(tag, args)
+            except (ValueError, KeyError, IndexError) as e:
+                self.send_line("{0} BAD {1}".format(tag, e))
+
+    # commands
+
+    def cmd_capability(self, tag, args):
+        "CAPABILITY"
+        self.send_line("* CAPABILITY " +
+                       " ".join(self.server_mock.capabilities))
+        self.send_line("{0} OK CAPABILITY completed".format(tag))
+
+    def cmd_noop(self, tag, args):
+        "NOOP, the server announces the new number of mails if it changed"
+        if self.folder is not None:
+            with self.server_mock.lock:
+                exists = len(self.folder.mails)
+            if exists != self.exists:
+                self.exists = exists
+                self.send_line("* {0} EXISTS".format(exists))
+        self.send_line("{0} OK NOOP completed".format(tag))
+
+    def cmd_compress(self, tag, args):
+        "COMPRESS DEFLATE"
+        if "COMPRESS=DEFLATE" not in self.server_mock.capabilities or \
+                args.strip().upper() != b"DEFLATE":
+            self.send_line("{0} BAD compression is not supported".format(tag))
+            return
+        if self.deflate is not None:
+            self.send_line("{0} NO [COMPRESSIONACTIVE] already compressed".format(tag))
+            return
+        self.send_line("{0} OK DEFLATE active".format(tag))
+        self.deflate = ImapDeflate()
+        self.rfile = io.BufferedReader(  # pylint: disable=W0201
+            InflateReader(self.rfile, self.deflate))
+
+    def cmd_idle(self, tag, args):
+        "IDLE, the server announces new mails until the client sends DONE"
+        if "IDLE" not in self.server_mock.capabilities:
+            self.send_line("{0} BAD IDLE is not supported".format(tag))
+            return
+        if not self._check_selected(tag):
+            return
+        self.send_line("+ idling")
+        with self.server_mock.lock:
+            known = len(self.folder.mails)
+        while True:
+            readable, _, _ = select.select([self.connection], [], [], 0.05)
+            if readable:
+                line = self.rfile.readline()
+                if not line:
+                    self.closed = True
+                    return
+                if line.strip().upper() == b"DONE":
+                    self.send_line("{0} OK IDLE terminated".format(tag))
+                    return
+                self.send_line("{0} BAD expecting DONE".format(tag))
+                return
+            with self.server_mock.lock:
+                exists = len(self.folder.mails)
+            if exists != known:
+                known = exists
+                self.send_line("* {0} EXISTS".format(exists))
+
+    def cmd_login(self, tag, args):
+        "LOGIN"
+        values = parse_imap_list(args)
+        user, password = values[0], values[1]
+        mock = self.server_mock
+        if (mock.user is not None and user != mock.user) or \
+                (mock.password is not None and password != mock.password):
+            self.send_line("{0} NO [AUTHENTICATIONFAILED] invalid credentials"
+                           .format(tag))
+        else:
+            self.authenticated = True
+            self.send_line("{0} OK LOGIN completed".format(tag))
+
+    def cmd_logout(self, tag, args):
+        "LOGOUT"
+        self.send_line("* BYE logging out")
+        self.send_line("{0} OK LOGOUT completed".format(tag))
+        self.closed = True
+
+    def cmd_list(self, tag, args):
+        "LIST"
+        with self.server_mock.lock:
+            names = list(sorted(self.server_mock.folders))
+        for name in names:
+            self.send_line('* LIST (\\HasNoChildren) "/" {0}'.format(
+                _quote(name)))
+        self.send_line("{0} OK LIST completed".format(tag))
+
+    def _select(self, tag, args, readonly):
+        name = parse_imap_list(args)[0]
+        mock = self.server_mock
+        with mock.lock:
+            if name not in mock.folders:
+                self.folder = None
+                self.send_line("{0} NO folder {1} does not exist".format(
+                    tag, name))
+                return
+            fold = mock.folders[name]
+            self.folder = fold
+            self.readonly = readonly
+            self.exists = len(fold.mails)
+            self.send_line("* {0} EXISTS".format(self.exists))
+            self.send_line("* 0 RECENT")
+            self.send_line("* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)")
+            self.send_line("* OK [UIDVALIDITY {0}] UIDs valid".format(
+                fold.uidvalidity))
+            self.send_line("* OK [UIDNEXT {0}] predicted next UID".format(
+                fold.uidnext))
+            if "CONDSTORE" in mock.capabilities:
+                self.send_line("* OK [HIGHESTMODSEQ {0}] highest".format(
+                    fold.highestmodseq))
+        self.send_line("{0} OK [{1}] {2} completed".format(
+            tag, "READ-ONLY" if readonly else "READ-WRITE",
+            "EXAMINE" if readonly else "SELECT"))
+
+    def cmd_select(self, tag, args):
+        "SELECT"
+        self._select(tag, args, False)
+
+    def cmd_examine(self, tag, args):
+        "EXAMINE"
+        self._select(tag, args, True)
+
+    def cmd_enable(self, tag, args):
+        "ENABLE"
+        caps = self.server_mock.capabilities
+        enabled = [c for c in parse_imap_list(args) if c.upper() in caps]
+        self.send_line("* ENABLED" + "".join(" " + c for c in enabled))
+        self.send_line("{0} OK ENABLE completed".format(tag))
+
+    def cmd_close(self, tag, args):
+        "CLOSE"
+        self.folder = None
+        self.send_line("{0} OK CLOSE completed".format(tag))
+
+    def cmd_status(self, tag, args):
+        "STATUS"
+        values = parse_imap_list(args)
+        name, items = values[0], values[1]
+        mock = self.server_mock
+        with mock.lock:
+            if name not in mock.folders:
+                self.send_line("{0} NO folder {1} does not exist".format(
+                    tag, name))
+                return
+            fold = mock.folders[name]
+            known = {"MESSAGES": len(fold.mails), "UIDNEXT": fold.uidnext,
+                     "UIDVALIDITY": fold.uidvalidity, "RECENT": 0,
+                     "UNSEEN": sum(1 for m in fold.mails if "\\Seen" not in m.flags)}
+        res = []
+        for item in items:
+            res.append("{0} {1}".format(item.upper(), known[item.upper()]))
+        self.send_line("* STATUS {0} ({1})".format(_quote(name), " ".join(res)))
+        self.send_line("{0} OK STATUS completed".format(tag))
+
+    def cmd_uid(self, tag, args):
+        "UID"
+        sub, _, rest = args.partition(b" ")
+        meth = getattr(self, "cmd_" + sub.decode("ascii").lower(), None)
+        if meth is None:
+            self.send_line("{0} BAD unknown command UID {1}".format(
+                tag, sub.decode("ascii")))
+        else:
+            meth(tag, rest, uid=True)
+
+    def _check_selected(self, tag):
+        if self.folder is None:
+            self.send_line("{0} BAD no selected folder".format(tag))
+            return False
+        return True
+
+    def cmd_search(self, tag, args, uid=False):
+        "SEARCH"
+        if not self._check_selected(tag):
+            return
+        criteria = parse_imap_list(args)
+        if len(criteria) >= 2 and str(criteria[0]).upper() == "CHARSET":
+            criteria = criteria[2:]
+        with self.server_mock.lock:
+            mails = list(self.folder.mails)
+        found = []
+        for seq, mail in enumerate(mails):
+            if self._match_all(criteria, seq + 1, mail, mails):
+                found.append(str(mail.uid if uid else seq + 1))
+        self.send_line("* SEARCH" + "".join(" " + f for f in found))
+        self.send_line("{0} OK SEARCH completed".format(tag))
+
+    @staticmethod
+    def _base_subject(mail):
+        "returns the subject without prefixes such as ``Re:``"
+        subject = mail.get_text("Subject").strip().lower()
+        while True:
+            m = re.match("^(re|fw|fwd) *(\\[[^]]*\\])? *: *", subject)
+            if m is None:
+                return subject
+            subject = subject[m.end():]
+
+    @staticmethod
+    def _sent_date(mail):
+        "returns the date of the mail, the reception date if it has none"
+        date = mail.message["Date"]
+        parsed = email.utils.parsedate_tz(date) if date else None
+        return email.utils.mktime_tz(parsed) if parsed else mail.internaldate
+
+    def _sort_key(self, key, mail):
+        "returns the value of a sort criterion"
+        if key == "ARRIVAL":
+            return mail.internaldate
+        if key == "DATE":
+            return self._sent_date(mail)
+        if key == "SIZE":
+            return mail.size
+        if key == "SUBJECT":
+            return self._base_subject(mail)
+        if key in ("FROM", "TO", "CC"):
+            return email.utils.parseaddr(mail.get_text(key))[1].lower()
+        raise ValueError("unknown sort criterion {0}".format(key))
+
+    def _search_mails(self, criteria, uid):
+        "returns the mails matching criteria as a list of (number, mail)"
+        with self.server_mock.lock:
+            mails = list(self.folder.mails)
+        return [(mail.uid if uid else seq + 1, mail)
+                for seq, mail in enumerate(mails)
+                if self._match_all(criteria, seq + 1, mail, mails)]
+
+    def cmd_sort(self, tag, args, uid=False):
+        "SORT (RFC 5256)"
+        if "SORT" not in self.server_mock.capabilities:
+            self.send_line("{0} BAD SORT is not supported".format(tag))
+            return
+        if not self._check_selected(tag):
+            return
+        values = parse_imap_list(args)
+        keys, criteria = values[0], values[2:]
+        found = self._search_mails(criteria, uid)
+        reverse = False
+        sort_keys = []
+        for key in keys:
+            if key.upper() == "REVERSE":
+                reverse = True
+                continue
+            sort_keys.append((key.upper(), reverse))
+            reverse = False
+        # stable sorts, the last key first
+        for key, rev in reversed(sort_keys):
+            found.sort(key=lambda f, k=key: self._sort_key(k, f[1]), reverse=rev)
+        self.send_line("* SORT" + "".join(" {0}".format(f[0]) for f in found))
+        self.send_line("{0} OK SORT completed".format(tag))
+
+    def cmd_thread(self, tag, args, uid=False):
+        "THREAD (RFC 5256), simplified algorithms"
+        values = parse_imap_list(args)
+        algorithm, criteria = values[0].upper(), values[2:]
+        if "THREAD=" + algorithm not in self.server_mock.capabilities:
+            self.send_line("{0} BAD THREAD={1} is not supported".format(
+                tag, algorithm))
+            return
+        if not self._check_selected(tag):
+            return
+        found = self._search_mails(criteria, uid)
+        found.sort(key=lambda f: (self._sent_date(f[1]), f[0]))
+        children = {f[0]: [] for f in found}
+        roots = []
+        if algorithm == "ORDEREDSUBJECT":
+            first = {}
+            for number, mail in found:
+                subject = self._base_subject(mail)
+                if subject in first:
+                    children[first[subject]].append(number)
+                else:
+                    first[subject] = number
+                    roots.append(number)
+        else:
+            ids = {}
+            for number, mail in found:
+                if mail.message["Message-ID"]:
+                    ids[mail.message["Message-ID"].strip()] = number
+            for number, mail in found:
+                refs = " ".join(mail.message.get_all("References", []) +
+                                mail.message.get_all("In-Reply-To", []))
+                parents = [ids[r] for r in re.findall("<[^>]+>", refs)
+                           if ids.get(r, number) != number]
+                if parents:
+                    children[parents[-1]].append(number)
+                else:
+                    roots.append(number)
+
+        def format_node(number):
+            text = str(number)
+            nodes = children[number]
+            if len(nodes) == 1:
+                text += " " + format_node(nodes[0])
+            elif nodes:
+                text += " " + "".join("(" + format_node(n) + ")" for n in nodes)
+            return text
+
+        self.send_line("* THREAD " + "".join(
+            "(" + format_node(r) + ")" for r in roots))
+        self.send_line("{0} OK THREAD completed".format(tag))
+
+    def cmd_fetch(self, tag, args, uid=False):
+        "FETCH"
+        if not self._check_selected(tag):
+            return
+        values = parse_imap_list(args)
+        sset, items = values[0], values[1]
+        if not isinstance(items, list):
+            items = [items]
+        modifiers = {}
+        if len(values) > 2:
+            mods = values[2]
+            for i, mod in enumerate(mods):
+                if mod.upper() == "CHANGEDSINCE":
+                    modifiers["CHANGEDSINCE"] = int(mods[i + 1])
+                elif mod.upper() == "VANISHED":
+                    modifiers["VANISHED"] = True
+            if "CHANGEDSINCE" in modifiers:
+                items = items + ["MODSEQ"]
+        if len(items) == 1 and items[0].upper() in ("ALL", "FAST", "FULL"):
+            items = ["FLAGS", "INTERNALDATE", "RFC822.SIZE"]
+        if uid and "UID" not in [i.upper() for i in items]:
+            items = ["UID"] + items
+        with self.server_mock.lock:
+            mails = list(self.folder.mails)
+            vanished = list(self.folder.vanished)
+        since = modifiers.get("CHANGEDSINCE", None)
+        if uid and modifiers.get("VANISHED", False):
+            largest = max([0] + [m.uid for m in mails] + [u for u, _ in vanished])
+            gone = [str(u) for u, modseq in vanished
+                    if modseq > since and self._in_set(sset, u, largest)]
+            if gone:
+                self.send_line("* VANISHED (EARLIER) " + ",".join(gone))
+        for seq, mail in enumerate(mails):
+            if not self._in_set(sset, mail.uid if uid else seq + 1,
+                                mails[-1].uid if uid else len(mails)):
+                continue
+            if since is not None and mail.modseq <= since:
+                continue
+            self.send_bytes(self._fetch_mail(seq + 1, mail, items))
+        self.send_line("{0} OK FETCH completed".format(tag))
+
+    # fetch
+
+    def _fetch_mail(self, seq, mail, items):
+        "builds the response for one mail"
+        pieces = []
+        for item in items:
+            name, value = self._fetch_item(mail, item)
+            if isinstance(value, bytes):
+                pieces.append("{0} {{{1}}}\r\n".format(
+                    name, len(value)).encode("ascii") + value)
+            else:
+                pieces.append("{0} {1}".format(name, value).encode("utf-8"))
+        return ("* {0} FETCH (".format(seq).encode("ascii") +
+                b" ".join(pieces) + b")\r\n")
+
+    def _fetch_item(self, mail, item):
+        "returns the name and the value of a fetched item"
+        up = item.upper()
+        if up == "UID":
+            return "UID", str(mail.uid)
+        if up == "FLAGS":
+            return "FLAGS", "({0})".format(" ".join(sorted(mail.flags)))
+        if up == "RFC822.SIZE":
+            return "RFC822.SIZE", str(mail.size)
+        if up == "MODSEQ":
+            return "MODSEQ", "({0})".format(mail.modseq)
+        if up == "INTERNALDATE":
+            tt = time.localtime(mail.internaldate)
+            return "INTERNALDATE", '"{0}"'.format(
+                time.strftime("%d-", tt) + _months[tt.tm_mon - 1] +
+                time.strftime("-%Y %H:%M:%S ", tt) +
+                self._timezone(mail.internaldate))
+        if up == "RFC822":
+            self._set_seen(mail)
+            return "RFC822", mail.raw
+        if up == "RFC822.HEADER":
+            return "RFC822.HEADER", mail.header()
+        if up == "BODYSTRUCTURE":
+            return "BODYSTRUCTURE", mail.body_structure()
+        if up == "RFC822.TEXT":
+            self._set_seen(mail)
+            return "RFC822.TEXT", mail.text()
+        if up.startswith("BODY[") or up.startswith("BODY.PEEK["):
+            peek = up.startswith("BODY.PEEK[")
+            section = item[item.find("[") + 1:item.rfind("]")]
+            partial = item[item.rfind("]") + 1:]
+            value = self._fetch_section(mail, section)
+            if partial:
+                start, length = [int(_) for _ in partial.strip("<>").split(".")]
+                value = value[start:start + length]
+                partial = "<{0}>".format(start)
+            if not peek:
+                self._set_seen(mail)
+            return "BODY[{0}]{1}".format(section, partial), value
+        raise ValueError("unable to fetch {0}".format(item))
+
+    def _fetch_section(self, mail, section):
+        "returns a section of a mail"
+        up = section.upper()
+        if up == "":
+            return mail.raw
+        if up == "HEADER":
+            return mail.header()
+        if up == "TEXT":
+            return mail.text()
+        if up.startswith("HEADER.FIELDS"):
+            fields = parse_imap_list(section[section.find("("):])[0]
+            return mail.header_fields(fields, exclude=".NOT" in up)
+        if re.match("^[0-9]+(\\.[0-9]+)*$", up):
+            return mail.part_content(mail.part(up))
+        raise ValueError("unable to fetch section {0}".format(section))
+
+    def _set_seen(self, mail):
+        if not self.readonly and "\\Seen" not in mail.flags:
+            with self.server_mock.lock:
+                self.folder.store(mail.uid, mail.flags | {"\\Seen"})
+
+    @staticmethod
+    def _timezone(timestamp):
+        tt = time.localtime(timestamp)
+        offset = tt.tm_gmtoff // 60
+        sign = "+" if offset >= 0 else "-"
+        offset = abs(offset)
+        return "{0}{1:02d}{2:02d}".format(sign, offset // 60, offset % 60)
+
+    # search
+
+    @staticmethod
+    def _in_set(sset, value, largest):
+        "tells if a value belongs to a set such as ``1:4,7,9:*``"
+        for piece in str(sset).split(","):
+            if ":" in piece:
+                a, b = piece.split(":")
+                a = largest if a == "*" else int(a)
+                b = largest if b == "*" else int(b)
+                if min(a, b) <= value <= max(a, b):
+                    return True
+            elif (largest if piece == "*" else int(piece)) == value:
+                return True
+        return False
+
+    def _match_all(self, criteria, seq, mail, mails):
+        "tells if a mail verifies all criteria"
+        pos = 0
+        while pos < len(criteria):
+            ok, pos = self._match(criteria, pos, seq, mail, mails)
+            if not ok:
+                return False
+        return True
+
+    def _match(self, criteria, pos, seq, mail, mails):
+        "checks one criterion starting at position pos"
+        key = criteria[pos]
+        if isinstance(key, list):
+            return self._match_all(key, seq, mail, mails), pos + 1
+        up = key.upper()
+        flags = {"ANSWERED": "\\Answered", "DELETED": "\\Deleted",
+                 "DRAFT": "\\Draft", "FLAGGED": "\\Flagged", "SEEN": "\\Seen"}
+        if up == "ALL":
+            return True, pos + 1
+        if up in ("RECENT", "NEW"):
+            return "\\Recent" in mail.flags, pos + 1
+        if up == "OLD":
+            return "\\Recent" not in mail.flags, pos + 1
+        if up in flags:
+            return flags[up] in mail.flags, pos + 1
+        if up.startswith("UN") and up[2:] in flags:
+            return flags[up[2:]] not in mail.flags, pos + 1
+        if up == "NOT":
+            ok, pos = self._match(criteria, pos + 1, seq, mail, mails)
+            return not ok, pos
+        if up == "OR":
+            ok1, pos = self._match(criteria, pos + 1, seq, mail, mails)
+            ok2, pos = self._match(criteria, pos, seq, mail, mails)
+            return ok1 or ok2, pos
+        if up in ("FROM", "TO", "CC", "BCC", "SUBJECT"):
+            value = criteria[pos + 1].lower()
+            return value in mail.get_text(up).lower(), pos + 2
+        if up == "HEADER":
+            name, value = criteria[pos + 1], criteria[pos + 2].lower()
+            return value in mail.get_text(name).lower(), pos + 3
+        if up in ("BODY", "TEXT"):
+            value = criteria[pos + 1].lower().encode("utf-8")
+            content = mail.raw if up == "TEXT" else mail.text()
+            return value in content.lower(), pos + 2
+        if up in ("LARGER", "SMALLER"):
+            size = int(criteria[pos + 1])
+            return (mail.size > size if up == "LARGER" else
+                    mail.size < size), pos + 2
+        if up in ("SINCE", "BEFORE", "ON"):
+            tt = time.localtime(mail.internaldate)
+            return self._compare_date(up, (tt.tm_year, tt.tm_mon, tt.tm_mday),
+                                      criteria[pos + 1]), pos + 2
+        if up in ("SENTSINCE", "SENTBEFORE", "SENTON"):
+            parsed = email.utils.parsedate(mail.message["Date"] or "")
+            if parsed is None:
+                return False, pos + 2
+            return self._compare_date(up[4:], tuple(parsed[:3]),
+                                      criteria[pos + 1]), pos + 2
+        if up == "UID":
+            return self._in_set(criteria[pos + 1], mail.uid,
+                                mails[-1].uid), pos + 2
+        if up[:1].isdigit() or up[:1] == "*":
+            return self._in_set(up, seq, len(mails)), pos + 1
+        raise ValueError("unable to interpret search key {0}".format(key))
+
+    @staticmethod
+    def _compare_date(op, date, value):
+        ref = _imap_date(value)
+        if op == "SINCE":
+            return date >= ref
+        if op == "BEFORE":
+            return date < ref
+        return date == ref
@@ -0,0 +1,98 @@
+"""
+@file
+@brief Stores the synchronisation state of :epkg:`IMAP` folders.
+"""
+
+import os
+import json
+from collections import namedtuple
+
+
+class ImapChange(namedtuple("ImapChange", ["uid", "flags", "vanished", "modseq"])):
+    """
+    Change in a folder returned by @see me enumerate_changes,
+    *flags* is a tuple of flags, *vanished* is True if the mail
+    was removed, *modseq* is the modification sequence of the change
+    (None for a removed mail).
+    """
+    __slots__ = ()
+
+
+class ImapSyncState:
+    """
+    Stores for every folder the last seen UID and the
+    ``UIDVALIDITY`` of the folder to only retrieve new mails
+    (see @see me enumerate_new_mails). The state is stored
+    in a json file if a filename is given.
+    """
+
+    def __init__(self, filename=None):
+        """
+        @param      filename        file storing the state, None to keep
+                                    it in memory, the file is loaded
+                                    if it exists
+        """
+        self.filename = filename
+        self._folders = {}
+        if filename is not None and os.path.exists(filename):
+            with open(filename, "r", encoding="utf-8") as f:
+                self._folders = json.load(f)
+
+    @staticmethod
+    def make_key(user, server, folder):
+        """
+        Builds the key of a folder.
+
+        @param      user        user
+        @param      server      server
+        @param      folder      folder
+        @return                 string
+        """
+        return "{0}@{1}/{2}".format(user, server, folder)
+
+    def __contains__(self, key):
+        return key in self._folders
+
+    def __len__(self):
+        return len(self._folders)
+
+    def get(self, key):
+        """
+        Returns the checkpoint of a folder.
+
+        @param      key         key (see @see me make_key)
+        @return                 dictionary or None
+        """
+        return self._folders.get(key, None)
+
+    def update(self, key, **values):
+        """
+        Updates the checkpoint of a folder.
+
+        @param      key         key (see @see me make_key)
+        @param      values      values to update (``uidvalidity``, ``last_uid``, ...)
+        """
+        if key not in self._folders:
+            self._folders[key] = {}
+        self._folders[key].update(values)
+
+    def reset(self, key, uidvalidity):
+        """
+        Resets the checkpoint of a folder, it happens when
+        the server changes its ``UIDVALIDITY``.
+
+        @param      key             key (see @see me make_key)
+        @param      uidvalidity     new ``UIDVALIDITY``
+        """
+        self._folders[key] = {"uidvalidity": uidvalidity, "last_uid": 0}
+
+    def save(self):
+        """
+        Saves the state if a filename was given.
+        """
+        if self.filename is None:
+            return
+        temp = self.filename + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(self._folders, f, indent=1, sort_keys=True)
+        os.replace(temp, self.filename)
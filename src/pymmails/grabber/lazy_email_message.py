@@ -0,0 +1,228 @@
+"""
+@file
+@brief Defines a mail whose parts are retrieved only when they are accessed.
+"""
+
+import email
+import email.utils
+from .email_message import EmailMessage
+from .mail_exception import MailException
+
+
+def _text(value):
+    "converts a value coming from a ``BODYSTRUCTURE`` into a string"
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return value
+
+
+def _params(values):
+    "converts a list of parameters into a dictionary"
+    res = {}
+    for i in range(0, len(values or []) - 1, 2):
+        key, value = _text(values[i]).lower(), _text(values[i + 1])
+        if key.endswith("*") and value is not None:
+            # RFC 2231 (filename*=utf-8''...), the value is decoded
+            # and encoded again when the header is built
+            key, value = email.utils.decode_params(
+                [("", ""), (key, value)])[1]
+            value = email.utils.unquote(
+                email.utils.collapse_rfc2231_value(value))
+        res[key] = value
+    return res
+
+
+def _is_message(structure):
+    "tells if a structure describes an encapsulated mail (``message/rfc822``)"
+    return (_text(structure[0]).lower() == "message" and
+            _text(structure[1]).lower() == "rfc822" and
+            len(structure) > 8 and isinstance(structure[8], list))
+
+
+def _children(structure):
+    "returns the parts of a multipart structure, they come first"
+    res = []
+    for s in structure:
+        if not isinstance(s, list):
+            break
+        res.append(s)
+    return res
+
+
+class LazyEmailMessage(EmailMessage):
+
+    """
+    Mail built from its header and its ``BODYSTRUCTURE``
+    (see `RFC 3501 <https://tools.ietf.org/html/rfc3501#section-7.4.2>`_).
+    The structure gives the type, the size and the filename of every part,
+    the content of a part is retrieved (``BODY.PEEK[2.1]``) the first
+    time it is accessed through *get_payload*. Walking through the parts
+    or looking at their headers does not retrieve anything.
+
+    .. exref::
+        :title: Save only PDF attachments
+
+        ::
+
+            for mail in box.enumerate_mails_in_folder("INBOX", lazy=True, batch_size=100):
+                mail.dump_attachments(
+                    "pdf", skip_function=lambda part: part.get_content_type() != "application/pdf")
+
+    Attributes *section* and *size* give the section number
+    and the size of the encoded content of a part.
+    An attached mail (``message/rfc822``) holds a nested mail
+    as @see cl EmailMessage does, its main headers come from
+    the ``ENVELOPE`` of the part and its parts are retrieved
+    the same way.
+    """
+
+    def __init__(self, *args, **kwargs):
+        EmailMessage.__init__(self, *args, **kwargs)
+        self.section = None
+        self.size = None
+        self._loader = None
+
+    @property
+    def is_loaded(self):
+        """
+        Tells if the content of the part was retrieved.
+        """
+        return self._loader is None
+
+    def load(self):
+        """
+        Retrieves the content of the part if it was not done yet.
+        """
+        if self._loader is None:
+            return
+        content = self._loader(self.section)  # pylint: disable=E1102
+        self._loader = None
+        self._payload = content.decode("ascii", "surrogateescape")
+
+    def get_payload(self, i=None, decode=False):
+        """
+        Retrieves the content of the part and calls
+        `Message.get_payload <https://docs.python.org/3/library/email.compat32-message.html#email.message.Message.get_payload>`_.
+        """
+        self.load()
+        return EmailMessage.get_payload(self, i=i, decode=decode)
+
+    def set_payload(self, payload, charset=None):
+        """
+        Replaces the content of the part, it is not retrieved anymore.
+        """
+        self._loader = None
+        EmailMessage.set_payload(self, payload, charset=charset)
+
+    @staticmethod
+    def create_from_structure(header, structure, loader):
+        """
+        Creates a mail from its header and its structure.
+
+        @param      header      header (bytes)
+        @param      structure   ``BODYSTRUCTURE`` parsed by
+                                :func:`parse_fetch_response <pymmails.grabber.imap_helper.parse_fetch_response>`
+        @param      loader      function ``loader(section) -> bytes`` which retrieves
+                                the content of a section
+        @return                 @see cl LazyEmailMessage
+        """
+        mail = email.message_from_bytes(header, _class=LazyEmailMessage)
+        LazyEmailMessage._attach(mail, structure, "", loader)
+        return mail
+
+    @staticmethod
+    def _attach(part, structure, number, loader):
+        "fills a part with its structure"
+        if not isinstance(structure, list) or len(structure) == 0:
+            raise MailException(
+                "unexpected BODYSTRUCTURE {0}".format(structure))
+        if isinstance(structure[0], list):
+            children = _children(structure)
+            subparts = []
+            for i, child in enumerate(children):
+                sub = LazyEmailMessage()
+                section = str(i + 1) if not number else "{0}.{1}".format(number, i + 1)
+                LazyEmailMessage._set_headers(sub, child)
+                LazyEmailMessage._attach(sub, child, section, loader)
+                subparts.append(sub)
+            part._payload = subparts
+            part.section = number or None
+            part.size = sum(sub.size for sub in subparts)
+        elif number and _is_message(structure):
+            # an encapsulated mail holds one mail as email.message_from_bytes does,
+            # the parts of its body are numbered from the section of the part
+            body = structure[8]
+            inner = LazyEmailMessage()
+            LazyEmailMessage._set_envelope(inner, structure[7])
+            LazyEmailMessage._set_headers(inner, body)
+            LazyEmailMessage._attach(
+                inner, body, number if isinstance(body[0], list) else number + ".1", loader)
+            part._payload = [inner]
+            part.section = number
+            part.size = int(structure[6]) if structure[6] is not None else 0
+        else:
+            part._payload = None
+            # the body of a mail with a single part is its text
+            part.section = number or "TEXT"
+            part.size = int(structure[6]) if structure[6] is not None else 0
+            part._loader = loader
+
+    @staticmethod
+    def _set_envelope(part, envelope):
+        "builds the main headers of an encapsulated mail from its ``ENVELOPE``"
+        if not isinstance(envelope, list) or len(envelope) < 10:
+            return
+
+        def addresses(values):
+            res = []
+            for value in values or []:
+                name, _, mailbox, host = [_text(v) for v in value[:4]]
+                if mailbox is None:
+                    # group syntax
+                    continue
+                address = mailbox if host is None else "{0}@{1}".format(mailbox, host)
+                res.append(email.utils.formataddr((name, address)))
+            return ", ".join(res)
+
+        sender = addresses(envelope[2])
+        # servers fill Sender and Reply-To with From when they are missing
+        for name, value in [("Date", _text(envelope[0])), ("Subject", _text(envelope[1])),
+                            ("From", sender), ("Sender", addresses(envelope[3])),
+                            ("Reply-To", addresses(envelope[4])),
+                            ("To", addresses(envelope[5])), ("Cc", addresses(envelope[6])),
+                            ("Bcc", addresses(envelope[7])),
+                            ("In-Reply-To", _text(envelope[8])),
+                            ("Message-ID", _text(envelope[9]))]:
+            if value and (name not in ("Sender", "Reply-To") or value != sender):
+                part[name] = value
+
+    @staticmethod
+    def _set_headers(part, structure):
+        "builds the headers of a part from its structure"
+        if isinstance(structure[0], list):
+            nb = len(_children(structure))
+            ctype = "multipart/" + _text(structure[nb]).lower()
+            params = _params(structure[nb + 1]) if len(structure) > nb + 1 else {}
+            disposition = structure[nb + 2] if len(structure) > nb + 2 else None
+            part.add_header("Content-Type", ctype, **params)
+        else:
+            ctype = "{0}/{1}".format(_text(structure[0]),
+                                     _text(structure[1])).lower()
+            part.add_header("Content-Type", ctype, **_params(structure[2]))
+            for name, value in [("Content-ID", structure[3]),
+                                ("Content-Description", structure[4]),
+                                ("Content-Transfer-Encoding", structure[5])]:
+                if value is not None:
+                    part[name] = _text(value)
+            # extension fields follow the number of lines for text,
+            # the envelope, the structure and the number of lines for message/rfc822
+            if ctype == "message/rfc822":
+                pos = 11
+            elif ctype.startswith("text/"):
+                pos = 9
+            else:
+                pos = 8
+            disposition = structure[pos] if len(structure) > pos else None
+        if isinstance(disposition, list) and disposition:
+            part.add_header("Content-Disposition", _text(disposition[0]).lower(),
+                            **(_params(disposition[1]) if len(disposition) > 1 else {}))
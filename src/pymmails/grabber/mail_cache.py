@@ -0,0 +1,251 @@
+"""
+@file
+@brief Defines a local cache storing raw mails retrieved by @see cl MailBoxImap.
+"""
+
+import os
+import gzip
+import time
+import sqlite3
+import hashlib
+import threading
+from email.parser import BytesHeaderParser
+
+
+class MailCache:
+
+    """
+    Stores raw mails on disk to avoid downloading them again.
+    Every mail is compressed and stored once in a file named after
+    the hash of its content, an index (:epkg:`sqlite3`) maps
+    ``(server, folder, UIDVALIDITY, UID)`` and the ``Message-ID``
+    to the content. The least recently used mails are removed
+    when the cache becomes bigger than *max_size*.
+    The total size is kept in memory, the access times and the new
+    mails are written into the index every *commit_every* operations
+    and when the cache is closed (or @see me flush is called).
+
+    .. exref::
+        :title: Cache mails on disk
+
+        ::
+
+            cache = MailCache("mail_cache", max_size=2 ** 30)
+            box = MailBoxImap(user, pwd, server, ssl=True, cache=cache)
+            box.login()
+            # the second loop does not download anything
+            for i in range(2):
+                for mail in box.enumerate_mails_in_folder("INBOX", batch_size=100):
+                    # ...
+            box.logout()
+            cache.close()
+    """
+
+    def __init__(self, folder, max_size=2 ** 30, compresslevel=6, commit_every=100):
+        """
+        @param      folder          folder storing the cache, it is created
+                                    if it does not exist
+        @param      max_size        maximum size of the compressed mails (bytes)
+        @param      compresslevel   compression level (see :epkg:`gzip`)
+        @param      commit_every    number of reads or additions before
+                                    the changes are committed
+        """
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.folder = folder
+        self.max_size = max_size
+        self.compresslevel = compresslevel
+        self.commit_every = commit_every
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(folder, "index.db3"),
+                                   check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS files (digest TEXT PRIMARY KEY, "
+                         "size INTEGER, last_access REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS mails (key TEXT PRIMARY KEY, "
+                         "message_id TEXT, digest TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS mails_message_id "
+                         "ON mails (message_id)")
+        self._db.commit()
+        self._total = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+        # digest -> last access not written yet
+        self._accessed = {}
+        self._changes = 0
+
+    @staticmethod
+    def make_key(server, folder, uidvalidity, uid):
+        """
+        Builds the key of a mail.
+
+        @param      server          server
+        @param      folder          folder
+        @param      uidvalidity     ``UIDVALIDITY`` of the folder
+        @param      uid             UID of the mail
+        @return                     string
+        """
+        return "{0}/{1}/{2}/{3}".format(server, folder, uidvalidity, uid)
+
+    def _filename(self, digest):
+        "returns the file storing a mail"
+        return os.path.join(self.folder, digest[:2], digest + ".gz")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM mails").fetchone()[0]
+
+    @property
+    def size(self):
+        """
+        Returns the size of the compressed mails.
+        """
+        with self._lock:
+            return self._total
+
+    def _write_access(self):
+        "writes the access times into the index"
+        if self._accessed:
+            self._db.executemany("UPDATE files SET last_access=? WHERE digest=?",
+                                 [(t, d) for d, t in self._accessed.items()])
+            self._accessed.clear()
+
+    def _changed(self):
+        "commits the changes every *commit_every* operations"
+        self._changes += 1
+        if self._changes >= self.commit_every:
+            self._write_access()
+            self._db.commit()
+            self._changes = 0
+
+    def flush(self):
+        """
+        Writes the access times and the new mails into the index.
+        """
+        with self._lock:
+            self._write_access()
+            self._db.commit()
+            self._changes = 0
+
+    def _read(self, digest):
+        "reads a mail and updates its last access"
+        name = self._filename(digest)
+        if not os.path.exists(name):
+            return None
+        self._accessed[digest] = time.time()
+        self._changed()
+        with gzip.open(name, "rb") as f:
+            return f.read()
+
+    def get(self, server, folder, uidvalidity, uid):
+        """
+        Returns a mail.
+
+        @param      server          server
+        @param      folder          folder
+        @param      uidvalidity     ``UIDVALIDITY`` of the folder
+        @param      uid             UID of the mail
+        @return                     bytes or None if the mail is not cached
+        """
+        key = self.make_key(server, folder, uidvalidity, uid)
+        with self._lock:
+            row = self._db.execute("SELECT digest FROM mails WHERE key=?",
+                                   (key,)).fetchone()
+            return None if row is None else self._read(row[0])
+
+    def get_by_message_id(self, message_id):
+        """
+        Returns a mail knowing its ``Message-ID``.
+
+        @param      message_id      ``Message-ID``
+        @return                     bytes or None if the mail is not cached
+        """
+        if not message_id:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT digest FROM mails WHERE message_id=?",
+                                   (message_id.strip(),)).fetchone()
+            return None if row is None else self._read(row[0])
+
+    def add(self, server, folder, uidvalidity, uid, raw):
+        """
+        Adds a mail to the cache and removes the least recently used
+        ones if the cache is too big.
+
+        @param      server          server
+        @param      folder          folder
+        @param      uidvalidity     ``UIDVALIDITY`` of the folder
+        @param      uid             UID of the mail
+        @param      raw             mail (bytes)
+        """
+        key = self.make_key(server, folder, uidvalidity, uid)
+        digest = hashlib.sha1(raw).hexdigest()
+        message_id = BytesHeaderParser().parsebytes(raw)["Message-ID"]
+        if message_id is not None:
+            message_id = str(message_id).strip()
+        name = self._filename(digest)
+        with self._lock:
+            row = self._db.execute("SELECT size FROM files WHERE digest=?",
+                                   (digest,)).fetchone()
+            if row is None or not os.path.exists(name):
+                if not os.path.exists(os.path.dirname(name)):
+                    os.makedirs(os.path.dirname(name))
+                temp = name + ".tmp"
+                with gzip.open(temp, "wb", compresslevel=self.compresslevel) as f:
+                    f.write(raw)
+                os.replace(temp, name)
+                size = os.path.getsize(name)
+                self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                                 (digest, size, time.time()))
+                self._accessed.pop(digest, None)
+                self._total += size - (0 if row is None else row[0])
+            self._db.execute("INSERT OR REPLACE INTO mails VALUES (?, ?, ?)",
+                             (key, message_id, digest))
+            if self._total > self.max_size:
+                self._evict()
+            self._changed()
+
+    def _evict(self):
+        "removes the least recently used mails until the cache is small enough"
+        self._write_access()
+        rows = self._db.execute(
+            "SELECT digest, size FROM files ORDER BY last_access")
+        removed = []
+        for digest, size in rows:
+            if self._total <= self.max_size:
+                break
+            removed.append(digest)
+            self._total -= size
+        for digest in removed:
+            name = self._filename(digest)
+            if os.path.exists(name):
+                os.remove(name)
+        self._db.executemany("DELETE FROM files WHERE digest=?",
+                             [(d,) for d in removed])
+        self._db.executemany("DELETE FROM mails WHERE digest=?",
+                             [(d,) for d in removed])
+        self._db.commit()
+        self._changes = 0
+
+    def clear(self):
+        """
+        Removes every mail.
+        """
+        with self._lock:
+            for (digest,) in self._db.execute("SELECT digest FROM files").fetchall():
+                name = self._filename(digest)
+                if os.path.exists(name):
+                    os.remove(name)
+            self._db.execute("DELETE FROM files")
+            self._db.execute("DELETE FROM mails")
+            self._db.commit()
+            self._accessed.clear()
+            self._total = 0
+            self._changes = 0
+
+    def close(self):
+        """
+        Writes the pending changes and closes the index.
+        """
+        with self._lock:
+            self._write_access()
+            self._db.commit()
+            self._db.close()
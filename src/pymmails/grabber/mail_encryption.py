@@ -0,0 +1,122 @@
+"""
+@file
+@brief Reads and writes encrypted mails by chunks, the format is the one
+used by :epkg:`pyquickhelper` (``encrypt_stream``, ``decrypt_stream``):
+the original size, the initialization vector and the content encrypted
+with AES (CBC mode).
+"""
+
+import struct
+from email.generator import BytesGenerator
+from email.parser import BytesFeedParser
+from pyquickhelper.filehelper.encryption import get_encryptor
+from .email_message import EmailMessage
+
+
+def enumerate_decrypted_chunks(key, filename, chunk_size=2 ** 16):
+    """
+    Decrypts a file chunk by chunk.
+
+    @param      key         key (bytes, 16, 24 or 32 bytes long)
+    @param      filename    encrypted file
+    @param      chunk_size  size of a chunk, it must be a multiple of 16
+    @return                 iterator on bytes
+    """
+    if chunk_size % 16 != 0:
+        raise ValueError("chunk_size must be a multiple of 16")
+    with open(filename, "rb") as f:
+        decryptor, size, _ = get_encryptor(key, "AES", in_stream=f)
+        while size > 0:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            chunk = decryptor.decrypt(chunk)
+            if len(chunk) > size:
+                # padding
+                chunk = chunk[:size]
+            size -= len(chunk)
+            yield chunk
+
+
+def read_encrypted_mail(key, filename, chunk_size=2 ** 16):
+    """
+    Decrypts and parses a mail, decrypted chunks are given to a
+    `BytesFeedParser <https://docs.python.org/3/library/email.parser.html#email.parser.BytesFeedParser>`_,
+    neither the encrypted file nor the decrypted mail are entirely held in memory.
+
+    @param      key         key (bytes, 16, 24 or 32 bytes long)
+    @param      filename    encrypted file
+    @param      chunk_size  size of a chunk, it must be a multiple of 16
+    @return                 @see cl EmailMessage
+    """
+    parser = BytesFeedParser(_factory=EmailMessage)
+    for chunk in enumerate_decrypted_chunks(key, filename, chunk_size=chunk_size):
+        parser.feed(chunk)
+    return parser.close()
+
+
+class _EncryptedWriter:
+    "encrypts what is written into a file by chunks"
+
+    def __init__(self, key, f, chunk_size):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._pending = []
+        self._pending_size = 0
+        self.size = 0
+        # the size is unknown yet, it is written at the end
+        self._encryptor = get_encryptor(key, "AES", out_stream=f, in_size=0)[0]
+
+    def write(self, data):
+        "encrypts data once there is enough of it"
+        self._pending.append(data)
+        self._pending_size += len(data)
+        self.size += len(data)
+        if self._pending_size >= self._chunk_size:
+            data = b"".join(self._pending)
+            keep = len(data) % 16
+            self._f.write(self._encryptor.encrypt(data[:len(data) - keep]))
+            self._pending = [data[len(data) - keep:]] if keep else []
+            self._pending_size = keep
+
+    def close(self):
+        "encrypts the remaining bytes, padded with spaces, and writes the size"
+        data = b"".join(self._pending)
+        if len(data) % 16 != 0:
+            data += b" " * (16 - len(data) % 16)
+        if data:
+            self._f.write(self._encryptor.encrypt(data))
+        self._f.seek(0)
+        self._f.write(struct.pack("<Q", self.size))
+
+
+def write_encrypted_mail(key, mail, filename, chunk_size=2 ** 16):
+    """
+    Encrypts a mail into a file which @see fn read_encrypted_mail or
+    ``decrypt_stream`` can read, the mail is converted into bytes
+    and encrypted by chunks.
+
+    @param      key         key (bytes, 16, 24 or 32 bytes long)
+    @param      mail        @see cl EmailMessage
+    @param      filename    destination
+    @param      chunk_size  size of a chunk, it must be a multiple of 16
+    @return                 size of the mail (not encrypted)
+
+    .. exref::
+        :title: Store mails encrypted
+
+        ::
+
+            for i, mail in enumerate(box.enumerate_mails_in_folder("INBOX")):
+                write_encrypted_mail(b"passwordpassword", mail,
+                                     "archive/INBOX/mail_%d.enc" % i)
+            archive = MailBoxMock("archive", b"passwordpassword")
+    """
+    if chunk_size % 16 != 0:
+        raise ValueError("chunk_size must be a multiple of 16")
+    with open(filename, "wb") as f:
+        writer = _EncryptedWriter(key, f, chunk_size)
+        gen = BytesGenerator(writer, mangle_from_=True, maxheaderlen=60)
+        gen.flatten(mail)
+        writer.close()
+    return writer.size
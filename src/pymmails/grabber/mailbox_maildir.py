@@ -0,0 +1,99 @@
+"""
+@file
+@brief Defines a mailbox reading a :epkg:`Maildir` directory.
+"""
+
+import os
+import email
+import mailbox
+from pyquickhelper.loghelper import noLOG
+from .email_message import EmailMessage
+from .mail_exception import MailException
+from .mailbox_mock import MailBoxMock, _parse_header
+
+
+class MailBoxMaildir(MailBoxMock):
+
+    """
+    Defines a mail box reading a :epkg:`Maildir` directory
+    (subdirectories ``cur``, ``new``, ``tmp``), folders follow the
+    Maildir++ convention (``.Sent``, ``.Archives.2015``), the root
+    is folder ``INBOX``. It exposes the same interface as @see cl MailBoxMock.
+
+    .. exref::
+        :title: Render mails stored in a Maildir directory
+
+        ::
+
+            box = MailBoxMaildir("/home/user/Maildir")
+            render = EmailMessageListRenderer(title="list of mails",
+                                              email_renderer=EmailMessageRenderer())
+            render.write(iter=box.enumerate_mails_in_folder("INBOX"),
+                         location="dest_folder", filename="index.html")
+    """
+
+    def __init__(self, folder, fLOG=noLOG):
+        """
+        @param  folder      Maildir directory
+        @param  fLOG        logging function
+        """
+        if not os.path.isdir(folder):
+            raise FileNotFoundError(
+                "unable to find directory '{0}'".format(folder))
+        MailBoxMock.__init__(self, folder, None, fLOG=fLOG)
+        self._maildir = mailbox.Maildir(folder, factory=None, create=False)
+
+    def folders(self):
+        """
+        returns the list of folder of the mail box
+        """
+        return ["INBOX"] + list(sorted(self._maildir.list_folders()))
+
+    def _get_folder(self, folder):
+        "returns the :class:`mailbox.Maildir` for a folder"
+        if folder == "INBOX":
+            return self._maildir
+        try:
+            return self._maildir.get_folder(folder)
+        except mailbox.NoSuchMailboxError as e:
+            raise MailException(
+                "unable to find folder '{0}'".format(folder)) from e
+
+    def enumerate_mails_in_folder(  # pylint: disable=W0221
+            self, folder, skip_function=None, pattern="ALL", skip_header=True):
+        """
+        enumerate all mails in a folder, in the order
+        they were delivered
+
+        @param      folder              folder
+        @param      skip_function       to skip mail or None to keep them all
+        @param      pattern             ``'ALL'`` by default, unused otherwise
+        @param      skip_header         see @see cl MailBoxMock
+        @return                         enumerator on mails
+        """
+        box = self._get_folder(folder)
+        on_header = skip_function is not None and skip_header
+        # keys start with the delivery time
+        for key in sorted(box.iterkeys()):
+            try:
+                if on_header and skip_function(self._read_header(box, key)):
+                    continue
+                raw = box.get_bytes(key)
+            except KeyError:
+                # the mail was removed meanwhile
+                continue
+            mail = email.message_from_bytes(raw, _class=EmailMessage)
+            if not on_header and skip_function is not None and skip_function(mail):
+                continue
+            yield mail
+
+    @staticmethod
+    def _read_header(box, key):
+        "reads the header of a mail until the first blank line"
+        lines = []
+        with box.get_file(key) as f:
+            for line in f:
+                if line in (b"\r\n", b"\n"):
+                    break
+                lines.append(line)
+        return _parse_header(b"".join(lines))
@@ -0,0 +1,315 @@
+"""
+@file
+@brief Defines a mailbox reading :epkg:`mbox` files.
+"""
+
+import os
+import re
+import sys
+import json
+import mmap
+import array
+import email
+import hashlib
+from pyquickhelper.loghelper import noLOG
+from .email_message import EmailMessage
+from .mail_exception import MailException
+from .mailbox_mock import MailBoxMock, _parse_header
+
+
+_unescape = re.compile(b"^>(>*From )", re.M)
+
+
+class MboxIndex:
+    """
+    Byte offsets of the mails stored in a :epkg:`mbox` file.
+    The index is stored in a file and only updated with the mails
+    appended to the mbox file since it was built, it is rebuilt
+    if the file was modified in another way.
+    """
+
+    #: version of the index format
+    version = 1
+
+    def __init__(self, filename, index_filename, fLOG=noLOG):
+        """
+        @param      filename        mbox file
+        @param      index_filename  file storing the index, None to keep it in memory
+        @param      fLOG            logging function
+        """
+        self.filename = filename
+        self.index_filename = index_filename
+        self.fLOG = fLOG
+        self.size = 0
+        self.mtime = None
+        # start and end of every mail (after the "From " line)
+        self.starts = array.array("q")
+        self.ends = array.array("q")
+        self._load()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _load(self):
+        "loads the index from its file"
+        if self.index_filename is None or not os.path.exists(self.index_filename):
+            return
+        try:
+            with open(self.index_filename, "rb") as f:
+                meta = json.loads(f.readline().decode("utf-8"))
+                if meta.get("version") != MboxIndex.version or \
+                        meta.get("byteorder") != sys.byteorder:
+                    return
+                data = array.array("q")
+                data.frombytes(f.read())
+        except (OSError, ValueError):
+            return
+        if len(data) != meta["count"] * 2:
+            return
+        self.starts = data[0::2]
+        self.ends = data[1::2]
+        self.size = meta["size"]
+        self.mtime = meta["mtime"]
+
+    def _save(self):
+        "saves the index in its file"
+        if self.index_filename is None:
+            return
+        meta = {"version": MboxIndex.version, "byteorder": sys.byteorder,
+                "size": self.size, "mtime": self.mtime, "count": len(self)}
+        data = array.array("q", [0]) * (len(self) * 2)
+        data[0::2] = self.starts
+        data[1::2] = self.ends
+        temp = self.index_filename + ".tmp"
+        try:
+            with open(temp, "wb") as f:
+                f.write(json.dumps(meta).encode("utf-8") + b"\n")
+                f.write(data.tobytes())
+            os.replace(temp, self.index_filename)
+        except OSError as e:
+            self.fLOG("[MboxIndex] unable to save index '{0}': {1}".format(
+                self.index_filename, e))
+
+    def update(self, mm=None):
+        """
+        Updates the index if the mbox file changed.
+
+        @param      mm      mbox file mapped in memory (``mmap.mmap``),
+                            the function opens the file if None
+        @return             self
+        """
+        stat = os.stat(self.filename)
+        if stat.st_size == self.size and stat.st_mtime_ns == self.mtime:
+            return self
+        if mm is None:
+            if stat.st_size == 0:
+                self.starts, self.ends = array.array("q"), array.array("q")
+                self.size, self.mtime = 0, stat.st_mtime_ns
+                self._save()
+            else:
+                with open(self.filename, "rb") as f:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        self._update(mapped, stat)
+                return self
+        self._update(mm, stat)
+        return self
+
+    def _update(self, mm, stat):
+        "scans the mails added since the last update"
+        size = len(mm)
+        pos = self.size
+        if pos == 0 or size <= pos or mm[pos - 1:pos] != b"\n" or \
+                mm[pos:pos + 5] != b"From ":
+            # the file was not only appended, everything is scanned again
+            self.starts, self.ends = array.array("q"), array.array("q")
+            pos = 0
+        self.fLOG("[MboxIndex] scan '{0}' from byte {1}".format(
+            self.filename, pos))
+        while pos < size:
+            eol = mm.find(b"\n", pos)
+            start = size if eol == -1 else eol + 1
+            nxt = mm.find(b"\nFrom ", start - 1) if start < size else -1
+            end = size if nxt == -1 else nxt + 1
+            self.starts.append(start)
+            self.ends.append(end)
+            pos = end
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+        self._save()
+
+    @staticmethod
+    def read(mm, start, end):
+        """
+        Returns a mail stored between two offsets, removes the blank line
+        which separates it from the next one and the quotes added to
+        lines starting with ``From `` (``>From``).
+
+        @param      mm      mbox file mapped in memory
+        @param      start   start of the mail
+        @param      end     end of the mail
+        @return             bytes
+        """
+        raw = mm[start:end]
+        if raw.endswith(b"\r\n\r\n"):
+            raw = raw[:-2]
+        elif raw.endswith(b"\n\n"):
+            raw = raw[:-1]
+        if b">From " in raw:
+            raw = _unescape.sub(b"\\1", raw)
+        return raw
+
+
+class MailBoxMbox(MailBoxMock):
+
+    """
+    Defines a mail box reading :epkg:`mbox` files, every file is a folder.
+    *folder* is a single mbox file (folder ``INBOX``) or a directory,
+    every file starting with ``From `` is then a folder named after its
+    relative path (extension ``.mbox`` and ``.sbd`` directories are removed).
+    The first time a folder is read, the mailbox builds an index
+    (@see cl MboxIndex) of the byte offsets of every mail and stores it,
+    the next enumerations only map the file in memory (``mmap``)
+    and do not look for the mail boundaries again.
+    It exposes the same interface as @see cl MailBoxMock.
+
+    .. exref::
+        :title: Render mails exported into a mbox file
+
+        ::
+
+            box = MailBoxMbox("export.mbox", index_folder="mbox_index")
+            print(box.count("INBOX"))
+            mail = box.read_mail("INBOX", 10)
+            render = EmailMessageListRenderer(title="list of mails",
+                                              email_renderer=EmailMessageRenderer())
+            render.write(iter=box.enumerate_mails_in_folder("INBOX"),
+                         location="dest_folder", filename="index.html")
+    """
+
+    def __init__(self, folder, index_folder=None, fLOG=noLOG):
+        """
+        @param  folder          mbox file or directory
+        @param  index_folder    directory storing the indexes, if None,
+                                the index of a file is stored next to it
+                                (same name with extension ``.idx``)
+        @param  fLOG            logging function
+        """
+        if not os.path.exists(folder):
+            raise FileNotFoundError(
+                "unable to find '{0}'".format(folder))
+        MailBoxMock.__init__(self, folder, None, fLOG=fLOG)
+        self._index_folder = index_folder
+        if index_folder is not None and not os.path.exists(index_folder):
+            os.makedirs(index_folder)
+        self._indexes = {}
+
+    @staticmethod
+    def _is_mbox(filename):
+        "tells if a file is a mbox file"
+        try:
+            with open(filename, "rb") as f:
+                return f.read(5) == b"From "
+        except OSError:
+            return False
+
+    def _files(self):
+        "returns a dictionary ``{ folder: filename }``"
+        if os.path.isfile(self._folder):
+            return {"INBOX": self._folder}
+        res = {}
+        for root, _, files in os.walk(self._folder):
+            for name in files:
+                full = os.path.join(root, name)
+                if not self._is_mbox(full):
+                    continue
+                rel = os.path.relpath(full, self._folder).split(os.sep)
+                rel = [r[:-4] if r.endswith(".sbd") else r for r in rel[:-1]] + \
+                    [rel[-1][:-5] if rel[-1].endswith(".mbox") else rel[-1]]
+                res["/".join(rel)] = full
+        return res
+
+    def folders(self):
+        """
+        returns the list of folder of the mail box
+        """
+        return list(sorted(self._files()))
+
+    def _filename(self, folder):
+        "returns the file storing a folder"
+        if os.path.isfile(self._folder):
+            if folder != "INBOX":
+                raise MailException(
+                    "unable to find folder '{0}'".format(folder))
+            return self._folder
+        files = self._files()
+        if folder not in files:
+            raise MailException("unable to find folder '{0}'".format(folder))
+        return files[folder]
+
+    def _get_index(self, folder):
+        "returns the index of a folder, it is not updated"
+        filename = self._filename(folder)
+        if filename not in self._indexes:
+            if self._index_folder is None:
+                index_filename = filename + ".idx"
+            else:
+                name = hashlib.sha1(os.path.abspath(filename).encode(
+                    "utf-8")).hexdigest()
+                index_filename = os.path.join(self._index_folder, name + ".idx")
+            self._indexes[filename] = MboxIndex(filename, index_filename,
+                                                fLOG=self.fLOG)
+        return self._indexes[filename]
+
+    def count(self, folder):
+        """
+        Returns the number of mails in a folder.
+
+        @param      folder      folder
+        @return                 number of mails
+        """
+        return len(self._get_index(folder).update())
+
+    def read_mail(self, folder, position):
+        """
+        Returns one mail.
+
+        @param      folder      folder
+        @param      position    position of the mail in the folder
+        @return                 @see cl EmailMessage
+        """
+        index = self._get_index(folder).update()
+        if position < 0 or position >= len(index):
+            raise IndexError("position {0} out of range [0, {1}[".format(
+                position, len(index)))
+        with open(index.filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                raw = MboxIndex.read(mm, index.starts[position],
+                                     index.ends[position])
+        return email.message_from_bytes(raw, _class=EmailMessage)
+
+    def enumerate_mails_in_folder(  # pylint: disable=W0221
+            self, folder, skip_function=None, pattern="ALL", skip_header=True):
+        """
+        enumerate all mails in a folder
+
+        @param      folder              folder
+        @param      skip_function       to skip mail or None to keep them all
+        @param      pattern             ``'ALL'`` by default, unused otherwise
+        @param      skip_header         see @see cl MailBoxMock
+        @return                         enumerator on mails
+        """
+        index = self._get_index(folder)
+        if os.path.getsize(index.filename) == 0:
+            return
+        on_header = skip_function is not None and skip_header
+        with open(index.filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                index.update(mm)
+                for start, end in zip(index.starts, index.ends):
+                    raw = MboxIndex.read(mm, start, end)
+                    if on_header and skip_function(_parse_header(raw)):
+                        continue
+                    mail = email.message_from_bytes(raw, _class=EmailMessage)
+                    if not on_header and skip_function is not None and skip_function(mail):
+                        continue
+                    yield mail
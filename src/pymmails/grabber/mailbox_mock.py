@@ -4,25 +4,101 @@
 """
 
 import os
-import email
-import email.message
+from collections import deque
+from email.parser import BytesHeaderParser, BytesFeedParser
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pyquickhelper.loghelper import noLOG
-from pyquickhelper.filehelper.encryption import decrypt_stream
 from .email_message import EmailMessage
+from .mail_exception import MailException
+from .mail_encryption import enumerate_decrypted_chunks, read_encrypted_mail
 from .mailboximap import MailBoxImap
+from .mailbox_mock_index import (
+    MailBoxMockIndex, header_fields, imap_date, match_person)
+
+
+def _read_mail(filename, password):
+    """
+    Reads, decrypts and parses a mail, the function
+    runs in the processes started by @see me enumerate_mails_in_folder.
+    Mails are read (or decrypted) and parsed chunk by chunk.
+    """
+    if password:
+        return read_encrypted_mail(password, filename)
+    parser = BytesFeedParser(_factory=EmailMessage)
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(2 ** 16), b""):
+            parser.feed(chunk)
+    return parser.close()
+
+
+def _parse_header(content):
+    """
+    Parses the header of a mail, *content* is cut at the first blank line
+    so that the returned message holds only the header.
+    """
+    pos = [p for p in [content.find(b"\n\r\n"), content.find(b"\n\n")] if p != -1]
+    if pos:
+        content = content[:min(pos) + 1]
+    return BytesHeaderParser(_class=EmailMessage).parsebytes(content)
+
+
+def _read_header(filename, password):
+    """
+    Reads the header of a mail, only the beginning of the file
+    is read or decrypted until the first blank line.
+    """
+    if password:
+        content = b""
+        for chunk in enumerate_decrypted_chunks(password, filename, chunk_size=2 ** 12):
+            content += chunk
+            if b"\n\r\n" in content or b"\n\n" in content:
+                break
+        return _parse_header(content)
+    lines = []
+    with open(filename, "rb") as f:
+        for line in f:
+            if line in (b"\r\n", b"\n"):
+                break
+            lines.append(line)
+    return BytesHeaderParser(_class=EmailMessage).parsebytes(b"".join(lines))
 
 
 class MailBoxMock(MailBoxImap):
 
     """
     Define a mail box reading from file (kind of mock).
+
+    Every method accepting a *skip_function* also accepts *skip_header*
+    (True by default). If True, *skip_function* receives a message
+    holding only the header (as @see cl MailBoxImap does), the header
+    is read (or decrypted) up to the first blank line and the rest
+    of the file is only read for the kept mails. If False,
+    *skip_function* receives the whole mail. The behaviour is the same
+    with or without an index and with or without *processes*.
+
+    .. exref::
+        :title: Search a local archive with an index
+
+        ::
+
+            box = MailBoxMock("archive", b"password", index="archive_index.db3")
+            # builds the index or adds the mails received since the last run
+            box.update_index()
+            for mail in box.enumerate_search_person("someone@example.com", "trav",
+                                                    date="1-Jan-2015"):
+                # ...
     """
 
-    def __init__(self, folder, pwd, fLOG=noLOG):
+    def __init__(self, folder, pwd, fLOG=noLOG, index=None):  # pylint: disable=W0231
         """
         @param  folder      folder to look into
         @param  pwd         password, in case mails are encrypted
         @param  fLOG        logging function
+        @param  index       None, a filename or an instance of
+                            @see cl MailBoxMockIndex, the index stores
+                            the header fields of every mail and is used
+                            to list folders and to search mails without
+                            reading every file
 
         For gmail, it is ``imap.gmail.com`` and ssl must be true
         """
@@ -30,6 +106,9 @@ class MailBoxMock(MailBoxImap):
         self._password = pwd
         self._folder = folder
         self.fLOG = fLOG
+        if index is not None and not isinstance(index, MailBoxMockIndex):
+            index = MailBoxMockIndex(index)
+        self.index = index
 
     def login(self):
         """
@@ -45,13 +124,48 @@ class MailBoxMock(MailBoxImap):
 
     def folders(self):
         """
-        returns the list of folder of the mail box
+        returns the list of folder of the mail box,
+        subfolders are returned as relative paths (``inbox/sub``),
+        if there is an index, the folders are taken from it
+        (see @see me update_index)
         """
+        if self.index is not None:
+            self._build_index()
+            return self.index.folders()
         res = []
-        for __, dirs, _ in os.walk(self._folder):
-            for name in dirs:
-                res.append(name)
-        return res
+        for dirpath, _, __ in os.walk(self._folder):
+            rel = os.path.relpath(dirpath, self._folder)
+            if rel != ".":
+                res.append(rel.replace(os.sep, "/"))
+        return list(sorted(res))
+
+    def _build_index(self, folder=None):
+        """
+        Builds the index the first time it is used, adds *folder*
+        if it is not indexed yet, the index is not updated otherwise.
+        """
+        if not self.index.is_built(self._folder):
+            self.update_index()
+        elif folder is not None and folder not in self.index.folders():
+            self.update_index(folder)
+
+    def update_index(self, folder=None, full=False):
+        """
+        Updates the index with the files added, modified
+        or removed since the last update. The index is built
+        the first time it is used, folders and searches are then
+        answered from it, this method must be called to take into
+        account the changes made in the folder afterwards.
+
+        @param      folder      folder, None for all folders
+        @param      full        if True, every file is read again
+        @return                 number of indexed files
+        """
+        if self.index is None:
+            raise MailException("the mailbox has no index")
+        return self.index.update(
+            self._folder, lambda name: _read_header(name, self._password),
+            folder=folder, full=full, fLOG=self.fLOG)
 
     def read_mail_from_file(self, filename):
         """
@@ -60,67 +174,196 @@ class MailBoxMock(MailBoxImap):
         @param      filename        filename
         @return                     MailMessage
         """
-        with open(filename, "rb") as f:
-            content = f.read()
-        if self._password:
-            b = decrypt_stream(self._password, content)
-        else:
-            b = content
-        return email.message_from_bytes(b, _class=EmailMessage)
+        return _read_mail(filename, self._password)
 
     def enumerate_mails_in_folder(  # pylint: disable=W0221
-            self, folder, skip_function=None, pattern="ALL"):
+            self, folder, skip_function=None, pattern="ALL", processes=None,
+            ordered=True, max_in_flight=None, skip_header=True):
         """
         enumerate all mails in a folder
 
         @param      folder              folder
         @param      skip_function       to skip mail or None to keep them all
         @param      pattern             ``'ALL'`` by default, unused otherwise
+        @param      processes           number of processes reading, decrypting
+                                        and parsing the mails, None to do it
+                                        in the current process
+        @param      ordered             if False, mails are returned as soon as
+                                        they are parsed and not in the order
+                                        of the files (only with *processes*)
+        @param      max_in_flight       maximum number of mails being processed
+                                        or waiting to be returned,
+                                        ``4 * processes`` if None
+        @param      skip_header         see @see cl MailBoxMock
         @return                         enumerator on mails
+
+        With *processes*, *skip_function* is called in the current process
+        and only the kept mails are given to the other processes.
+
+        .. exref::
+            :title: Decrypt an archive on every core
+
+            ::
+
+                box = MailBoxMock("archive", b"password")
+                for mail in box.enumerate_mails_in_folder("trav", processes=os.cpu_count()):
+                    # ...
         """
         local = os.path.join(self._folder, folder)
-        for name in os.listdir(local):
-            full = os.path.join(local, name)
-            if os.path.isfile(full):
-                mail = self.read_mail_from_file(full)
+        files = [os.path.join(local, name) for name in os.listdir(local)]
+        files = [name for name in files if os.path.isfile(name)]
+        if processes is None:
+            for mail in self._enumerate_files(files, skip_function, skip_header):
+                yield mail
+            return
+        on_header = skip_function is not None and skip_header
+        if on_header:
+            files = (name for name in files
+                     if not skip_function(_read_header(name, self._password)))
+        for mail in self._enumerate_parallel(files, processes, ordered,
+                                             max_in_flight):
+            if not on_header and skip_function is not None and skip_function(mail):
+                continue
+            yield mail
+
+    def _enumerate_files(self, files, skip_function, skip_header):
+        """
+        Reads mails from a list of files in the current process,
+        *skip_function* receives the header only if *skip_header* is True.
+        """
+        for name in files:
+            if skip_function is not None and skip_header:
+                if skip_function(_read_header(name, self._password)):
+                    continue
+                yield self.read_mail_from_file(name)
+            else:
+                mail = self.read_mail_from_file(name)
                 if skip_function is not None and skip_function(mail):
                     continue
                 yield mail
 
+    def _enumerate_parallel(self, files, processes, ordered, max_in_flight):
+        """
+        Reads mails with a pool of processes, no more than *max_in_flight*
+        mails are submitted and not returned yet.
+        """
+        if max_in_flight is None:
+            max_in_flight = processes * 4
+        if max_in_flight <= 0:
+            raise ValueError("max_in_flight must be strictly positive")
+        files = iter(files)
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            if ordered:
+                pending = deque()
+                for name in files:
+                    pending.append(executor.submit(
+                        _read_mail, name, self._password))
+                    if len(pending) >= max_in_flight:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            else:
+                pending = set()
+                for name in files:
+                    pending.add(executor.submit(
+                        _read_mail, name, self._password))
+                    if len(pending) >= max_in_flight:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+
     def enumerate_search_person(self,
                                 person,
                                 folder,
                                 skip_function=None,
                                 date=None,
                                 max_dest=5,
-                                body=True):
+                                body=True,
+                                batch_size=1,
+                                skip_header=True):
         """
         enumerates all mails in folder folder from a user or sent to a user
 
-        @param      person          person to look for
-        @param      folder          folder name
+        @param      person          person to look for or persons to look for
+        @param      folder          folder name or list of folders
         @param      skip_function   if not None, use this function on the header/body to avoid loading the entire message (and skip it)
-        @param      pattern         search pattern (see below)
+        @param      date            only mails sent this day or after (``1-Jan-2015``)
         @param      max_dest        maximum number of receivers
+                                    (only for mails the person did not send)
         @param      body            also extract the body
+        @param      batch_size      unused
+        @param      skip_header     see @see cl MailBoxMock
         @return                     iterator on (message)
+
+        The function follows the rules of @see me enumerate_search_person.
+        If the mailbox has an index, only the matching files are read
+        (see @see me update_index).
         """
-        return self.enumerate_mails_in_folder(folder=folder, skip_function=skip_function)
+        persons = person if isinstance(person, list) else [person]
+        persons = [p.lower() for p in persons]
+        return self._search(folder, skip_function, date,
+                            lambda fields: match_person(fields, persons, max_dest),
+                            {"persons": persons, "max_dest": max_dest},
+                            skip_header)
 
     def enumerate_search_subject(self,
                                  subject,
                                  folder,
                                  skip_function=None,
                                  date=None,
-                                 max_dest=5):
+                                 max_dest=5,
+                                 skip_header=True):
         """
-        enumerates all mails in folder folder with a subject verifying a regular expression
+        enumerates all mails in folder folder with a subject
+        containing a string (case insensitive)
 
         @param      subject         subject to look for
-        @param      folder          folder name
+        @param      folder          folder name or list of folders
         @param      skip_function   if not None, use this function on the header/body to avoid loading the entire message (and skip it)
-        @param      pattern         search pattern (see below)
-        @param      max_dest        maximum number of receivers
+        @param      date            only mails sent this day or after (``1-Jan-2015``)
+        @param      max_dest        unused
+        @param      skip_header     see @see cl MailBoxMock
         @return                     iterator on (message)
+
+        If the mailbox has an index, only the matching files are read
+        (see @see me update_index).
+        """
+        lower = subject.lower()
+        return self._search(folder, skip_function, date,
+                            lambda fields: lower in fields["subject"],
+                            {"subject": subject}, skip_header)
+
+    def _search(self, folder, skip_function, date, match, query, skip_header):
         """
-        raise NotImplementedError()
+        Enumerates the mails verifying *match* (a function taking
+        the result of @see fn header_fields), it searches
+        the index with *query* if there is one.
+        """
+        folders = folder if isinstance(folder, list) else [folder]
+        timestamp = imap_date(date) if date is not None else None
+        for fold in folders:
+            if self.index is not None:
+                self._build_index(fold)
+                names = self.index.search(fold, date=timestamp, **query)
+                local = os.path.join(self._folder, *fold.split("/"))
+                files = [os.path.join(local, name) for name in names]
+                for mail in self._enumerate_files(files, skip_function, skip_header):
+                    yield mail
+            else:
+                def skip(mail):
+                    "filters on the header and skip_function"
+                    fields = header_fields(mail)
+                    if timestamp is not None and (
+                            fields["date"] is None or fields["date"] < timestamp):
+                        return True
+                    if not match(fields):
+                        return True
+                    return skip_function is not None and skip_function(mail)
+
+                for mail in self.enumerate_mails_in_folder(
+                        fold, skip_function=skip, skip_header=skip_header):
+                    yield mail
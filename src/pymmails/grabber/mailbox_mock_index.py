@@ -0,0 +1,261 @@
+"""
+@file
+@brief Index of the headers of the mails stored by @see cl MailBoxMock.
+"""
+
+import os
+import sqlite3
+import datetime
+import threading
+import email.utils
+from pyquickhelper.loghelper import noLOG
+from .mail_exception import MailException
+
+
+def header_fields(header):
+    """
+    Extracts the fields stored in the index from the header of a mail.
+
+    @param      header      @see cl EmailMessage
+    @return                 dictionary, keys are ``sender``, ``receivers``,
+                            ``cc``, ``nb_receivers``, ``subject``, ``date``
+                            (timestamp or None), ``message_id``,
+                            texts are lower case
+    """
+    def field(name):
+        try:
+            value = header.get_field(name)
+        except (MailException, LookupError, ValueError):
+            value = header[name]
+        return "" if value is None else str(value).lower()
+
+    to = header["To"]
+    if to is None:
+        to = header["Delivered-To"]
+    nb = len(email.utils.getaddresses([str(to)])) if to is not None else 0
+    date = header["Date"]
+    try:
+        date = email.utils.parsedate_to_datetime(str(date)).timestamp() \
+            if date is not None else None
+    except (TypeError, ValueError, IndexError, OverflowError):
+        date = None
+    message_id = header["Message-ID"]
+    return {"sender": field("From"),
+            "receivers": field("To") or field("Delivered-To"),
+            "cc": field("Cc"), "nb_receivers": nb, "subject": field("Subject"),
+            "date": date,
+            "message_id": None if message_id is None else str(message_id).strip()}
+
+
+def imap_date(date):
+    """
+    Converts a date such as ``1-Feb-2013`` (IMAP format)
+    into a timestamp.
+    """
+    try:
+        return datetime.datetime.strptime(date, "%d-%b-%Y").timestamp()
+    except ValueError as e:
+        raise MailException(
+            "unable to interpret date '{0}', expecting 1-Feb-2013".format(date)) from e
+
+
+def match_person(fields, persons, max_dest):
+    """
+    Tells if a mail was sent by a person or to a person, a mail the person
+    did not send is kept only if it has no more than *max_dest* receivers.
+    It follows the rules of @see me enumerate_search_person.
+
+    @param      fields      dictionary returned by @see fn header_fields
+    @param      persons     list of persons (lower case)
+    @param      max_dest    maximum number of receivers
+    @return                 boolean
+    """
+    if any(p in fields["sender"] for p in persons):
+        return True
+    if not any(p in fields["receivers"] for p in persons):
+        return False
+    return max_dest <= 0 or 0 < fields["nb_receivers"] <= max_dest
+
+
+class MailBoxMockIndex:
+
+    """
+    Stores the headers fields of the mails of a @see cl MailBoxMock
+    in a :epkg:`sqlite3` database: sender, receivers, subject, date,
+    ``Message-ID``, size and modification time of every file.
+    It is built once and only files added, modified or removed
+    since the last update are processed, a file is read again
+    if its size or its modification time changed.
+    The index is only updated when @see me update is called.
+    """
+
+    _columns = ["folder", "name", "size", "mtime", "sender", "receivers", "cc",
+                "nb_receivers", "subject", "date", "message_id"]
+
+    def __init__(self, filename):
+        """
+        @param      filename        database file, it is created if it does not exist
+        """
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, "
+                         "value TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS folders (folder TEXT PRIMARY KEY, "
+                         "mtime REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS mails (folder TEXT, name TEXT, "
+                         "size INTEGER, mtime REAL, sender TEXT, receivers TEXT, "
+                         "cc TEXT, nb_receivers INTEGER, subject TEXT, date REAL, "
+                         "message_id TEXT, PRIMARY KEY (folder, name))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS mails_date ON mails (folder, date)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS mails_message_id "
+                         "ON mails (message_id)")
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM mails").fetchone()[0]
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        with self._lock:
+            self._db.close()
+
+    def folders(self):
+        """
+        Returns the indexed folders.
+        """
+        with self._lock:
+            return [r[0] for r in self._db.execute(
+                "SELECT folder FROM folders ORDER BY folder")]
+
+    def is_built(self, root):
+        """
+        Tells if the index was built for directory *root*.
+        """
+        root = os.path.abspath(root)
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key='root'").fetchone()
+        return row is not None and row[0] == root
+
+    def _check_root(self, root):
+        "removes everything if the index was built for another directory"
+        root = os.path.abspath(root)
+        row = self._db.execute("SELECT value FROM meta WHERE key='root'").fetchone()
+        if row is not None and row[0] == root:
+            return
+        self._db.execute("DELETE FROM folders")
+        self._db.execute("DELETE FROM mails")
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (root,))
+
+    def update(self, root, read_header, folder=None, full=False, fLOG=noLOG):
+        """
+        Updates the index.
+
+        @param      root            directory holding the folders
+        @param      read_header     function ``read_header(filename) -> EmailMessage``
+                                    returning the header of a mail
+        @param      folder          folder to update, None for all of them
+                                    (subdirectories are looked for again)
+        @param      full            if True, every file is read again even if
+                                    its size and its modification time did not change
+        @param      fLOG            logging function
+        @return                     number of indexed files
+        """
+        with self._lock:
+            self._check_root(root)
+            if folder is None:
+                names = []
+                for dirpath, _, __ in os.walk(root):
+                    rel = os.path.relpath(dirpath, root)
+                    if rel != ".":
+                        names.append(rel.replace(os.sep, "/"))
+                known = set(r[0] for r in self._db.execute("SELECT folder FROM folders"))
+                for name in known - set(names):
+                    self._db.execute("DELETE FROM folders WHERE folder=?", (name,))
+                    self._db.execute("DELETE FROM mails WHERE folder=?", (name,))
+            else:
+                names = [folder]
+            nb = 0
+            for name in names:
+                nb += self._update_folder(root, name, read_header, full, fLOG)
+            self._db.commit()
+            return nb
+
+    def _update_folder(self, root, folder, read_header, full, fLOG):
+        "updates one folder"
+        local = os.path.join(root, *folder.split("/"))
+        if not os.path.isdir(local):
+            raise MailException("unable to find folder '{0}'".format(folder))
+        # a file modified in place does not change the modification
+        # time of the folder, every file is checked
+        mtime = os.stat(local).st_mtime
+        known = {r[0]: (r[1], r[2]) for r in self._db.execute(
+            "SELECT name, size, mtime FROM mails WHERE folder=?", (folder,))}
+        current = set()
+        nb = 0
+        for entry in os.scandir(local):
+            if not entry.is_file():
+                continue
+            current.add(entry.name)
+            stat = entry.stat()
+            if not full and known.get(entry.name, None) == (stat.st_size, stat.st_mtime):
+                continue
+            fields = header_fields(read_header(entry.path))
+            fields.update({"folder": folder, "name": entry.name,
+                           "size": stat.st_size, "mtime": stat.st_mtime})
+            self._db.execute(
+                "INSERT OR REPLACE INTO mails VALUES ({0})".format(
+                    ", ".join("?" * len(MailBoxMockIndex._columns))),
+                [fields[c] for c in MailBoxMockIndex._columns])
+            nb += 1
+        for name in set(known) - current:
+            self._db.execute("DELETE FROM mails WHERE folder=? AND name=?",
+                             (folder, name))
+        self._db.execute("INSERT OR REPLACE INTO folders VALUES (?, ?)",
+                         (folder, mtime))
+        fLOG("[MailBoxMockIndex.update] folder '{0}': {1} new or modified files, "
+             "{2} removed".format(folder, nb, len(set(known) - current)))
+        return nb
+
+    def search(self, folder, persons=None, subject=None, date=None, max_dest=5):
+        """
+        Searches mails.
+
+        @param      folder      folder
+        @param      persons     list of persons (sender or receiver), None for all
+        @param      subject     substring of the subject, None for all
+        @param      date        only mails received this day or after
+                                (timestamp), None for all
+        @param      max_dest    see @see fn match_person
+        @return                 list of filenames relative to the folder
+                                sorted by date
+        """
+        conditions = ["folder=?"]
+        params = [folder]
+        if persons:
+            sub = []
+            for p in persons:
+                sub.append("instr(sender, ?) > 0")
+                params.append(p.lower())
+            cond = []
+            for p in persons:
+                cond.append("instr(receivers, ?) > 0")
+                params.append(p.lower())
+            rec = "({0})".format(" OR ".join(cond))
+            if max_dest > 0:
+                rec += " AND nb_receivers > 0 AND nb_receivers <= ?"
+                params.append(max_dest)
+            conditions.append("({0} OR ({1}))".format(" OR ".join(sub), rec))
+        if subject is not None:
+            conditions.append("instr(subject, ?) > 0")
+            params.append(subject.lower())
+        if date is not None:
+            conditions.append("date >= ?")
+            params.append(date)
+        query = "SELECT name FROM mails WHERE {0} ORDER BY date, name".format(
+            " AND ".join(conditions))
+        with self._lock:
+            return [r[0] for r in self._db.execute(query, params)]
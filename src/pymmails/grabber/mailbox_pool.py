@@ -0,0 +1,167 @@
+"""
+@file
+@brief Defines a pool of connections to an :epkg:`IMAP` server
+to enumerate several folders at the same time.
+"""
+
+import queue
+import threading
+from pyquickhelper.loghelper import noLOG
+from .mail_exception import MailException
+from .mailboximap import MailBoxImap
+
+
+class MailBoxImapPool:
+
+    """
+    Opens several connections to the same mail box (@see cl MailBoxImap)
+    and enumerates folders in parallel, every connection is used by
+    one thread.
+
+    .. exref::
+        :title: Fetch mails from many folders in parallel
+
+        ::
+
+            pool = MailBoxImapPool(user, pwd, server, ssl=True, size=8)
+            pool.login()
+            for mail in pool.enumerate_mails_in_folder(pool.folders(), batch_size=100):
+                # ...
+            pool.logout()
+    """
+
+    def __init__(self, user, pwd, server, ssl=False, fLOG=noLOG, port=None,
+                 size=4, cache=None, compress=False):
+        """
+        @param  user        user
+        @param  pwd         password
+        @param  server      server something like ``imap.domain.ext``
+        @param  ssl         select ``IMPA_SSL`` or ``IMAP``
+        @param  fLOG        logging function
+        @param  port        port, None for the default one
+        @param  size        number of connections
+        @param  cache       None or @see cl MailCache shared by all connections
+        @param  compress    compresses every connection (see @see cl MailBoxImap)
+        """
+        if size <= 0:
+            raise ValueError("size must be strictly positive")
+        self._user = user
+        self._password = pwd
+        self._server = server
+        self._ssl = ssl
+        self._port = port
+        self.size = size
+        self.cache = cache
+        self.compress = compress
+        self.fLOG = fLOG
+        self.boxes = []
+
+    def login(self):
+        """
+        Opens and authenticates all connections.
+        """
+        if self.boxes:
+            raise MailException("the pool is already connected")
+        for _ in range(self.size):
+            box = MailBoxImap(self._user, self._password, self._server,
+                              ssl=self._ssl, fLOG=self.fLOG, port=self._port,
+                              cache=self.cache, compress=self.compress)
+            box.login()
+            self.boxes.append(box)
+
+    def logout(self):
+        """
+        Closes all connections.
+        """
+        for box in self.boxes:
+            box.logout()
+        self.boxes = []
+
+    def folders(self):
+        """
+        Returns the list of folder of the mail box.
+        """
+        if not self.boxes:
+            raise MailException("the pool is not connected")
+        return self.boxes[0].folders()
+
+    def enumerate_mails_in_folder(self, folder, skip_function=None, date=None,
+                                  pattern="ALL", body=True, batch_size=1,
+                                  fields=None, queue_size=100):
+        """
+        Enumerates all mails in a list of folders, every connection
+        enumerates one folder at a time, the mails are returned
+        as soon as one thread retrieves them, folders are mixed.
+        The parameters are the same as @see me enumerate_mails_in_folder.
+
+        @param      folder          folder name or list of folders
+        @param      skip_function   if not None, use this function on the header to skip mails,
+                                    it is called from several threads
+        @param      date            add a date to the pattern
+        @param      pattern         search pattern
+        @param      body            add body
+        @param      batch_size      number of mails retrieved with a single command
+        @param      fields          restricts the header to these fields
+        @param      queue_size      maximum number of mails retrieved and waiting
+                                    for the caller
+        @return                     iterator on (message)
+
+        If one thread fails, the iterator raises the same exception.
+        """
+        if not self.boxes:
+            raise MailException("the pool is not connected")
+        folders = [folder] if not isinstance(folder, list) else folder
+        todo = queue.Queue()
+        for fold in folders:
+            todo.put(fold)
+        results = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            "puts an item unless the caller stopped"
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker(box):
+            "enumerates folders until there is none left"
+            try:
+                while not stop.is_set():
+                    try:
+                        fold = todo.get_nowait()
+                    except queue.Empty:
+                        break
+                    for mail in box.enumerate_mails_in_folder(
+                            fold, skip_function=skip_function, date=date,
+                            pattern=pattern, body=body, batch_size=batch_size,
+                            fields=fields):
+                        if not put(mail):
+                            break
+            except Exception as e:  # pylint: disable=W0703
+                put(e)
+            put(done)
+
+        boxes = self.boxes[:len(folders)]
+        threads = [threading.Thread(target=worker, args=(box,), daemon=True)
+                   for box in boxes]
+        for th in threads:
+            th.start()
+        try:
+            running = len(threads)
+            while running > 0:
+                item = results.get()
+                if item is done:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+            for th in threads:
+                th.join()
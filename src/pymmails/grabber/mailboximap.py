@@ -2,14 +2,28 @@
 @file
 @brief Defines a mailbox using IMAP
 """
+# pylint: disable=C0302
 
 import imaplib
 import re
+import ssl as ssl_module
+import select
+import time
 import email
 import email.message
+import email.utils
+from email.parser import BytesFeedParser
 from pyquickhelper.loghelper import noLOG
 from .mail_exception import MailException
 from .email_message import EmailMessage
+from .lazy_email_message import LazyEmailMessage
+from .imap_compress import IMAP4Deflate, IMAP4SSLDeflate
+from .imap_helper import (
+    format_uid_set, split_batches, parse_fetch_response, parse_uid_set,
+    parse_imap_list, list_to_dict, parse_internaldate, parse_thread,
+    uid_windows)
+from .imap_sync_state import ImapSyncState, ImapChange
+from .fetch_plan import FetchPlan, PlannedMail
 
 
 class MailBoxImap:
@@ -36,26 +50,124 @@ class MailBoxImap:
 
     expFolderName = re.compile('\\"(.*?)\\"')
 
-    def __init__(self, user, pwd, server, ssl=False, fLOG=noLOG):
+    #: fields usually enough to filter or list mails
+    summary_fields = ["Date", "From", "To", "Subject", "Message-ID"]
+
+    def __init__(self, user, pwd, server, ssl=False, fLOG=noLOG, port=None,
+                 cache=None, compress=False):
         """
         @param  user        user
         @param  pwd         password
         @param  server      server something like ``imap.domain.ext``
         @param  ssl         select ``IMPA_SSL`` or ``IMAP``
         @param  fLOG        logging function
+        @param  port        port, None for the default one
+        @param  cache       None or @see cl MailCache, mails are looked
+                            for in the cache before they are downloaded
+        @param  compress    compresses the connection after login
+                            if the server implements ``COMPRESS=DEFLATE``,
+                            it can be an integer (compression level)
 
         For gmail, it is ``imap.gmail.com`` and ssl must be true.
+        The cache is used by @see me enumerate_mails_in_folder
+        when the whole mail is retrieved. It looks for the UID of the mail
+        and then for its ``Message-ID`` if the header was retrieved
+        to call *skip_function*. Mails retrieved by chunks
+        (*stream_size*) are not cached.
+
+        Mails are mostly text or base64, they are 3 to 5 times smaller
+        once compressed (`RFC 4978 <https://tools.ietf.org/html/rfc4978>`_).
+        The compression is negotiated by @see me login,
+        @see me compression_stats returns the number of bytes
+        sent and received on the wire and before compression.
+
+        .. exref::
+            :title: Compress the connection
+
+            ::
+
+                box = MailBoxImap(user, pwd, server, ssl=True, compress=True)
+                box.login()
+                mails = list(box.enumerate_mails_in_folder("INBOX", batch_size=100))
+                print(box.compression_stats())
+                box.logout()
         """
-        self.M = imaplib.IMAP4_SSL(server) if ssl else imaplib.IMAP4(server)
+        if port is None:
+            port = imaplib.IMAP4_SSL_PORT if ssl else imaplib.IMAP4_PORT
+        self._ssl = ssl
+        self._port = port
+        self._compress = compress
+        self.M = self._connect(server)
         self._user = user
+        self._server = server
+        self._enabled = set()
+        # (folder, UIDVALIDITY) of the last selected folder
+        self._selected = None
         self._password = pwd
+        self.cache = cache
         self.fLOG = fLOG
 
+    def _connect(self, server):
+        "opens a connection"
+        if self._compress:
+            return (IMAP4SSLDeflate(server, self._port) if self._ssl
+                    else IMAP4Deflate(server, self._port))
+        return (imaplib.IMAP4_SSL(server, self._port) if self._ssl
+                else imaplib.IMAP4(server, self._port))
+
     def login(self):
         """
         login
         """
         self.M.login(self._user, self._password)
+        if self._compress:
+            self._start_compression()
+
+    def _start_compression(self):
+        """
+        Sends command ``COMPRESS DEFLATE`` and compresses
+        the connection if the server accepts it.
+
+        @return         True if the connection is compressed
+        """
+        if self.M.deflate is not None:
+            return True
+        if "COMPRESS=DEFLATE" not in self._capabilities():
+            self.fLOG("[MailBoxImap.login] the server does not implement COMPRESS=DEFLATE")
+            return False
+        typ, data = self.M.xatom("COMPRESS", "DEFLATE")
+        if typ != "OK":
+            self.fLOG("[MailBoxImap.login] COMPRESS DEFLATE failed: {0}".format(data))
+            return False
+        level = 6 if self._compress is True else self._compress
+        self.M.start_compression(level)
+        return True
+
+    def compression_stats(self):
+        """
+        Returns the number of bytes sent and received on the wire
+        and before compression since the compression started.
+
+        @return     dictionary (``wire_sent``, ``payload_sent``,
+                    ``wire_received``, ``payload_received``),
+                    None if the connection is not compressed
+        """
+        deflate = getattr(self.M, "deflate", None)
+        return None if deflate is None else deflate.to_dict()
+
+    def _reconnect(self):
+        """
+        Opens a new connection after the previous one was lost
+        and logs in again.
+        """
+        try:
+            self.M.shutdown()
+        except (OSError, imaplib.IMAP4.error):
+            pass
+        self.M = self._connect(self._server)
+        self._enabled = set()
+        self._selected = None
+        self.login()
 
     def logout(self):
         """
@@ -84,7 +196,9 @@ class MailBoxImap:
         return res
 
     def enumerate_mails_in_folder(
-            self, folder, skip_function=None, date=None, pattern="ALL", body=True):
+            self, folder, skip_function=None, date=None, pattern="ALL", body=True,
+            batch_size=1, fields=None, search_window=10000, lazy=False,
+            stream_size=None, sort=None):
         """
         Enumerates all mails in folder folder.
 
@@ -93,6 +207,18 @@ class MailBoxImap:
         @param      pattern         search pattern (see below)
         @param      date            add a date to the pattern
         @param      body            add body
+        @param      batch_size      number of mails retrieved with a single command
+        @param      fields          restricts the header given to *skip_function*
+                                    or returned when *body* is False to these fields,
+                                    all fields if None
+        @param      search_window   number of UIDs searched at once if the folder is too big
+                                    to be searched with a single command
+        @param      lazy            returns @see cl LazyEmailMessage, every part
+                                    is retrieved when it is accessed, *body* is ignored
+        @param      stream_size     mails bigger than this size (in bytes) are retrieved
+                                    by chunks of *stream_size* bytes, None to disable
+        @param      sort            returns the mails in this order, ``'REVERSE DATE'``
+                                    for example (see @see me _sort_uids)
         @return                     iterator on (message)
 
         The search pattern can be used to look for a subset of email.
@@ -118,20 +244,103 @@ class MailBoxImap:
 
         If the function generates an error such as::
 
-            imaplib.error: command: SEARCH => got more than 10000 bytes
+            imaplib.error: command: UID => got more than 1000000 bytes
+
+        The search is split into windows of *search_window* UIDs
+        (``UID 1:10000 <pattern>``, ``UID 10001:20000 <pattern>``, ...)
+        up to ``UIDNEXT``, mails are retrieved window by window.
+
+        Mails are identified by their UID and retrieved by batches
+        of *batch_size* mails with a command such as
+        ``UID FETCH 1:500 (RFC822)``. The function still returns
+        the mails one by one and never holds more than one batch
+        in memory. The default value (one mail per command)
+        minimizes the memory, a bigger value dramatically reduces
+        the number of round trips with the server.
+
+        .. exref::
+            :title: Fetch mails by batches
+
+            ::
+
+                box = MailBoxImap(user, pwd, server, ssl=True)
+                box.login()
+                for mail in box.enumerate_mails_in_folder("INBOX", batch_size=500):
+                    # ...
+                box.logout()
+
+        Parameter *fields* restricts the header to a few fields,
+        the server only sends them
+        (``BODY.PEEK[HEADER.FIELDS (Date From To Subject Message-ID)]``).
+        It is much faster when the function is used to list mails
+        or when *skip_function* only needs a couple of fields.
+
+        .. exref::
+            :title: List the subjects of a folder
+
+            ::
+
+                for mail in box.enumerate_mails_in_folder(
+                        "INBOX", body=False, batch_size=500,
+                        fields=MailBoxImap.summary_fields):
+                    print(mail.get_date(), mail["Subject"])
+
+        Parameter *lazy* only retrieves the header and the structure
+        of every mail (``BODYSTRUCTURE``). The type, the size and the
+        filename of every part are known but the content of a part
+        is retrieved (``BODY.PEEK[2]``) only when it is accessed.
+        *skip_function* receives the same message.
+        The content must be accessed while the folder is still
+        selected or once the enumeration is over, not while
+        another folder is enumerated.
+
+        :epkg:`imaplib` holds every fetched mail in a single bytes object
+        and the parser builds another copy, a mail of 40 Mb requires
+        more than 100 Mb. Parameter *stream_size* changes the way
+        big mails are retrieved. The function first gets the size of every
+        mail (``RFC822.SIZE``), mails bigger than *stream_size* are
+        retrieved alone by chunks (``BODY[]<0.1000000>``,
+        ``BODY[]<1000000.1000000>``, ...), every chunk is given to a
+        `BytesFeedParser <https://docs.python.org/3/library/email.parser.html#email.parser.BytesFeedParser>`_
+        as soon as it is received. The raw mail is never held entirely
+        in memory, the memory needed is the size of the parsed mail
+        plus one chunk, the parsed mail itself is as big as the mail.
+
+        .. exref::
+            :title: Retrieve big mails by chunks
+
+            ::
+
+                for mail in box.enumerate_mails_in_folder(
+                        "INBOX", batch_size=100, stream_size=2 ** 20):
+                    # ...
 
-        The keyword RECENT will be added to the search pattern
-        in order to retreive the newest mails.
+        Parameter *sort* asks the server to sort the mails
+        (``UID SORT (REVERSE DATE) US-ASCII ALL``) if it implements
+        extension ``SORT`` (`RFC 5256 <https://tools.ietf.org/html/rfc5256>`_).
+        Mails are retrieved in their final order, the caller can stop
+        after the first ones without retrieving the others.
+
+        .. exref::
+            :title: Retrieve the ten most recent mails
+
+            ::
+
+                import itertools
+                last = list(itertools.islice(box.enumerate_mails_in_folder(
+                    "INBOX", sort="REVERSE DATE", batch_size=10), 10))
         """
         if isinstance(folder, list):
             for fold in folder:
                 iter = self.enumerate_mails_in_folder(folder=fold,
-                                                      skip_function=skip_function, date=date, pattern=pattern, body=body)
+                                                      skip_function=skip_function, date=date, pattern=pattern, body=body,
+                                                      batch_size=batch_size, fields=fields,
+                                                      search_window=search_window, lazy=lazy,
+                                                      stream_size=stream_size, sort=sort)
                 for mail in iter:
                     yield mail
         else:
-            qfold = self.M._quote(folder)
-            self.M.select(qfold, readonly=True)
+            self._select(folder)
 
             if date is not None:
                 pdat = 'SINCE {0}'.format(date)
@@ -140,68 +349,1088 @@ class MailBoxImap:
                 else:
                     pattern += " " + pdat
 
-            try:
-                pattern.encode('ascii')
-                charset = None
-            except UnicodeEncodeError:
-                charset = 'UTF8'
-                pattern = pattern.encode('utf-8')
-                pattern = "".join(chr(b) for b in pattern)
+            if sort is None:
+                iter_uids = self._iter_search_uids(folder, pattern, window=search_window)
+            else:
+                iter_uids = [self._sort_uids(folder, sort, pattern)]
+            for uids in iter_uids:
+                self.fLOG("MailBoxImap.enumerate_mails_in_folder [folder={0} nbm={1} body={2} pattern={3}]".format(
+                    folder, len(uids), body, pattern))
 
-            try:
-                try:
-                    _, data = self.M.search(charset, pattern)
-                except UnicodeEncodeError:
-                    charset = None
-                    pattern = pattern.encode(
-                        'ascii', errors='ignore').decode("ascii")
-                    _, data = self.M.search(None, pattern)
-            except Exception as e:
-                if "SEARCH => got more " in str(e):
-                    if pattern == "ALL":
-                        pattern = "RECENT"
+                for _, mail in self._enumerate_uids(uids, skip_function=skip_function,
+                                                    body=body, batch_size=batch_size,
+                                                    fields=fields, lazy=lazy,
+                                                    stream_size=stream_size):
+                    yield mail
+
+            self.M.close()
+
+    def plan_fetch(self, folder, pattern="ALL", date=None, order=None,
+                   search_window=10000, batch_size=10000):
+        """
+        Looks for the mails matching a pattern and retrieves their size
+        (``RFC822.SIZE``) and their reception date (``INTERNALDATE``)
+        with a few commands (``UID FETCH 1:10000 (RFC822.SIZE INTERNALDATE)``).
+        The result is given to @see me enumerate_planned_mails.
+
+        @param      folder          folder name
+        @param      pattern         search pattern (see @see me enumerate_mails_in_folder)
+        @param      date            add a date to the pattern
+        @param      order           ``'smallest'``, ``'largest'``, ``'oldest'``,
+                                    ``'newest'`` or None for the UID order
+        @param      search_window   see @see me enumerate_mails_in_folder
+        @param      batch_size      number of mails described by one command
+        @return                     @see cl FetchPlan
+
+        .. exref::
+            :title: Estimate the size of an export before running it
+
+            ::
+
+                plan = box.plan_fetch("INBOX", order="newest")
+                print(len(plan), plan.transfer_size(max_size=2 ** 24))
+                for mail in box.enumerate_planned_mails(
+                        plan, max_size=2 ** 24, policy="header", batch_size=100):
+                    # ...
+        """
+        if date is not None:
+            pdat = 'SINCE {0}'.format(date)
+            pattern = pdat if pattern == "ALL" else pattern + " " + pdat
+        info = self._select(folder)
+        mails = []
+        for uids in self._iter_search_uids(folder, pattern, window=search_window):
+            for batch in split_batches(uids, batch_size):
+                values = self._fetch_uids(batch, "RFC822.SIZE INTERNALDATE")
+                for uid in batch:
+                    if uid not in values:
+                        continue
+                    mails.append(PlannedMail(
+                        uid, int(values[uid]["RFC822.SIZE"]),
+                        parse_internaldate(values[uid]["INTERNALDATE"])))
+        self.M.close()
+        plan = FetchPlan(folder, info.get("UIDVALIDITY", None), mails)
+        self.fLOG("[MailBoxImap.plan_fetch] {0}".format(plan))
+        return plan.sort(order)
+
+    def enumerate_planned_mails(self, plan, max_size=None, policy="skip",
+                                skip_function=None, body=True, batch_size=1,
+                                fields=None):
+        """
+        Retrieves the mails of a plan built by @see me plan_fetch
+        in the order of the plan.
+
+        @param      plan            @see cl FetchPlan
+        @param      max_size        maximum size of a mail, None for no limit
+        @param      policy          what to do with mails bigger than *max_size*,
+                                    ``'skip'`` to ignore them, ``'header'``
+                                    to only retrieve their header,
+                                    ``'stream'`` to retrieve them by chunks
+                                    of *max_size* bytes (see *stream_size* in
+                                    @see me enumerate_mails_in_folder)
+        @param      skip_function   if not None, use this function on the header to skip mails
+        @param      body            retrieve the whole mail or only the header
+        @param      batch_size      number of mails retrieved with a single command
+        @param      fields          restricts the header to these fields
+        @return                     iterator on (message)
+
+        The function raises an exception if the ``UIDVALIDITY``
+        of the folder changed since the plan was built.
+        """
+        if policy not in FetchPlan.policies:
+            raise ValueError("unknown policy '{0}', it should be in {1}".format(
+                policy, FetchPlan.policies))
+        info = self._select(plan.folder)
+        if info.get("UIDVALIDITY", None) != plan.uidvalidity:
+            raise MailException(
+                "UIDVALIDITY of folder '{0}' changed since the plan was built".format(
+                    plan.folder))
+
+        # consecutive mails sharing the same policy are retrieved together
+        groups = []
+        for mail in plan:
+            large = max_size is not None and mail.size > max_size
+            if large and policy == "skip":
+                continue
+            if groups and groups[-1][0] == large:
+                groups[-1][1].append(mail)
+            else:
+                groups.append((large, [mail]))
+
+        for large, mails in groups:
+            uids = [m.uid for m in mails]
+            if not large:
+                params = {"body": body}
+            elif policy == "header":
+                params = {"body": False}
+            else:
+                params = {"body": body, "stream_size": max_size,
+                          "sizes": {m.uid: m.size for m in mails}}
+            for _, mail in self._enumerate_uids(
+                    uids, skip_function=skip_function, batch_size=batch_size,
+                    fields=fields, **params):
+                yield mail
+        self.M.close()
+
+    def enumerate_threads(self, folder, pattern="ALL", algorithm="REFERENCES",
+                          skip_function=None, body=True, batch_size=1, fields=None):
+        """
+        Enumerates the conversations in a folder, the server
+        groups the mails (command ``THREAD``, extension ``THREAD=REFERENCES``
+        or ``THREAD=ORDEREDSUBJECT``, `RFC 5256 <https://tools.ietf.org/html/rfc5256>`_).
+
+        @param      folder          folder name
+        @param      pattern         search pattern
+        @param      algorithm       ``'REFERENCES'`` or ``'ORDEREDSUBJECT'``
+        @param      skip_function   if not None, use this function on the header to skip mails
+        @param      body            retrieve the whole mail or only the header
+        @param      batch_size      number of mails retrieved with a single command
+        @param      fields          restricts the header to these fields
+        @return                     iterator on lists ``[ (depth, mail) ]``,
+                                    one list per conversation, a mail
+                                    follows its parent
+
+        .. exref::
+            :title: Display conversations
+
+            ::
+
+                for thread in box.enumerate_threads("INBOX", body=False, batch_size=100):
+                    for depth, mail in thread:
+                        print("  " * depth, mail["Subject"])
+        """
+        algorithm = algorithm.upper()
+        if "THREAD=" + algorithm not in self._capabilities():
+            raise MailException(
+                "the server does not implement THREAD={0}".format(algorithm))
+        self._select(folder)
+        typ, data = self._uid_sort("THREAD", algorithm, pattern)
+        if typ != "OK":
+            raise MailException(
+                "unable to thread folder '{0}' with pattern '{1}'".format(folder, pattern))
+        threads = parse_thread(b" ".join(d for d in data if d))
+
+        position = {}
+        uids = []
+
+        def flatten(nodes, index, depth):
+            for uid, children in nodes:
+                position[uid] = (index, depth)
+                uids.append(uid)
+                flatten(children, index, depth + 1)
+
+        for index, thread in enumerate(threads):
+            flatten(thread, index, 0)
+        self.fLOG("[MailBoxImap.enumerate_threads] folder={0} nbm={1} threads={2}".format(
+            folder, len(uids), len(threads)))
+
+        current, group = None, []
+        for uid, mail in self._enumerate_uids(
+                uids, skip_function=skip_function, body=body,
+                batch_size=batch_size, fields=fields):
+            index, depth = position[uid]
+            if index != current and group:
+                yield group
+                group = []
+            current = index
+            group.append((depth, mail))
+        if group:
+            yield group
+        self.M.close()
+
+    def _sort_uids(self, folder, criteria, pattern="ALL"):
+        """
+        Returns the UIDs of the mails matching a pattern
+        sorted by the server (command ``SORT``). If the server
+        does not implement it, the function retrieves what it needs
+        and sorts the mails, it only supports criteria
+        ``ARRIVAL``, ``DATE``, ``SIZE`` in that case.
+
+        @param      folder      folder name (selected)
+        @param      criteria    sort criteria (``ARRIVAL``, ``CC``, ``DATE``,
+                                ``FROM``, ``SIZE``, ``SUBJECT``, ``TO``)
+                                preceded by ``REVERSE`` to reverse the order,
+                                ``'REVERSE DATE'`` for example
+        @param      pattern     search pattern
+        @return                 list of UIDs
+        """
+        if "SORT" in self._capabilities():
+            typ, data = self._uid_sort("SORT", "({0})".format(criteria), pattern)
+            if typ != "OK":
+                raise MailException(
+                    "unable to sort folder '{0}' with criteria '{1}'".format(folder, criteria))
+            return [int(u) for d in data if d for u in d.split()]
+
+        keys = []
+        reverse = False
+        for key in criteria.upper().split():
+            if key == "REVERSE":
+                reverse = True
+                continue
+            if key not in ("ARRIVAL", "DATE", "SIZE"):
+                raise MailException(
+                    "the server does not implement SORT, criterion {0} is not supported".format(key))
+            keys.append((key, reverse))
+            reverse = False
+        uids = self._search_uids(folder, pattern)
+        values = {}
+        for batch in split_batches(uids, 10000):
+            values.update(self._fetch_uids(
+                batch, "RFC822.SIZE INTERNALDATE BODY.PEEK[HEADER.FIELDS (DATE)]"))
+        uids = [uid for uid in uids if uid in values]
+
+        def sort_key(key, uid):
+            "returns the value of a criterion"
+            vals = values[uid]
+            if key == "SIZE":
+                return int(vals["RFC822.SIZE"])
+            arrival = parse_internaldate(vals["INTERNALDATE"])
+            if key == "DATE":
+                date = email.message_from_bytes(
+                    self._fetched_content(vals, "BODY[")).get("Date", None)
+                parsed = email.utils.parsedate_tz(date) if date else None
+                if parsed is not None:
+                    return email.utils.mktime_tz(parsed)
+            return arrival.timestamp()
+
+        # stable sorts, the last key first
+        for key, rev in reversed(keys):
+            uids.sort(key=lambda u, k=key: sort_key(k, u), reverse=rev)
+        return uids
+
+    def enumerate_new_mails(self, folder, state, skip_function=None, body=True,
+                            batch_size=1, fields=None):
+        """
+        Enumerates the mails received in a folder since the last call.
+
+        @param      folder          folder name or list of folders
+        @param      state           instance of @see cl ImapSyncState
+                                    or a filename to store it
+        @param      skip_function   if not None, use this function on the header to skip mails
+        @param      body            add body
+        @param      batch_size      number of mails retrieved with a single command
+        @param      fields          restricts the header to these fields (see
+                                    @see me enumerate_mails_in_folder)
+        @return                     iterator on (message)
+
+        The state stores for every folder its ``UIDVALIDITY``
+        and the last UID returned by the function. The next call
+        only searches for UIDs above that checkpoint. If the server
+        changes ``UIDVALIDITY``, UIDs are no longer valid and
+        the function retrieves the whole folder again.
+        A mail is considered as processed once the caller asks
+        for the next one, the checkpoint is saved when the iterator
+        ends, even if the caller stops before.
+
+        .. exref::
+            :title: Retrieve new mails only
+
+            ::
+
+                box = MailBoxImap(user, pwd, server, ssl=True)
+                box.login()
+                for mail in box.enumerate_new_mails("INBOX", "sync_state.json",
+                                                    batch_size=100):
+                    # ...
+                box.logout()
+        """
+        if not isinstance(state, ImapSyncState):
+            state = ImapSyncState(state)
+        if isinstance(folder, list):
+            for fold in folder:
+                for mail in self.enumerate_new_mails(
+                        fold, state, skip_function=skip_function, body=body,
+                        batch_size=batch_size, fields=fields):
+                    yield mail
+            return
+
+        key = ImapSyncState.make_key(self._user, self._server, folder)
+        info = self._select(folder)
+        uidvalidity = info.get("UIDVALIDITY", None)
+        uidnext = info.get("UIDNEXT", None)
+        check = state.get(key)
+        if check is None or check.get("uidvalidity", None) != uidvalidity:
+            if check is not None:
+                self.fLOG("[MailBoxImap.enumerate_new_mails] UIDVALIDITY changed "
+                          "for folder '{0}', full synchronisation".format(folder))
+            state.reset(key, uidvalidity)
+            check = state.get(key)
+
+        last_uid = check.get("last_uid", 0)
+        if uidnext is not None and check.get("uidnext", None) == uidnext:
+            # nothing new
+            uids = []
+        elif last_uid == 0:
+            uids = self._search_uids(folder, "ALL")
+        else:
+            uids = self._search_uids(folder, "UID {0}:*".format(last_uid + 1))
+            # UID n:* always returns the highest UID even if lower than n
+            uids = [u for u in uids if u > last_uid]
+
+        self.fLOG("[MailBoxImap.enumerate_new_mails] folder={0} nbm={1} "
+                  "last_uid={2}".format(folder, len(uids), last_uid))
+        try:
+            for uid, mail in self._enumerate_uids(
+                    uids, skip_function=skip_function, body=body,
+                    batch_size=batch_size, fields=fields):
+                yield mail
+                state.update(key, last_uid=uid)
+            state.update(key, last_uid=max([last_uid] + uids), uidnext=uidnext)
+        finally:
+            state.save()
+        self.M.close()
+
+    def enumerate_changes(self, folder, state):
+        """
+        Enumerates the changes (flags, removed mails) in a folder
+        since the last call. It requires the server to implement
+        extension :epkg:`CONDSTORE` or :epkg:`QRESYNC`.
+
+        @param      folder          folder name or list of folders
+        @param      state           instance of @see cl ImapSyncState
+                                    or a filename to store it
+        @return                     iterator on @see cl ImapChange
+
+        The state stores for every folder the highest
+        modification sequence (``HIGHESTMODSEQ``) the function
+        has seen. The first call returns the flags of every mail,
+        the next ones only return what changed since then:
+        the server only sends the mails whose modification sequence
+        is higher (``UID FETCH 1:* (FLAGS) (CHANGEDSINCE <modseq>)``).
+        With :epkg:`QRESYNC`, the server also sends the removed UIDs
+        (``VANISHED``). With :epkg:`CONDSTORE` only, the state keeps
+        the set of known UIDs to find the removed ones.
+        If the server changes ``UIDVALIDITY``, the function starts again
+        from an empty state. The state is only updated once the caller
+        went through all the changes.
+
+        .. exref::
+            :title: Mirror flags and deletions
+
+            ::
+
+                box = MailBoxImap(user, pwd, server, ssl=True)
+                box.login()
+                for change in box.enumerate_changes("INBOX", "sync_state.json"):
+                    if change.vanished:
+                        # remove change.uid
                     else:
-                        pattern += " RECENT"
-                    pattern = pattern.strip()
-                    self.fLOG("[MailBoxImap.enumerate_mails_in_folder] limit email "
-                              "search for folder '{0}' to recent emails with "
-                              "pattern '{1}'".format(folder, pattern))
-                    data = self.M.search(charset, pattern)[1]
+                        # update change.flags for change.uid
+                box.logout()
+        """
+        if not isinstance(state, ImapSyncState):
+            state = ImapSyncState(state)
+        if isinstance(folder, list):
+            for fold in folder:
+                for change in self.enumerate_changes(fold, state):
+                    yield change
+            return
+
+        caps = self._capabilities()
+        qresync = "QRESYNC" in caps
+        if not qresync and "CONDSTORE" not in caps:
+            raise MailException(
+                "server '{0}' supports neither CONDSTORE nor QRESYNC".format(
+                    self._server))
+        self._enable("QRESYNC" if qresync else "CONDSTORE")
+
+        key = ImapSyncState.make_key(self._user, self._server, folder)
+        info = self._select(folder)
+        uidvalidity = info.get("UIDVALIDITY", None)
+        highest = info.get("HIGHESTMODSEQ", None)
+        check = state.get(key)
+        if check is None or check.get("uidvalidity", None) != uidvalidity:
+            state.reset(key, uidvalidity)
+            check = state.get(key)
+        since = check.get("highestmodseq", None)
+        self.fLOG("[MailBoxImap.enumerate_changes] folder={0} since={1} "
+                  "highestmodseq={2}".format(folder, since, highest))
+
+        try:
+            if since is None or highest is None or since != highest:
+                if since is None:
+                    vanished = []
+                    changes = (self._fetch_flags() if info.get("EXISTS", 0) > 0
+                               else [])
                 else:
+                    vanished, changes = self._fetch_changes(since, qresync)
+                if not qresync:
+                    current = self._search_uids(folder, "ALL")
+                    known = parse_uid_set(check.get("uid_set", ""))
+                    vanished = sorted(set(known) - set(current))
+                for uid in vanished:
+                    yield ImapChange(uid, None, True, None)
+                for change in changes:
+                    yield change
+                if not qresync:
+                    state.update(key, uid_set=format_uid_set(current)
+                                 if current else "")
+                state.update(key, highestmodseq=highest)
+        finally:
+            state.save()
+        self.M.close()
+
+    def enumerate_watch(self, folder, timeout=None, skip_function=None, body=True,
+                        batch_size=1, fields=None, idle_timeout=29 * 60,
+                        poll_interval=30, reconnect=True):
+        """
+        Waits for new mails in a folder and returns them as soon as
+        they arrive. The function relies on command ``IDLE``
+        (`RFC 2177 <https://tools.ietf.org/html/rfc2177>`_),
+        the server announces new mails (``* 12 EXISTS``) and
+        the function only retrieves the new UIDs (``UID SEARCH UID n:*``).
+        If the server does not implement it, the function sends
+        a command ``NOOP`` every *poll_interval* seconds and only searches
+        for new UIDs if the number of mails the server announces
+        (``* 12 EXISTS``) changed.
+
+        @param      folder          folder name
+        @param      timeout         stops after this time (seconds),
+                                    None to wait forever
+        @param      skip_function   if not None, use this function on the header to skip mails
+        @param      body            retrieve the whole mail or only the header
+        @param      batch_size      number of mails retrieved with a single command
+        @param      fields          restricts the header to these fields
+        @param      idle_timeout    command ``IDLE`` is sent again after this time (seconds),
+                                    servers usually close idle connections after 30 minutes
+        @param      poll_interval   time between two commands ``NOOP`` (seconds)
+                                    if the server does not implement ``IDLE``
+        @param      reconnect       connects again if the connection is lost
+        @return                     iterator on (message)
+
+        Only the mails received after the function starts are returned.
+
+        .. exref::
+            :title: Process new mails as soon as they arrive
+
+            ::
+
+                box = MailBoxImap(user, pwd, server, ssl=True)
+                box.login()
+                for mail in box.enumerate_watch("INBOX"):
+                    # ...
+        """
+        end = None if timeout is None else time.perf_counter() + timeout
+        info = self._select(folder)
+        last_uid = self._last_uid(folder, info)
+        idle = "IDLE" in self._capabilities()
+        self.fLOG("[MailBoxImap.enumerate_watch] folder={0} last_uid={1} idle={2}".format(
+            folder, last_uid, idle))
+        while end is None or time.perf_counter() < end:
+            wait = idle_timeout if idle else poll_interval
+            if end is not None:
+                wait = max(min(wait, end - time.perf_counter()), 0)
+            try:
+                if idle:
+                    if not self._idle(wait):
+                        continue
+                else:
+                    time.sleep(wait)
+                    if not self._noop_changed(info):
+                        continue
+                uids = self._search_uids(folder, "UID {0}:*".format(last_uid + 1))
+                uids = [u for u in uids if u > last_uid]
+                for uid, mail in self._enumerate_uids(
+                        uids, skip_function=skip_function, body=body,
+                        batch_size=batch_size, fields=fields):
+                    last_uid = max(last_uid, uid)
+                    yield mail
+                if uids:
+                    last_uid = max([last_uid] + uids)
+            except (imaplib.IMAP4.abort, OSError) as e:
+                if not reconnect:
+                    raise
+                self.fLOG("[MailBoxImap.enumerate_watch] connection lost ({0}), "
+                          "connecting again".format(e))
+                self._reconnect()
+                uidvalidity = info.get("UIDVALIDITY", None)
+                info = self._select(folder)
+                if info.get("UIDVALIDITY", None) != uidvalidity:
+                    self.fLOG("[MailBoxImap.enumerate_watch] UIDVALIDITY changed "
+                              "for folder '{0}'".format(folder))
+                    last_uid = self._last_uid(folder, info)
+        self.M.close()
+
+    def watch(self, folder, callback, timeout=None, **kwargs):
+        """
+        Calls a function for every new mail in a folder,
+        see @see me enumerate_watch.
+
+        @param      folder          folder name
+        @param      callback        function ``callback(mail)``, the function
+                                    stops if it returns False
+        @param      timeout         stops after this time (seconds),
+                                    None to wait forever
+        @param      kwargs          see @see me enumerate_watch
+        @return                     number of processed mails
+        """
+        nb = 0
+        gen = self.enumerate_watch(folder, timeout=timeout, **kwargs)
+        for mail in gen:
+            nb += 1
+            if callback(mail) is False:
+                gen.close()
+                break
+        return nb
+
+    def _noop_changed(self, info):
+        """
+        Sends command ``NOOP`` and tells if the number of mails in the
+        selected folder changed (``* n EXISTS``, ``* n EXPUNGE``).
+
+        @param      info        information returned by @see me _select,
+                                key ``EXISTS`` is updated
+        @return                 boolean
+        """
+        typ, data = self.M.noop()
+        if typ != "OK":
+            raise MailException("NOOP failed: {0}".format(data))
+        expunged = self.M.untagged_responses.pop("EXPUNGE", [])
+        exists = self.M.untagged_responses.pop("EXISTS", [])
+        self.M.untagged_responses.pop("RECENT", None)
+        known = info.get("EXISTS", 0) - len(expunged)
+        info["EXISTS"] = int(exists[-1]) if exists else known
+        return info["EXISTS"] != known
+
+    def _last_uid(self, folder, info):
+        """
+        Returns the highest UID in the selected folder.
+        """
+        if "UIDNEXT" in info:
+            return info["UIDNEXT"] - 1
+        uids = self._search_uids(folder, "ALL")
+        return max(uids) if uids else 0
+
+    def _readable(self, timeout):
+        """
+        Tells if the server sent something within *timeout* seconds,
+        data may already be buffered by :epkg:`imaplib`.
+        """
+        sock = self.M.sock
+        previous = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            if self.M.file.peek(1):
+                return True
+        except (BlockingIOError, ssl_module.SSLWantReadError):
+            pass
+        finally:
+            sock.settimeout(previous)
+        readable, _, _ = select.select([sock], [], [], timeout)
+        return len(readable) > 0
+
+    def _idle(self, timeout):
+        """
+        Sends command ``IDLE`` and waits for new mails or until
+        *timeout* seconds, then sends ``DONE``.
+
+        @param      timeout     maximum waiting time (seconds)
+        @return                 True if the server announced a change
+                                (``EXISTS``, ``RECENT``)
+        """
+        tag = self.M._new_tag()  # pylint: disable=W0212
+        self.M.send(tag + b" IDLE\r\n")
+        try:
+            line = self.M.readline()
+            if not line.startswith(b"+"):
+                raise MailException("IDLE failed: {0!r}".format(line))
+            changed = False
+            end = time.perf_counter() + timeout
+            while not changed:
+                remaining = end - time.perf_counter()
+                if remaining <= 0 or not self._readable(remaining):
+                    break
+                line = self.M.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connection closed during IDLE")
+                changed = line.upper().rstrip().endswith((b"EXISTS", b"RECENT"))
+            self.M.send(b"DONE\r\n")
+            while True:
+                line = self.M.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connection closed during IDLE")
+                if line.startswith(tag + b" "):
+                    if not line[len(tag) + 1:].upper().startswith(b"OK"):
+                        raise MailException("IDLE failed: {0!r}".format(line))
+                    return changed
+                if line.upper().rstrip().endswith((b"EXISTS", b"RECENT")):
+                    changed = True
+        finally:
+            self.M.tagged_commands.pop(tag, None)
+
+    def _capabilities(self):
+        """
+        Returns the capabilities of the server.
+        """
+        return set(c.upper() for c in self.M.capabilities)
+
+    def _enable(self, capability):
+        """
+        Enables an extension (command ``ENABLE``) once per session.
+        """
+        if capability in self._enabled:
+            return
+        if "ENABLE" in self._capabilities():
+            self.M.enable(capability)
+        self._enabled.add(capability)
+
+    @staticmethod
+    def _parse_changes(data):
+        """
+        Converts the response to a command ``UID FETCH (FLAGS)``
+        into a list of @see cl ImapChange.
+        """
+        changes = []
+        for _, values in parse_fetch_response(data):
+            if "UID" not in values:
+                continue
+            modseq = values.get("MODSEQ", None)
+            if isinstance(modseq, list):
+                modseq = int(modseq[0])
+            changes.append(ImapChange(int(values["UID"]),
+                                      tuple(values.get("FLAGS", None) or []),
+                                      False, modseq))
+        return changes
+
+    def _fetch_flags(self):
+        """
+        Returns the flags of every mail in the selected folder.
+        """
+        typ, data = self.M.uid('FETCH', '1:*', '(UID FLAGS MODSEQ)')
+        if typ != "OK":
+            raise MailException("unable to fetch flags")
+        return self._parse_changes(data)
+
+    def _fetch_changes(self, since, qresync):
+        """
+        Returns the mails which changed or vanished since
+        a modification sequence in the selected folder.
+
+        @param      since       modification sequence
+        @param      qresync     use extension :epkg:`QRESYNC` to get removed mails
+        @return                 vanished uids, list of @see cl ImapChange
+        """
+        # removes any previous VANISHED response
+        self.M.response('VANISHED')
+        typ, data = self.M.uid('FETCH', '1:*', '(UID FLAGS)',
+                               '(CHANGEDSINCE {0}{1})'.format(
+                                   since, " VANISHED" if qresync else ""))
+        if typ != "OK":
+            raise MailException(
+                "unable to fetch changes since modseq {0}".format(since))
+        vanished = []
+        _, van = self.M.response('VANISHED')
+        for v in van:
+            if v is None:
+                continue
+            if isinstance(v, bytes):
+                v = v.decode("ascii")
+            vanished.extend(parse_uid_set(v.replace("(EARLIER)", "")))
+        return sorted(vanished), self._parse_changes(data)
+
+    def _select(self, folder):
+        """
+        Selects a folder (read only) and returns the information
+        the server sent (``UIDVALIDITY``, ``UIDNEXT``, ``EXISTS``,
+        ``HIGHESTMODSEQ``).
+
+        @param      folder      folder name
+        @return                 dictionary
+        """
+        qfold = self.M._quote(folder)
+        typ, data = self.M.select(qfold, readonly=True)
+        info = {}
+        if typ == "OK" and data and data[0] is not None:
+            info["EXISTS"] = int(data[0])
+        for code in ["UIDVALIDITY", "UIDNEXT", "HIGHESTMODSEQ"]:
+            _, value = self.M.response(code)
+            if value and value[-1] is not None:
+                info[code] = int(value[-1])
+        self._selected = (folder, info.get("UIDVALIDITY", None))
+        return info
+
+    def _search_uids(self, folder, pattern, window=10000):
+        """
+        Searches the selected folder and returns the list of UIDs.
+
+        @param      folder          folder name
+        @param      pattern         search pattern
+        @param      window          see @see me _iter_search_uids
+        @return                     list of integers
+        """
+        uids = []
+        for part in self._iter_search_uids(folder, pattern, window=window):
+            uids.extend(part)
+        return uids
+
+    def _iter_search_uids(self, folder, pattern, window=10000):
+        """
+        Searches the selected folder and returns the UIDs by chunks.
+        If the server sends a response too long for :epkg:`imaplib`
+        (``got more than 1000000 bytes``), the search is split into
+        windows of *window* UIDs (``UID 1:10000 <pattern>``,
+        ``UID 10001:20000 <pattern>``, ...) up to ``UIDNEXT``.
+        A window still too big is split again.
+
+        @param      folder          folder name
+        @param      pattern         search pattern
+        @param      window          number of UIDs in a window
+        @return                     iterator on lists of integers
+        """
+        charset, pattern = self._pattern_charset(pattern)
+        try:
+            uids, charset, pattern = self._uid_search(charset, pattern)
+        except imaplib.IMAP4.error as e:
+            if "got more than" not in str(e):
+                raise MailException(
+                    "Unable to search for pattern: '{0}' "
+                    "(charset='{1}')\nin subfolder {2}\n"
+                    "check the folder you search for is right."
+                    .format(pattern, charset, self.M._quote(folder))) from e
+            uids = None
+        if uids is not None:
+            yield uids
+            return
+
+        self._resync_after_overflow()
+        uidnext = self._uidnext(folder)
+        self.fLOG("[MailBoxImap._iter_search_uids] too many results, split the "
+                  "search for folder '{0}' into windows of {1} UIDs "
+                  "(UIDNEXT={2})".format(folder, window, uidnext))
+        windows = uid_windows(uidnext, window)
+        while windows:
+            lo, hi = windows.pop(0)
+            sub = "UID {0}:{1} {2}".format(lo, hi, pattern)
+            try:
+                uids = self._uid_search(charset, sub)[0]
+            except imaplib.IMAP4.error as e:
+                if "got more than" not in str(e) or lo == hi:
                     raise MailException(
-                        "Unable to search for pattern: '{0}' "
-                        "(charset='{1}')\nin subfolder {2}\n"
-                        "check the folder you search for is right."
-                        .format(pattern, charset, qfold)) from e
-
-            spl = data[0].split()
-            self.fLOG("MailBoxImap.enumerate_mails_in_folder [folder={0} nbm={1} body={2} pattern={3}]".format(
-                folder, len(spl), body, pattern))
-
-            for num in spl:
-                if skip_function is not None:
-                    data = self.M.fetch(num, '(BODY[HEADER])')[1]
-                    emailBody = data[0][1]
-                    mail = email.message_from_bytes(
-                        emailBody, _class=EmailMessage)
-                    if skip_function(mail):
+                        "Unable to search for pattern: '{0}' in subfolder {1}"
+                        .format(sub, self.M._quote(folder))) from e
+                self._resync_after_overflow()
+                middle = (lo + hi) // 2
+                windows.insert(0, (middle + 1, hi))
+                windows.insert(0, (lo, middle))
+                continue
+            if uids:
+                yield uids
+
+    @staticmethod
+    def _pattern_charset(pattern):
+        """
+        Returns the charset of a search pattern, None if it is ascii,
+        and the pattern to send, a non ascii pattern is encoded in utf-8.
+        """
+        try:
+            pattern.encode('ascii')
+            return None, pattern
+        except UnicodeEncodeError:
+            return 'UTF8', "".join(chr(b) for b in pattern.encode('utf-8'))
+
+    def _uid_sort(self, command, argument, pattern):
+        """
+        Runs command ``UID SORT`` or ``UID THREAD``, the charset
+        is chosen and non ascii characters are removed if the server
+        does not accept them as @see me _uid_search does.
+
+        @param      command     ``SORT`` or ``THREAD``
+        @param      argument    sort criteria or thread algorithm
+        @param      pattern     search pattern
+        @return                 typ, data
+        """
+        charset, encoded = self._pattern_charset(pattern)
+        try:
+            return self.M.uid(command, argument, charset or "US-ASCII", encoded)
+        except UnicodeEncodeError:
+            encoded = pattern.encode('ascii', errors='ignore').decode("ascii")
+            return self.M.uid(command, argument, "US-ASCII", encoded)
+
+    def _uid_search(self, charset, pattern):
+        """
+        Runs command ``UID SEARCH``, removes non ascii characters
+        if the server does not accept them.
+
+        @param      charset     charset or None
+        @param      pattern     search pattern
+        @return                 list of uids, charset, pattern
+        """
+        def search(charset, pattern):
+            "local function"
+            if charset is None:
+                return self.M.uid('SEARCH', pattern)
+            return self.M.uid('SEARCH', 'CHARSET', charset, pattern)
+
+        try:
+            typ, data = search(charset, pattern)
+        except UnicodeEncodeError:
+            charset = None
+            pattern = pattern.encode(
+                'ascii', errors='ignore').decode("ascii")
+            typ, data = search(None, pattern)
+        if typ != "OK":
+            raise MailException(
+                "Unable to search for pattern: '{0}' (charset='{1}'): {2}"
+                .format(pattern, charset, data))
+        if data is None or data[0] is None:
+            return [], charset, pattern
+        return [int(_) for _ in data[0].split()], charset, pattern
+
+    def _resync_after_overflow(self):
+        """
+        :epkg:`imaplib` raises an exception when a line is too long
+        and leaves the rest of the response in the socket.
+        The function reads it until it reaches the completion
+        of the last command.
+        """
+        tag = self.M.tagpre + str(self.M.tagnum - 1).encode("ascii")
+        while True:
+            line = self.M.file.readline()
+            if not line or line.startswith(tag + b" "):
+                break
+        self.M.tagged_commands.pop(tag, None)
+        self.M.untagged_responses.pop('SEARCH', None)
+
+    def _uidnext(self, folder):
+        """
+        Returns the next UID of a folder (command ``STATUS``).
+        """
+        typ, data = self.M.status(self.M._quote(folder), '(UIDNEXT)')
+        if typ != "OK":
+            raise MailException(
+                "unable to get the status of folder {0}".format(folder))
+        values = parse_imap_list(data[0])
+        return int(list_to_dict(values[-1])["UIDNEXT"])
+
+    def _fetch_uids(self, uids, items):
+        """
+        Retrieves items for a list of UIDs with a single command
+        ``UID FETCH``.
+
+        @param      uids        list of UIDs
+        @param      items       items to fetch such as ``'RFC822'``
+        @return                 dictionary ``{ uid: { item: value } }``
+        """
+        typ, data = self.M.uid('FETCH', format_uid_set(uids),
+                               '(UID {0})'.format(items))
+        if typ != "OK":
+            raise MailException(
+                "unable to fetch {0} for uids {1}".format(items, uids))
+        res = {}
+        for _, values in parse_fetch_response(data):
+            if "UID" in values:
+                res[int(values["UID"])] = values
+        return res
+
+    @staticmethod
+    def _fetched_content(values, prefix):
+        """
+        Returns the first fetched item starting with *prefix*,
+        the server may slightly change the item name
+        (``BODY.PEEK[HEADER]`` becomes ``BODY[HEADER]``).
+        """
+        for k, v in values.items():
+            if k.startswith(prefix):
+                return v
+        raise MailException("unable to find '{0}' in {1}".format(
+            prefix, list(values)))
+
+    @staticmethod
+    def _header_item(fields=None):
+        """
+        Returns the item to fetch to get the header
+        or only some fields of the header.
+        """
+        if fields is None:
+            return 'BODY.PEEK[HEADER]'
+        return 'BODY.PEEK[HEADER.FIELDS ({0})]'.format(" ".join(fields))
+
+    def _enumerate_uids(self, uids, skip_function=None, body=True, batch_size=1,
+                        fields=None, lazy=False, stream_size=None, sizes=None):
+        """
+        Retrieves mails for a list of UIDs in the selected folder
+        by batches of *batch_size* mails.
+
+        @param      uids            list of UIDs
+        @param      skip_function   if not None, use this function on the header to skip mails
+        @param      body            retrieve the whole mail or only the header
+        @param      batch_size      number of mails retrieved with a single command
+        @param      fields          restricts the header to these fields
+        @param      lazy            returns @see cl LazyEmailMessage
+        @param      stream_size     mails bigger than this size are retrieved
+                                    by chunks (see @see me _fetch_streamed)
+        @param      sizes           sizes of the mails if they are known
+                                    (dictionary ``{ uid: size }``)
+        @return                     iterator on (uid, message)
+        """
+        if lazy:
+            for res in self._enumerate_lazy_uids(uids, skip_function=skip_function,
+                                                 batch_size=batch_size, fields=fields):
+                yield res
+            return
+        for batch in split_batches(uids, batch_size):
+            headers = None
+            message_ids = {}
+            if skip_function is not None or not body:
+                heads = self._fetch_uids(batch, self._header_item(fields))
+                headers = {}
+                keep = []
+                for uid in batch:
+                    if uid not in heads:
                         continue
-                if body:
-                    data = self.M.fetch(num, '(RFC822)')[1]
-                    emailBody = data[0][1]
                     mail = email.message_from_bytes(
-                        emailBody, _class=EmailMessage)
-                elif skip_function is None:
-                    data = self.M.fetch(num, '(BODY[HEADER])')[1]
-                    emailBody = data[0][1]
-                    mail = email.message_from_bytes(
-                        emailBody, _class=EmailMessage)
-                yield mail
+                        self._fetched_content(heads.pop(uid), "BODY["),
+                        _class=EmailMessage)
+                    if skip_function is not None and skip_function(mail):
+                        continue
+                    if not body:
+                        headers[uid] = mail
+                    message_ids[uid] = mail["Message-ID"]
+                    keep.append(uid)
+                batch = keep
+            if not body:
+                for uid in batch:
+                    yield uid, headers.pop(uid)
+                continue
+            if len(batch) == 0:
+                continue
+            cached = self._from_cache(batch, message_ids)
+            missing = [uid for uid in batch if uid not in cached]
+            large = {}
+            if stream_size is not None and missing:
+                if sizes is None:
+                    known = {uid: int(values["RFC822.SIZE"]) for uid, values in
+                             self._fetch_uids(missing, 'RFC822.SIZE').items()}
+                else:
+                    known = {uid: sizes[uid] for uid in missing if uid in sizes}
+                for uid, size in known.items():
+                    if size > stream_size:
+                        large[uid] = size
+            small = [uid for uid in missing if uid not in large]
+            contents = self._fetch_uids(small, 'RFC822') if small else {}
+            for uid in batch:
+                if uid in cached:
+                    yield uid, email.message_from_bytes(cached.pop(uid), _class=EmailMessage)
+                    continue
+                if uid in large:
+                    yield uid, self._fetch_streamed(uid, large[uid], stream_size)
+                    continue
+                if uid not in contents:
+                    continue
+                emailBody = contents.pop(uid)["RFC822"]
+                if self.cache is not None:
+                    self.cache.add(self._server, self._selected[0],
+                                   self._selected[1], uid, emailBody)
+                yield uid, email.message_from_bytes(emailBody, _class=EmailMessage)
 
-            self.M.close()
+    def _from_cache(self, uids, message_ids):
+        """
+        Looks for mails in the cache (see @see cl MailCache).
+
+        @param      uids            list of UIDs in the selected folder
+        @param      message_ids     dictionary ``{ uid: Message-ID }`` if known
+        @return                     dictionary ``{ uid: bytes }``
+        """
+        if self.cache is None:
+            return {}
+        folder, uidvalidity = self._selected
+        res = {}
+        for uid in uids:
+            raw = self.cache.get(self._server, folder, uidvalidity, uid)
+            if raw is None and message_ids.get(uid, None):
+                raw = self.cache.get_by_message_id(message_ids[uid])
+                if raw is not None:
+                    self.cache.add(self._server, folder, uidvalidity, uid, raw)
+            if raw is not None:
+                res[uid] = raw
+        self.fLOG("MailBoxImap._from_cache [folder={0} found={1}/{2}]".format(
+            folder, len(res), len(uids)))
+        return res
+
+    def _fetch_streamed(self, uid, size, chunk_size):
+        """
+        Retrieves a mail by chunks of *chunk_size* bytes
+        (``BODY[]<offset.chunk_size>``), every chunk is parsed
+        when it is received, only one raw chunk is held at a time.
+
+        @param      uid             UID
+        @param      size            size of the mail (``RFC822.SIZE``)
+        @param      chunk_size      size of a chunk
+        @return                     @see cl EmailMessage
+        """
+        parser = BytesFeedParser(_factory=EmailMessage)
+        offset = 0
+        while offset < size:
+            values = self._fetch_uids(
+                [uid], 'BODY[]<{0}.{1}>'.format(offset, chunk_size))
+            if uid not in values:
+                raise MailException("mail {0} was removed".format(uid))
+            chunk = self._fetched_content(values.pop(uid), "BODY[")
+            if not chunk:
+                break
+            parser.feed(chunk)
+            offset += len(chunk)
+            del chunk
+        self.fLOG("MailBoxImap._fetch_streamed [uid={0} size={1}]".format(
+            uid, offset))
+        return parser.close()
+
+    def _enumerate_lazy_uids(self, uids, skip_function=None, batch_size=1, fields=None):
+        """
+        Retrieves the header and the structure of mails for a list of UIDs
+        in the selected folder and returns @see cl LazyEmailMessage.
+        The parameters are the same as @see me _enumerate_uids.
+        """
+        folder, uidvalidity = self._selected
+        item = "BODYSTRUCTURE " + self._header_item(fields)
+        for batch in split_batches(uids, batch_size):
+            contents = self._fetch_uids(batch, item)
+            for uid in batch:
+                if uid not in contents:
+                    continue
+                values = contents.pop(uid)
+                mail = LazyEmailMessage.create_from_structure(
+                    self._fetched_content(values, "BODY["), values["BODYSTRUCTURE"],
+                    self._part_loader(folder, uidvalidity, uid))
+                if skip_function is not None and skip_function(mail):
+                    continue
+                yield uid, mail
+
+    def _part_loader(self, folder, uidvalidity, uid):
+        "returns a function retrieving a section of a mail"
+        def loader(section):
+            "retrieves a section"
+            return self._fetch_section(folder, uidvalidity, uid, section)
+        return loader
+
+    def _fetch_section(self, folder, uidvalidity, uid, section):
+        """
+        Retrieves a section of a mail (``BODY.PEEK[<section>]``),
+        the folder is selected again if it was closed.
+
+        @param      folder          folder the mail belongs to
+        @param      uidvalidity     ``UIDVALIDITY`` when the mail was found
+        @param      uid             UID of the mail
+        @param      section         section (``TEXT``, ``1``, ``2.1``, ...)
+        @return                     bytes
+        """
+        if self.M.state != "SELECTED":
+            self._select(folder)
+            if self._selected[1] != uidvalidity:
+                raise MailException(
+                    "UIDVALIDITY of folder '{0}' changed, mail {1} cannot be retrieved".format(
+                        folder, uid))
+        elif self._selected[0] != folder:
+            raise MailException(
+                "folder '{0}' is selected, mail {1} from '{2}' cannot be retrieved".format(
+                    self._selected[0], uid, folder))
+        values = self._fetch_uids([uid], "BODY.PEEK[{0}]".format(section))
+        if uid not in values:
+            raise MailException(
+                "mail {0} was removed from folder '{1}'".format(uid, folder))
+        return self._fetched_content(values[uid], "BODY[")
 
     def enumerate_search_person(self, person, folder, skip_function=None,
-                                date=None, max_dest=5, body=True):
+                                date=None, max_dest=5, body=True, batch_size=1):
         """
         Enumerates all mails in folder folder from a user
         or sent to a user.
@@ -209,45 +1438,76 @@ class MailBoxImap:
         @param      person          person to look for or persons to look for
         @param      folder          folder name
         @param      skip_function   if not None, use this function on the header/body to avoid loading the entire message (and skip it)
-        @param      pattern         search pattern (see below)
+        @param      date            add a date to the pattern
         @param      max_dest        maximum number of receivers
+                                    (only for mails the person did not send)
         @param      body            get the body
+        @param      batch_size      number of mails retrieved with a single command
         @return                     iterator on (message)
 
         If *person* is a list, the function iterates on the list of
         persons to look for. It returns only unique mails.
+
+        The function runs a single search for all persons
+        (``OR FROM "p" TO "p"``, combined with ``OR`` for many persons),
+        every mail is retrieved once. The receivers are checked on
+        the header before the rest of the mail is retrieved.
         """
-        if isinstance(person, list):
-            unique_id = set()
-            for p in person:
-                mail_set = self.enumerate_search_person(p, folder=folder,
-                                                        skip_function=skip_function, date=date,
-                                                        max_dest=max_dest, body=body)
-                for mail in mail_set:
-                    uid = mail.UniqueID
-                    if uid not in unique_id:
-                        unique_id.add(uid)
-                        yield mail
-        else:
-            pat1 = 'FROM "{0}"'.format(person)
-            if date is not None:
-                pat1 += ' SINCE {0}'.format(date)
-            for mail in self.enumerate_mails_in_folder(folder, skip_function=skip_function,
-                                                       pattern=pat1, body=body):
-                yield mail
-            pat2 = 'TO "{0}"'.format(person)
-            if date is not None:
-                pat2 += ' SINCE {0}'.format(date)
-            for mail in self.enumerate_mails_in_folder(
-                    folder, skip_function=skip_function, pattern=pat2):
-                if max_dest > 0:
-                    tos = mail.get_to()
-                    if tos:
-                        ll = len(tos)
-                        if ll <= max_dest:
-                            yield mail
-                else:
+        if isinstance(folder, list):
+            for fold in folder:
+                for mail in self.enumerate_search_person(
+                        person, fold, skip_function=skip_function, date=date,
+                        max_dest=max_dest, body=body, batch_size=batch_size):
                     yield mail
+            return
+
+        persons = person if isinstance(person, list) else [person]
+        pattern = MailBoxImap._or_tree(
+            ['OR FROM "{0}" TO "{0}"'.format(p) for p in persons])
+        if date is not None:
+            pattern += ' SINCE {0}'.format(date)
+        lower = [p.lower() for p in persons]
+
+        def skip(mail):
+            "filters on the sender, the receivers and skip_function"
+            sender = mail.get_field("from") or ""
+            if not any(p in sender.lower() for p in lower) and max_dest > 0:
+                tos = mail.get_to()
+                if not tos or len(tos) > max_dest:
+                    return True
+            return skip_function is not None and skip_function(mail)
+
+        # the header is fully retrieved if it is returned or given
+        # to a function which may need any field
+        fields = (None if skip_function is not None or not body
+                  else ["From", "To", "Delivered-To"])
+
+        self._select(folder)
+        for uids in self._iter_search_uids(folder, pattern):
+            self.fLOG("MailBoxImap.enumerate_search_person [folder={0} nbm={1} body={2} pattern={3}]".format(
+                folder, len(uids), body, pattern))
+            for _, mail in self._enumerate_uids(uids, skip_function=skip,
+                                                body=body, batch_size=batch_size,
+                                                fields=fields):
+                yield mail
+        self.M.close()
+
+    @staticmethod
+    def _or_tree(criteria):
+        """
+        Combines search criteria with ``OR`` into a balanced tree,
+        ``OR`` only accepts two criteria.
+
+        @param      criteria        list of criteria
+        @return                     string
+        """
+        if len(criteria) == 0:
+            raise ValueError("criteria cannot be empty")
+        if len(criteria) == 1:
+            return criteria[0]
+        middle = len(criteria) // 2
+        return "OR {0} {1}".format(MailBoxImap._or_tree(criteria[:middle]),
+                                   MailBoxImap._or_tree(criteria[middle:]))
 
     def enumerate_search_subject(self,
                                  subject,
@@ -4,8 +4,13 @@
 """
 
 import poplib
+import email
 
 from pyquickhelper.loghelper import noLOG
+from .mail_exception import MailException
+from .email_message import EmailMessage
+from .imap_sync_state import ImapSyncState
+from .imap_helper import split_batches
 
 
 def retrieve_mails_pop(user, password, server, begin=0, end=-1, fLOG=noLOG):
@@ -19,6 +24,9 @@ def retrieve_mails_pop(user, password, server, begin=0, end=-1, fLOG=noLOG):
     @param      end         last email to retrieve
     @param      fLOG        logging function
     @return                 list of emails
+
+    The function keeps every mail in memory,
+    @see fn enumerate_mails_pop returns them one by one.
     """
     M = poplib.POP3(server)
     M.user(user)
@@ -37,3 +45,200 @@ def retrieve_mails_pop(user, password, server, begin=0, end=-1, fLOG=noLOG):
         fLOG(
             "retrieve_mails_pop [mail {0}/{1}, size={2}]".format(i, end, size))
     return allemails
+
+
+def connect_pop(user, password, server, ssl=False, port=None, fLOG=noLOG):
+    """
+    Connects to a :epkg:`POP3` server and logs in.
+
+    @param      user        user
+    @param      password    password
+    @param      server      something like ``pop.domain.ext``
+    @param      ssl         use ``POP3_SSL``
+    @param      port        port, the default one if None (110 or 995 with SSL)
+    @param      fLOG        logging function
+    @return                 ``poplib.POP3`` or ``poplib.POP3_SSL``
+    """
+    try:
+        if ssl:
+            M = poplib.POP3_SSL(server, port or poplib.POP3_SSL_PORT)
+        else:
+            M = poplib.POP3(server, port or poplib.POP3_PORT)
+        M.user(user)
+        M.pass_(password)
+    except poplib.error_proto as e:
+        raise MailException(
+            "unable to connect to '{0}' as '{1}'".format(server, user)) from e
+    fLOG("[connect_pop] connected to '{0}' as '{1}'".format(server, user))
+    return M
+
+
+def _uidl(M):
+    "returns the list of ``(number, uidl)``"
+    try:
+        lines = M.uidl()[1]
+    except poplib.error_proto as e:
+        raise MailException("the server does not support UIDL") from e
+    res = []
+    for line in lines:
+        number, uidl = line.decode("ascii", errors="replace").split(" ", 1)
+        res.append((int(number), uidl.strip()))
+    return res
+
+
+def _capabilities(M):
+    "returns the capabilities of the server, an empty dictionary if CAPA is not supported"
+    try:
+        return M.capa()
+    except poplib.error_proto:
+        return {}
+
+
+def _send_commands(M, commands, pipelining):
+    """
+    Sends commands expecting a multi-line response and returns the lines
+    of every response. Commands are sent together if *pipelining* is True
+    (`RFC 2449 <https://tools.ietf.org/html/rfc2449>`_),
+    the function then reads every response.
+    """
+    if not pipelining or len(commands) == 1:
+        try:
+            return [M._longcmd(c)[1] for c in commands]
+        except poplib.error_proto as e:
+            raise MailException(
+                "command failed: {0}".format(e)) from e
+    M.sock.sendall(b"".join(c.encode("ascii") + b"\r\n" for c in commands))
+    res = []
+    errors = []
+    for c in commands:
+        # every response must be read even if one fails
+        try:
+            res.append(M._getlongresp()[1])
+        except poplib.error_proto as e:
+            errors.append("{0}: {1}".format(c, e))
+            res.append(None)
+    if errors:
+        raise MailException("commands failed: {0}".format(", ".join(errors)))
+    return res
+
+
+def enumerate_mails_pop(user, password, server, ssl=False, port=None, state=None,
+                        begin=0, end=-1, body=True, skip_function=None, batch_size=1,
+                        fLOG=noLOG):
+    """
+    Enumerates the mails of a :epkg:`POP3` mailbox, they are
+    retrieved one by one and only one of them is held in memory
+    (*batch_size* if commands are pipelined).
+
+    @param      user            user
+    @param      password        password
+    @param      server          something like ``pop.domain.ext``
+    @param      ssl             use ``POP3_SSL``
+    @param      port            port, the default one if None (110 or 995 with SSL)
+    @param      state           None to retrieve every mail, or an instance of
+                                @see cl ImapSyncState or a filename to store it,
+                                only mails not seen by a previous call are retrieved
+    @param      begin           first email to retrieve
+    @param      end             last email to retrieve (excluded), -1 for all
+    @param      body            retrieve the body, if False, the function only
+                                retrieves the header (``TOP n 0``)
+    @param      skip_function   if not None, use this function on the header to skip mails,
+                                the body is only retrieved for the mails it keeps
+    @param      batch_size      number of commands sent together if the server
+                                supports ``PIPELINING``
+    @param      fLOG            logging function
+    @return                     iterator on @see cl EmailMessage
+
+    The state stores the unique identifiers (``UIDL``) of the mails
+    already returned, identifiers of mails removed from the server
+    are forgotten. A mail is considered as processed once the caller
+    asks for the next one (or when *skip_function* skips it),
+    the state is saved when the iterator ends, even if the caller stops before.
+    Mails are entirely retrieved if the server does not support ``TOP``.
+
+    .. exref::
+        :title: Retrieve new mails from a POP account
+
+        ::
+
+            for mail in enumerate_mails_pop(user, pwd, "pop.domain.ext", ssl=True,
+                                            state="pop_state.json"):
+                # ...
+
+    .. exref::
+        :title: Triage a POP account with headers only
+
+        ::
+
+            for mail in enumerate_mails_pop(user, pwd, "pop.domain.ext", ssl=True,
+                                            body=False, batch_size=100):
+                print(mail["From"], mail["Subject"])
+    """
+    if state is not None and not isinstance(state, ImapSyncState):
+        state = ImapSyncState(state)
+    M = connect_pop(user, password, server, ssl=ssl, port=port, fLOG=fLOG)
+    try:
+        capabilities = _capabilities(M)
+        pipelining = "PIPELINING" in capabilities and batch_size > 1
+        # CAPA is optional, TOP is then assumed to be supported
+        use_top = "TOP" in capabilities or not capabilities
+        if state is None:
+            numbers = [(i + 1, None) for i in range(len(M.list()[1]))]
+            seen = set()
+        else:
+            key = ImapSyncState.make_key(user, server, "INBOX")
+            numbers = _uidl(M)
+            check = state.get(key) or {}
+            current = set(uidl for _, uidl in numbers)
+            seen = set(check.get("uidls", [])) & current
+        end = len(numbers) if end == -1 else end
+        numbers = [n for n in numbers[begin:end] if n[1] not in seen]
+        fLOG("[enumerate_mails_pop] {0} mails to retrieve, pipelining={1}".format(
+            len(numbers), pipelining))
+        try:
+            for batch in split_batches(numbers, batch_size if pipelining else 1):
+                if use_top and (not body or skip_function is not None):
+                    headers = _send_commands(
+                        M, ["TOP {0} 0".format(n) for n, _ in batch], pipelining)
+                    kept = []
+                    for (number, uidl), lines in zip(batch, headers):
+                        mail = email.message_from_bytes(b"\r\n".join(lines),
+                                                        _class=EmailMessage)
+                        if skip_function is not None and skip_function(mail):
+                            if uidl is not None:
+                                seen.add(uidl)
+                            continue
+                        kept.append((number, uidl, mail))
+                else:
+                    kept = [(number, uidl, None) for number, uidl in batch]
+
+                if body or not use_top:
+                    contents = _send_commands(
+                        M, ["RETR {0}".format(k[0]) for k in kept], pipelining) \
+                        if kept else []
+                    mails = []
+                    for (number, uidl, _), lines in zip(kept, contents):
+                        mail = email.message_from_bytes(b"\r\n".join(lines),
+                                                        _class=EmailMessage)
+                        if not use_top and skip_function is not None and \
+                                skip_function(mail):
+                            if uidl is not None:
+                                seen.add(uidl)
+                            continue
+                        mails.append((uidl, mail))
+                else:
+                    mails = [(uidl, mail) for _, uidl, mail in kept]
+
+                for uidl, mail in mails:
+                    yield mail
+                    if uidl is not None:
+                        seen.add(uidl)
+        finally:
+            if state is not None:
+                state.update(key, uidls=list(sorted(seen)))
+                state.save()
+    finally:
+        try:
+            M.quit()
+        except (poplib.error_proto, OSError):
+            pass
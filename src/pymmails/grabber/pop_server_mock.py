@@ -0,0 +1,304 @@
+"""
+@file
+@brief Defines a local :epkg:`POP3` server holding mails in memory,
+it is used to test the functions of module
+:mod:`pop_helper <pymmails.grabber.pop_helper>` without any remote server.
+"""
+
+import socketserver
+import threading
+from pyquickhelper.loghelper import noLOG
+
+
+def _lines(raw):
+    "splits a mail into lines"
+    if raw.endswith(b"\r\n"):
+        raw = raw[:-2]
+    return raw.split(b"\r\n") if raw else []
+
+
+class PopServerMock:
+    """
+    Implements a small :epkg:`POP3` server holding mails in memory.
+
+    .. exref::
+        :title: Test a POP client with a local server
+
+        ::
+
+            mails = [b"From: a@b.c\\r\\nSubject: test\\r\\n\\r\\nbody"]
+            with PopServerMock(mails, user="user", password="pwd") as server:
+                for mail in enumerate_mails_pop("user", "pwd", server.host,
+                                                port=server.port):
+                    print(mail["Subject"])
+    """
+
+    #: capabilities announced by the server,
+    #: the server always accepts pipelined commands (``PIPELINING``)
+    default_capabilities = ("USER", "UIDL", "TOP")
+
+    def __init__(self, mails=None, user=None, password=None,
+                 host="127.0.0.1", port=0, capabilities=None, fLOG=noLOG):
+        """
+        @param      mails           list of mails (bytes or strings)
+        @param      user            expected user (None to accept any)
+        @param      password        expected password (None to accept any)
+        @param      host            host to listen to
+        @param      port            port (0 to let the system choose one)
+        @param      capabilities    capabilities, @see me default_capabilities if None
+        @param      fLOG            logging function
+        """
+        self.user = user
+        self.password = password
+        self.capabilities = list(capabilities or self.default_capabilities)
+        self.fLOG = fLOG
+        self.lock = threading.RLock()
+        self.mails = []
+        self.commands = []
+        # number of commands received before the server answered the previous one
+        self.pipelined = 0
+        self._uidl = 0
+        for mail in mails or []:
+            self.append(mail)
+        self._server = None
+        self._thread = None
+        self._address = (host, port)
+
+    def append(self, raw):
+        """
+        Adds a mail.
+
+        @param      raw     mail (bytes or string)
+        @return             unique identifier (``UIDL``)
+        """
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        raw = raw.replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+        with self.lock:
+            self._uidl += 1
+            uidl = "uidl{0:06d}".format(self._uidl)
+            self.mails.append((uidl, raw))
+            return uidl
+
+    def remove(self, uidl):
+        """
+        Removes a mail.
+
+        @param      uidl    unique identifier (``UIDL``)
+        """
+        with self.lock:
+            self.mails = [m for m in self.mails if m[0] != uidl]
+
+    @property
+    def host(self):
+        "returns the host"
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        "returns the port"
+        return self._server.server_address[1]
+
+    def start(self):
+        """
+        Starts the server in a thread.
+        """
+        if self._server is not None:
+            raise RuntimeError("server is already running")
+        mock = self
+
+        class Handler(PopServerMockHandler):
+            "handler bound to this server"
+            server_mock = mock
+
+        self._server = socketserver.ThreadingTCPServer(
+            self._address, Handler, bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.allow_reuse_address = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        args=(0.05,),
+                                        daemon=True)
+        self._thread.start()
+        self.fLOG("[PopServerMock.start] listening on {0}:{1}".format(
+            self.host, self.port))
+        return self
+
+    def stop(self):
+        """
+        Stops the server.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class PopServerMockHandler(socketserver.StreamRequestHandler):
+    """
+    Handles a connection to @see cl PopServerMock.
+    """
+
+    #: server the handler is bound to
+    server_mock = None
+    disable_nagle_algorithm = True
+    # state of the session
+    user = None
+    authenticated = False
+    closed = False
+    # mails when the session started
+    mails = None
+
+    def send_line(self, line):
+        "sends a line"
+        if isinstance(line, str):
+            line = line.encode("utf-8")
+        self.wfile.write(line + b"\r\n")
+
+    def send_multiline(self, first, lines):
+        "sends a multi-line response, lines starting with a dot are stuffed"
+        data = [first.encode("utf-8")]
+        for line in lines:
+            data.append(b"." + line if line.startswith(b".") else line)
+        data.append(b".")
+        self.wfile.write(b"\r\n".join(data) + b"\r\n")
+
+    def handle(self):
+        try:
+            self._handle()
+        except OSError:
+            # the connection was closed
+            pass
+
+    def _pending(self):
+        "tells if the client sent more data without waiting for the response"
+        self.connection.setblocking(False)
+        try:
+            return len(self.rfile.peek(1)) > 0
+        except BlockingIOError:
+            return False
+        finally:
+            self.connection.setblocking(True)
+
+    def _handle(self):
+        self.send_line("+OK PopServerMock ready")
+        mock = self.server_mock
+        while not self.closed:
+            line = self.rfile.readline()
+            if not line:
+                break
+            if self._pending():
+                with mock.lock:
+                    mock.pipelined += 1
+            args = line.rstrip(b"\r\n").decode("utf-8", errors="replace").split(" ")
+            command = args[0].upper()
+            with mock.lock:
+                mock.commands.append(command)
+            meth = getattr(self, "cmd_" + command.lower(), None)
+            if meth is None:
+                self.send_line("-ERR unknown command {0}".format(command))
+            elif command not in ("CAPA", "USER", "PASS", "QUIT") and \
+                    not self.authenticated:
+                self.send_line("-ERR not authenticated")
+            else:
+                try:
+                    meth(args[1:])
+                except (ValueError, IndexError) as e:
+                    self.send_line("-ERR {0}".format(e))
+            self.wfile.flush()
+
+    def _mail(self, number):
+        "returns a mail knowing its number"
+        number = int(number)
+        if number < 1 or number > len(self.mails):
+            raise ValueError("no such message")
+        return self.mails[number - 1]
+
+    # commands
+
+    def cmd_capa(self, args):
+        "CAPA"
+        self.send_multiline("+OK Capability list follows",
+                            [c.encode("ascii") for c in self.server_mock.capabilities])
+
+    def cmd_user(self, args):
+        "USER"
+        self.user = " ".join(args)
+        self.send_line("+OK")
+
+    def cmd_pass(self, args):
+        "PASS"
+        mock = self.server_mock
+        if (mock.user is not None and mock.user != self.user) or \
+                (mock.password is not None and mock.password != " ".join(args)):
+            self.send_line("-ERR invalid credentials")
+            return
+        self.authenticated = True
+        with mock.lock:
+            self.mails = list(mock.mails)
+        self.send_line("+OK logged in")
+
+    def cmd_noop(self, args):
+        "NOOP"
+        self.send_line("+OK")
+
+    def cmd_quit(self, args):
+        "QUIT"
+        self.closed = True
+        self.send_line("+OK bye")
+
+    def cmd_stat(self, args):
+        "STAT"
+        self.send_line("+OK {0} {1}".format(
+            len(self.mails), sum(len(m[1]) for m in self.mails)))
+
+    def cmd_list(self, args):
+        "LIST"
+        if args:
+            self.send_line("+OK {0} {1}".format(
+                args[0], len(self._mail(args[0])[1])))
+            return
+        self.send_multiline("+OK", ["{0} {1}".format(i + 1, len(m[1])).encode("ascii")
+                                    for i, m in enumerate(self.mails)])
+
+    def cmd_uidl(self, args):
+        "UIDL"
+        if "UIDL" not in self.server_mock.capabilities:
+            self.send_line("-ERR command not supported")
+            return
+        if args:
+            self.send_line("+OK {0} {1}".format(
+                args[0], self._mail(args[0])[0]))
+            return
+        self.send_multiline("+OK", ["{0} {1}".format(i + 1, m[0]).encode("ascii")
+                                    for i, m in enumerate(self.mails)])
+
+    def cmd_retr(self, args):
+        "RETR"
+        raw = self._mail(args[0])[1]
+        self.send_multiline("+OK {0} octets".format(len(raw)),
+                            _lines(raw))
+
+    def cmd_top(self, args):
+        "TOP"
+        if "TOP" not in self.server_mock.capabilities:
+            self.send_line("-ERR command not supported")
+            return
+        raw = self._mail(args[0])[1]
+        nb = int(args[1])
+        pos = raw.find(b"\r\n\r\n")
+        if pos == -1:
+            lines = _lines(raw)
+        else:
+            lines = raw[:pos].split(b"\r\n") + [b""] + \
+                _lines(raw[pos + 4:])[:nb]
+        self.send_multiline("+OK", lines)
@@ -99,7 +99,7 @@ class EmailMessageListRenderer(Renderer):
         self._title = title
 
     def render(self, location, iter, attachments=None,  # pylint: disable=W0237
-               file_css="mail_style.css"):
+               file_css="mail_style.css", sort=True):
         """
         Renders a mail.
 
@@ -107,6 +107,9 @@ class EmailMessageListRenderer(Renderer):
         @param      iter            iterator on tuple (object, function to call to render the object)
         @param      attachments     used to produce a JSON list
         @param      file_css        css file (where it is supposed to be stored)
+        @param      sort            sorts the mails, if False, they are rendered
+                                    in the order they come (already sorted by the
+                                    server for example)
         @return                     html, css (content), attachements as JSON
 
         The method populate fields ``now``, ``message``, ``css``, ``render``, ``location``, ``title``.
@@ -123,7 +126,7 @@ class EmailMessageListRenderer(Renderer):
 
         def iter_on_mail():
             "local function"
-            for i, mail3 in enumerate(iterator_prev_next(sorted(iter))):
+            for i, mail3 in enumerate(iterator_prev_next(sorted(iter) if sort else iter)):
                 prev, item, next = mail3
                 if i % 10 == 9:
                     self.fLOG(
@@ -158,7 +161,7 @@ class EmailMessageListRenderer(Renderer):
     def write(self, location, iter, filename, attachments=None,  # pylint: disable=W0221,W0237
               overwrite=False, file_css="mail_style.css",
               file_jsatt="_summaryattachements.json", encoding="utf8",
-              attach_folder="attachments"):
+              attach_folder="attachments", sort=True):
         """
         Writes a list of mails in a folder and writes a summary.
 
@@ -171,6 +174,11 @@ class EmailMessageListRenderer(Renderer):
                                     ``[{'a': 'href', 'name': 'anchor', ...}, ...]``
         @param      encoding        encoding
         @param      attach_folder   attachments folder
+        @param      sort            sorts the mails, False to keep the order of
+                                    the iterator, mails sorted by the server
+                                    (see *sort* in :meth:`enumerate_mails_in_folder
+                                    <pymmails.grabber.mailboximap.MailBoxImap.enumerate_mails_in_folder>`)
+                                    are rendered as soon as they are retrieved
         @return                     list of written local files
 
         The method calls method :meth:`flush
@@ -203,7 +211,7 @@ class EmailMessageListRenderer(Renderer):
                 yield obj, fwrite
 
         html, css, json_att = self.render(
-            location, walk_iter(), file_css=full_css)
+            location, walk_iter(), file_css=full_css, sort=sort)
         wrote = []
         if not self.BufferWrite.exists(full_css, local=not overwrite):
             f = self.BufferWrite.open(full_css, text=True, encoding=encoding)